@@ -0,0 +1,303 @@
+"""Async serving mode.
+
+The hot read endpoints (GET /assets, /assets/<id>, /maintenance/all, /user-services) run natively
+on an aiomysql pool; every other route is served by the Flask app mounted as WSGI, so writes,
+login and the cached listings behave exactly as in main.py. The native routes go through the same
+rate limiter, SQL metrics (Server-Timing, /metrics) and profiler as the blueprints, under the Flask
+endpoint names (assets.list_assets, ...), so limits, costs and armed profiles apply to both.
+
+    uvicorn asgi:app --workers 4
+"""
+import contextlib
+import contextvars
+import hashlib
+import time
+import aiomysql
+import jwt
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from main import app as flask_app
+from config import jwt as jwt_manager, limiter, sql_metrics, profiler
+from assets import (
+    asset_list_query, asset_row_to_dict, asset_detail_query, asset_detail_to_dict,
+    parse_asset_sort, asset_cursor_key, asset_estimate_query
+)
+from maintenance import maintenance_list_query, maintenance_row_to_dict, maintenance_cursor_key
+from services import USER_SERVICES_QUERY, user_service_row_to_dict
+from pagination import page_args, page_response, explain_estimate, STREAM_CHUNK_SIZE
+from ratelimit import REJECTED, client_address, retry_after
+from serialize import dumps
+
+pool = None
+# (endpoint, statements) of the native request being served, for the SQL metrics
+request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+class AuthError(Exception):
+    def __init__(self, status, msg):
+        self.status = status
+        self.msg = msg
+
+
+def authenticate(request):
+    # Same checks and error bodies as flask_jwt_extended's @jwt_required() for header tokens
+    header = request.headers.get('Authorization')
+    if not header:
+        raise AuthError(401, "Missing Authorization Header")
+    parts = header.split()
+    if len(parts) != 2 or parts[0] != 'Bearer':
+        raise AuthError(422, "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'")
+    # Tokens already verified by this process (here or in the mounted Flask app) skip the signature check
+    key = hashlib.sha256(parts[1].encode('utf-8')).hexdigest()
+    claims = jwt_manager.tokens.get(key)
+    if claims is None:
+        try:
+            claims = jwt.decode(
+                parts[1],
+                flask_app.config['JWT_SECRET_KEY'],
+                algorithms=[flask_app.config.get('JWT_ALGORITHM', 'HS256')],
+                leeway=flask_app.config.get('JWT_DECODE_LEEWAY', 0)
+            )
+        except jwt.ExpiredSignatureError:
+            raise AuthError(401, "Token has expired")
+        except jwt.InvalidTokenError as e:
+            raise AuthError(422, str(e))
+        if 'exp' in claims and jwt_manager.tokens.max_entries:
+            jwt_manager.tokens.put(key, claims)
+    if claims.get('type') != 'access':
+        raise AuthError(422, "Only non-refresh tokens are allowed")
+    if jwt_manager.is_revoked(None, claims):
+        raise AuthError(401, "Token has been revoked")
+    return claims
+
+
+def cors_headers(request):
+    # main.py enables CORS for any origin with credentials, which echoes the caller's Origin
+    origin = request.headers.get('Origin')
+    if not origin:
+        return {}
+    return {
+        'Access-Control-Allow-Origin': origin,
+        'Access-Control-Allow-Credentials': 'true',
+        'Vary': 'Origin'
+    }
+
+
+def json_response(request, body, status=200):
+    return Response(dumps(body), status_code=status, media_type='application/json', headers=cors_headers(request))
+
+
+async def rate_limited(request, claims, endpoint):
+    # Seconds to wait, 0 to go ahead; keyed like RateLimiter.identify, so a caller shares one
+    # bucket between the native routes and the mounted Flask app
+    if not limiter.enabled:
+        return 0
+    if claims is None:
+        # Resolved like ProxyFix resolves request.remote_addr for the mounted Flask app
+        address = client_address(
+            request.client.host if request.client else '', request.headers.get('x-forwarded-for'),
+            limiter.trusted_proxies
+        )
+        key, role = f"ip:{address}", 'anonymous'
+    else:
+        key, role = f"user:{claims['sub']}", claims.get('role', 'user')
+    if limiter.shared:
+        # A Redis round trip; keep it off the event loop
+        return await run_in_threadpool(limiter.take, key, role, endpoint)
+    return limiter.take(key, role, endpoint)
+
+
+def native(endpoint):
+    # Authenticates, rate-limits, profiles and collects SQL metrics for a native route, as the
+    # blueprint hooks do for the Flask endpoint of the same name
+    def decorate(handler):
+        async def wrapper(request):
+            try:
+                claims, error = authenticate(request), None
+            except AuthError as e:
+                claims, error = None, e
+            wait = await rate_limited(request, claims, endpoint)
+            if wait > 0:
+                response = json_response(request, REJECTED, 429)
+                response.headers['Retry-After'] = retry_after(wait)
+                return response
+            if error is not None:
+                return json_response(request, {"msg": error.msg}, error.status)
+
+            queries = []
+            token = request_queries.set((endpoint, queries))
+            sampler = profiler.enter_async(endpoint, handler, claims, request.headers)
+            try:
+                response = await handler(request, claims)
+            finally:
+                request_queries.reset(token)
+                capture = profiler.save_capture(endpoint, sampler) if sampler is not None else None
+            if capture:
+                response.headers['X-Profile-Capture'] = capture
+            # A streamed body runs its query after this returns; stream_response records it
+            if not isinstance(response, StreamingResponse):
+                timing = sql_metrics.observe_request(endpoint, queries)
+                if timing:
+                    response.headers['Server-Timing'] = timing
+            return response
+
+        profiler.watch_async(handler, endpoint)
+        return wrapper
+    return decorate
+
+
+def record_query(query, started, rowcount):
+    current = request_queries.get()
+    if current is not None:
+        endpoint, queries = current
+        queries.append(sql_metrics.observe_query(endpoint, query, time.perf_counter() - started, rowcount))
+
+
+async def fetch(query, params, one=False):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            started = time.perf_counter()
+            await cursor.execute(query, params)
+            record_query(query, started, cursor.rowcount)
+            return await (cursor.fetchone() if one else cursor.fetchall())
+
+
+async def estimate(query, params):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            started = time.perf_counter()
+            await cursor.execute(query, params)
+            record_query(query, started, cursor.rowcount)
+            return explain_estimate(cursor.description, await cursor.fetchall())
+
+
+def stream_response(request, query, params, serialize, fmt):
+    endpoint, queries = request_queries.get() or ('none', [])
+
+    async def generate():
+        async with pool.acquire() as conn:
+            async with conn.cursor(aiomysql.SSCursor) as cursor:
+                started = time.perf_counter()
+                await cursor.execute(query, params)
+                duration = time.perf_counter() - started
+                sent = 0
+                first = True
+                if fmt == 'json':
+                    yield b'['
+                while True:
+                    rows = await cursor.fetchmany(STREAM_CHUNK_SIZE)
+                    if not rows:
+                        break
+                    sent += len(rows)
+                    if fmt == 'ndjson':
+                        yield b''.join(dumps(serialize(r)) + b'\n' for r in rows)
+                    else:
+                        chunk = b','.join(dumps(serialize(r)) for r in rows)
+                        yield chunk if first else b',' + chunk
+                    first = False
+                if fmt == 'json':
+                    yield b']'
+        queries.append(sql_metrics.observe_query(endpoint, query, duration, sent))
+        sql_metrics.observe_request(endpoint, queries)
+
+    media_type = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return StreamingResponse(generate(), media_type=media_type, headers=cors_headers(request))
+
+
+@native('assets.list_assets')
+async def list_assets(request, claims):
+    role, user_id, args = claims.get('role', 'user'), claims['sub'], request.query_params
+    try:
+        sort_key, _ = parse_asset_sort(args)
+        limit, after, stream = page_args(cursor_size=1 if sort_key == 'id' else 2, args=args)
+        query, params = asset_list_query(role, user_id, args, limit, after, stream)
+    except ValueError as e:
+        return json_response(request, {"error": str(e)}, 400)
+
+    if stream:
+        return stream_response(request, query, params, asset_row_to_dict, stream)
+
+    assets = await fetch(query, params)
+    if limit is None:
+        return json_response(request, [asset_row_to_dict(a) for a in assets])
+
+    page = page_response(assets, limit, asset_row_to_dict, asset_cursor_key(sort_key))
+    if after is None:
+        page["total_estimate"] = await estimate(*asset_estimate_query(role, user_id, args))
+    return json_response(request, page)
+
+
+@native('assets.get_asset')
+async def get_asset(request, claims):
+    query, params = asset_detail_query(claims.get('role', 'user'), claims['sub'], request.path_params['asset_id'])
+    asset = await fetch(query, params, one=True)
+    if not asset:
+        return json_response(request, {"error": "Asset not found"}, 404)
+    response = json_response(request, asset_detail_to_dict(asset))
+    response.headers['ETag'] = f'"{asset[8]}"'
+    return response
+
+
+@native('maintenance.get_all_maintenance')
+async def get_all_maintenance(request, claims):
+    try:
+        limit, after, stream = page_args(cursor_size=2, args=request.query_params)
+    except ValueError as e:
+        return json_response(request, {"error": str(e)}, 400)
+
+    query, params = maintenance_list_query(claims.get('role', 'user'), claims['sub'], limit, after, stream)
+    if stream:
+        return stream_response(request, query, params, maintenance_row_to_dict, stream)
+
+    records = await fetch(query, params)
+    if limit is None:
+        return json_response(request, [maintenance_row_to_dict(r) for r in records])
+    return json_response(request, page_response(records, limit, maintenance_row_to_dict, maintenance_cursor_key))
+
+
+@native('services.get_user_requested_services')
+async def get_user_requested_services(request, claims):
+    records = await fetch(USER_SERVICES_QUERY, (claims['sub'],))
+    return json_response(request, [user_service_row_to_dict(r) for r in records])
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    global pool
+    config = flask_app.config
+    pool = await aiomysql.create_pool(
+        host=config['MYSQL_HOST'],
+        port=config['MYSQL_PORT'],
+        user=config['MYSQL_USER'],
+        password=config['MYSQL_PASSWORD'] or '',
+        db=config['MYSQL_DB'],
+        charset=config['MYSQL_CHARSET'],
+        minsize=1,
+        maxsize=config['MYSQL_POOL_SIZE'] + config['MYSQL_POOL_MAX_OVERFLOW'],
+        pool_recycle=config['MYSQL_POOL_RECYCLE'],
+        autocommit=True
+    )
+    try:
+        yield
+    finally:
+        pool.close()
+        await pool.wait_closed()
+
+
+app = Starlette(
+    routes=[
+        Route('/assets', list_assets, methods=['GET']),
+        Route('/assets/{asset_id:int}', get_asset, methods=['GET']),
+        Route('/maintenance/all', get_all_maintenance, methods=['GET']),
+        Route('/user-services', get_user_requested_services, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app))
+    ],
+    lifespan=lifespan
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('asgi:app', host='127.0.0.1', port=8000)
@@ -1,104 +1,442 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
-from config import mysql
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required
+import datetime
+import re
+import time
+import MySQLdb
+import MySQLdb.cursors
+from config import mysql, cache
+from auth import current_principal
+from cache import USERS_DIRECTORY_KEY
+from pagination import page_args, page_response, stream_rows, explain_estimate
+from bulk import bulk_format, iter_bulk_rows, chunked
+from batch import batch_ids, fetch_by_ids, batch_response
+from serialize import row_mapper
+from patch import patch_changes, precondition_failed, changed_columns, set_clause, conflict_status, with_etag
+import expiring_assets
+import maintenance_summary
+import changes
+import jobs
 
 assets_bp = Blueprint('assets', __name__)
 
+ASSET_LIST_COLUMNS = "id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status"
+# Sortable columns and their position in an ASSET_LIST_COLUMNS row
+ASSET_SORT_KEYS = {'id': 0, 'asset_name': 1, 'asset_type': 2, 'purchase_date': 4, 'warranty_expiry': 5, 'status': 6}
+ASSET_DATE_FILTERS = {
+    'warranty_from': "warranty_expiry >= %s",
+    'warranty_to': "warranty_expiry <= %s",
+    'purchased_from': "purchase_date >= %s",
+    'purchased_to': "purchase_date <= %s"
+}
+# PATCH body keys and the columns they write; the order matches asset_detail_query columns 1-7
+ASSET_PATCH_FIELDS = {
+    'asset_name': 'asset_name', 'asset_type': 'asset_type', 'serial_number': 'serial_number',
+    'purchase_date': 'purchase_date', 'warranty_expiry': 'warranty_expiry', 'status': 'status',
+    'user_id': 'assigned_to'
+}
+ASSET_REQUIRED_FIELDS = ['asset_name', 'asset_type', 'serial_number', 'purchase_date', 'warranty_expiry', 'user_id']
+ASSET_INSERT = (
+    "INSERT INTO assets (asset_name, asset_type, serial_number, purchase_date, warranty_expiry, assigned_to) "
+    "VALUES (%s, %s, %s, %s, %s, %s)"
+)
+# Inserts nothing when the assignee does not exist
+ASSET_INSERT_FOR_USER = (
+    "INSERT INTO assets (asset_name, asset_type, serial_number, purchase_date, warranty_expiry, assigned_to) "
+    "SELECT %s, %s, %s, %s, %s, id FROM users WHERE id=%s AND deleted_at IS NULL"
+)
+ASSET_UPDATE = (
+    "UPDATE assets SET asset_name=%s, asset_type=%s, serial_number=%s, "
+    "purchase_date=%s, warranty_expiry=%s, status=%s, assigned_to=%s, version=version+1 "
+    "WHERE id=%s AND deleted_at IS NULL"
+)
+ASSET_SOFT_DELETE = "UPDATE assets SET deleted_at=NOW(), version=version+1 WHERE id=%s AND deleted_at IS NULL"
+
+
+asset_row_to_dict = row_mapper(ASSET_LIST_COLUMNS.split(', '))
+
 @assets_bp.route('/assets', methods=['POST'])
 @jwt_required()
 def create_asset():
-    claims = get_jwt()
-    if claims.get('role') != 'company':
+    if not current_principal().is_company:
         return jsonify({"error": "Only company can create assets"}), 403
 
     data = request.json
-    required = ['asset_name', 'asset_type', 'serial_number', 'purchase_date', 'warranty_expiry', 'user_id']
-    if not all(data.get(k) for k in required):
+    if not all(data.get(k) for k in ASSET_REQUIRED_FIELDS):
         return jsonify({"error": "All fields are required"}), 400
 
+    # Insert only if the assignee exists, in one statement
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id FROM users WHERE id=%s", (data['user_id'],))
-    result = cursor.fetchone()
-    if not result:
-        cursor.close()
-        return jsonify({"error": "User not found"}), 404
-
     cursor.execute(
-        "INSERT INTO assets (asset_name, asset_type, serial_number, purchase_date, warranty_expiry, assigned_to) "
-        "VALUES (%s, %s, %s, %s, %s, %s)",
+        ASSET_INSERT_FOR_USER,
         (data['asset_name'], data['asset_type'], data['serial_number'],
          data['purchase_date'], data['warranty_expiry'], data['user_id'])
     )
+    if cursor.rowcount == 0:
+        cursor.close()
+        return jsonify({"error": "User not found"}), 404
+    asset_id = cursor.lastrowid
+    expiring_assets.add_asset(cursor, asset_id, current_app.config['EXPIRY_DIGEST_WINDOW_DAYS'])
+    changes.record_asset(cursor, asset_id, 'create')
     mysql.connection.commit()
     cursor.close()
     return jsonify({"message": "Asset created successfully"}), 201
 
-@assets_bp.route('/assets', methods=['GET'])
+@assets_bp.route('/assets/bulk', methods=['POST'])
 @jwt_required()
-def list_assets():
-    current_user = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role', 'user')
+def bulk_create_assets():
+    if not current_principal().is_company:
+        return jsonify({"error": "Only company can create assets"}), 403
+
+    fmt = bulk_format()
+    if fmt is None:
+        return jsonify({"error": "Content-Type must be application/json, text/csv or application/x-ndjson"}), 415
 
-    sel_user = request.args.get('user_id')
+    chunk_size = current_app.config['ASSET_BULK_CHUNK_SIZE']
+    started = time.monotonic()
+    results = []
     cursor = mysql.connection.cursor()
+    try:
+        for chunk in chunked(enumerate(iter_bulk_rows(fmt)), chunk_size):
+            results.extend(_insert_asset_chunk(cursor, chunk))
+    except ValueError as e:
+        # Raised while reading the body, between chunks; the chunks before it stay committed
+        mysql.connection.rollback()
+        cursor.close()
+        results.sort(key=lambda r: r['index'])
+        return jsonify({"error": str(e), "results": results}), 400
+    cursor.close()
+
+    results.sort(key=lambda r: r['index'])
+    created = sum(1 for r in results if r['status'] == 'created')
+    elapsed = time.monotonic() - started
+    return jsonify({
+        "created": created,
+        "failed": len(results) - created,
+        "rows_per_second": round(len(results) / elapsed, 1) if elapsed > 0 else None,
+        "results": results
+    }), 201 if created == len(results) else 207
+
+def _record_created_assets(cursor, asset_ids):
+    expiring_assets.add_assets(cursor, asset_ids, current_app.config['EXPIRY_DIGEST_WINDOW_DAYS'])
+    changes.record_assets(cursor, asset_ids, 'create')
+
+def _inserted_asset_ids(cursor, first_id, count):
+    # Ids of the rows the last multi-row INSERT wrote, which InnoDB need not allocate consecutively.
+    # This consistent read uses the snapshot the chunk's user lookup took before the INSERT, so it
+    # sees this transaction's rows and only rows committed earlier, which all have lower ids. Under
+    # a weaker isolation level it may see other sessions' rows too; then the count is off and the
+    # caller falls back to row-by-row inserts.
+    cursor.execute("SELECT id FROM assets WHERE id >= %s ORDER BY id", (first_id,))
+    ids = [r[0] for r in cursor.fetchall()]
+    return ids if len(ids) == count else None
+
+def _insert_asset_chunk(cursor, chunk):
+    # One user lookup and one executemany per chunk, committed as a single transaction together
+    # with the chunk's change_log and expiring_assets rows
+    results = []
+    pending = []
+    for index, (row, error) in chunk:
+        user_id = None
+        if error is None:
+            if not all(row.get(k) for k in ASSET_REQUIRED_FIELDS):
+                error = "All fields are required"
+            else:
+                try:
+                    user_id = int(row['user_id'])
+                except (TypeError, ValueError):
+                    error = "Invalid user_id"
+        if error:
+            results.append({"index": index, "status": "error", "error": error})
+        else:
+            pending.append((index, row, user_id))
+
+    if not pending:
+        return results
+
+    user_ids = sorted({p[2] for p in pending})
+    cursor.execute(
+        "SELECT id FROM users WHERE deleted_at IS NULL AND id IN (" + ", ".join(["%s"] * len(user_ids)) + ")",
+        tuple(user_ids)
+    )
+    known = {r[0] for r in cursor.fetchall()}
+
+    rows = []
+    for index, row, user_id in pending:
+        if user_id not in known:
+            results.append({"index": index, "status": "error", "error": "User not found"})
+            continue
+        rows.append((index, (row['asset_name'], row['asset_type'], row['serial_number'],
+                             row['purchase_date'], row['warranty_expiry'], user_id)))
+
+    if not rows:
+        return results
+
+    try:
+        cursor.executemany(ASSET_INSERT, [values for _, values in rows])
+        ids = _inserted_asset_ids(cursor, cursor.lastrowid, len(rows))
+        if ids is not None:
+            _record_created_assets(cursor, ids)
+            mysql.connection.commit()
+            results.extend({"index": index, "status": "created"} for index, _ in rows)
+            return results
+    except MySQLdb.Error:
+        pass
+    mysql.connection.rollback()
+
+    # The batch failed as a whole, or its ids could not be read back; retry row by row so only
+    # the offending rows are rejected
+    ids = []
+    for index, values in rows:
+        try:
+            cursor.execute(ASSET_INSERT, values)
+            ids.append(cursor.lastrowid)
+            results.append({"index": index, "status": "created"})
+        except MySQLdb.Error as e:
+            results.append({"index": index, "status": "error", "error": str(e)})
+    if ids:
+        _record_created_assets(cursor, ids)
+    mysql.connection.commit()
+    return results
+
+def parse_asset_sort(args):
+    sort = args.get('sort') or 'id'
+    key = sort[1:] if sort.startswith('-') else sort
+    if key not in ASSET_SORT_KEYS:
+        raise ValueError("sort must be one of: " + ", ".join(sorted(ASSET_SORT_KEYS)) + " (prefix - for descending)")
+    return key, sort.startswith('-')
+
+def fulltext_terms(q):
+    # Every word is required and matched as a prefix; InnoDB does not index words shorter than 3 chars
+    return ' '.join('+' + w + '*' for w in re.findall(r'\w+', q) if len(w) >= 3)
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def asset_filters(role, current_user, args):
+    where, params = ["deleted_at IS NULL"], []
     if role == 'user':
-        cursor.execute(
-            "SELECT id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status "
-            "FROM assets WHERE assigned_to=%s", (current_user,)
-        )
-    else:
-        if sel_user:
-            cursor.execute(
-                "SELECT id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status "
-                "FROM assets WHERE assigned_to=%s", (sel_user,)
-            )
+        where.append("assigned_to=%s")
+        params.append(current_user)
+    elif args.get('user_id'):
+        where.append("assigned_to=%s")
+        params.append(args.get('user_id'))
+
+    for field in ('asset_type', 'status'):
+        if args.get(field):
+            where.append(field + "=%s")
+            params.append(args.get(field))
+
+    for name, clause in ASSET_DATE_FILTERS.items():
+        value = args.get(name)
+        if value:
+            try:
+                datetime.date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"{name} must be a date (YYYY-MM-DD)")
+            where.append(clause)
+            params.append(value)
+
+    if args.get('serial'):
+        where.append("serial_number LIKE %s")
+        params.append(escape_like(args.get('serial')) + '%')
+
+    q = (args.get('q') or '').strip()
+    if q:
+        terms = fulltext_terms(q)
+        if terms:
+            where.append("MATCH(asset_name, serial_number) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(terms)
+        else:
+            where.append("asset_name LIKE %s")
+            params.append(escape_like(q) + '%')
+    return where, params
+
+def keyset_clause(column, desc, value, last_id):
+    # Rows after (value, last_id) in ORDER BY column, id; MySQL sorts NULLs first ascending, last descending
+    op = '<' if desc else '>'
+    if value is None:
+        if desc:
+            return f"({column} IS NULL AND id < %s)", [last_id]
+        return f"(({column} IS NULL AND id > %s) OR {column} IS NOT NULL)", [last_id]
+    clause = f"({column} {op} %s OR ({column} = %s AND id {op} %s)"
+    if desc:
+        clause += f" OR {column} IS NULL"
+    return clause + ")", [value, value, last_id]
+
+def asset_cursor_key(sort_key):
+    if sort_key == 'id':
+        return lambda a: [a[0]]
+    index = ASSET_SORT_KEYS[sort_key]
+    return lambda a: [str(a[index]) if a[index] is not None else None, a[0]]
+
+def asset_list_query(role, current_user, args, limit, after, stream):
+    # Shared with the async entry point (asgi.py)
+    where, params = asset_filters(role, current_user, args)
+    sort_key, desc = parse_asset_sort(args)
+
+    if after is not None:
+        if sort_key == 'id':
+            where.append("id < %s" if desc else "id > %s")
+            params.append(after[0])
         else:
-            cursor.execute(
-                "SELECT id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status FROM assets"
-            )
+            clause, values = keyset_clause(sort_key, desc, after[0], after[1])
+            where.append(clause)
+            params.extend(values)
+
+    query = "SELECT " + ASSET_LIST_COLUMNS + " FROM assets"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+
+    direction = " DESC" if desc else ""
+    if stream or limit is not None or args.get('sort'):
+        if sort_key == 'id':
+            query += " ORDER BY id" + direction
+        else:
+            query += f" ORDER BY {sort_key}{direction}, id{direction}"
+
+    if stream:
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit)
+    elif limit is not None:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    return query, tuple(params)
 
+def asset_estimate_query(role, current_user, args):
+    # EXPLAIN only plans the query, so the row estimate costs no scan
+    where, params = asset_filters(role, current_user, args)
+    query = "EXPLAIN SELECT id FROM assets"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query, tuple(params)
+
+@assets_bp.route('/assets', methods=['GET'])
+@jwt_required()
+def list_assets():
+    return _list_assets(request.args)
+
+def _list_assets(args):
+    principal = current_principal()
+    current_user, role = principal.user_id, principal.role
+
+    try:
+        sort_key, _ = parse_asset_sort(args)
+        limit, after, stream = page_args(cursor_size=1 if sort_key == 'id' else 2, args=args)
+        query, params = asset_list_query(role, current_user, args, limit, after, stream)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        cursor = mysql.read_connection.cursor(MySQLdb.cursors.SSCursor)
+        cursor.execute(query, params)
+        return stream_rows(cursor, asset_row_to_dict, stream)
+
+    cursor = mysql.read_connection.cursor()
+    cursor.execute(query, params)
     assets = cursor.fetchall()
+    if limit is None:
+        cursor.close()
+        return jsonify([asset_row_to_dict(a) for a in assets]), 200
+
+    page = page_response(assets, limit, asset_row_to_dict, asset_cursor_key(sort_key))
+    if after is None:
+        cursor.execute(*asset_estimate_query(role, current_user, args))
+        page["total_estimate"] = explain_estimate(cursor.description, cursor.fetchall())
     cursor.close()
-    return jsonify([
-        {
-            "id": a[0],
-            "asset_name": a[1],
-            "asset_type": a[2],
-            "serial_number": a[3],
-            "purchase_date": str(a[4]) if a[4] else None,
-            "warranty_expiry": str(a[5]) if a[5] else None,
-            "status": a[6]
-        } for a in assets
-    ]), 200
+    return jsonify(page), 200
 
-@assets_bp.route('/assets/<int:asset_id>', methods=['GET'])
+@assets_bp.route('/assets/expiring', methods=['GET'])
 @jwt_required()
-def get_asset(asset_id):
-    claims = get_jwt()
-    user_id = get_jwt_identity()
-    role = claims.get('role')
+def list_expiring_assets():
+    try:
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    if days < 0 or days > 3650:
+        return jsonify({"error": "days must be between 0 and 3650"}), 400
 
-    cursor = mysql.connection.cursor()
+    # Same handler as GET /assets with the warranty window pinned; served by idx_assets_warranty_id
+    today = datetime.date.today()
+    args = request.args.to_dict()
+    args['warranty_from'] = today.isoformat()
+    args['warranty_to'] = (today + datetime.timedelta(days=days)).isoformat()
+    args.setdefault('sort', 'warranty_expiry')
+    return _list_assets(args)
 
+def expiry_digest_query(group, role, user_id, days):
+    column = 'company_name' if group == 'company' else 'assigned_to'
+    query = (
+        f"SELECT {column}, COUNT(*), MIN(warranty_expiry) FROM expiring_assets "
+        "WHERE warranty_expiry BETWEEN CURDATE() AND CURDATE() + INTERVAL %s DAY"
+    )
+    params = [days]
     if role == 'user':
-        cursor.execute(
-            "SELECT id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status, assigned_to "
-            "FROM assets WHERE id=%s AND assigned_to=%s", (asset_id, user_id)
-        )
-    else:
-        cursor.execute(
-            "SELECT id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status, assigned_to "
-            "FROM assets WHERE id=%s", (asset_id,)
-        )
+        query += " AND assigned_to=%s"
+        params.append(user_id)
+    query += f" GROUP BY {column} ORDER BY MIN(warranty_expiry)"
+    return query, tuple(params)
 
-    asset = cursor.fetchone()
+@assets_bp.route('/assets/expiring/digest', methods=['GET'])
+@jwt_required()
+def expiry_digest():
+    principal = current_principal()
+    window = current_app.config['EXPIRY_DIGEST_WINDOW_DAYS']
+    group = request.args.get('group', 'company')
+    if group not in ('company', 'assignee'):
+        return jsonify({"error": "group must be company or assignee"}), 400
+    try:
+        days = int(request.args.get('days', window))
+    except ValueError:
+        return jsonify({"error": "days must be an integer"}), 400
+    if days < 0 or days > window:
+        return jsonify({"error": f"days must be between 0 and {window}"}), 400
+
+    cursor = mysql.connection.cursor()
+    cursor.execute(*expiry_digest_query(group, principal.role, principal.user_id, days))
+    rows = cursor.fetchall()
     cursor.close()
 
-    if not asset:
-        return jsonify({"error": "Asset not found"}), 404
+    key = 'company_name' if group == 'company' else 'user_id'
+    return jsonify([{
+        key: r[0],
+        "expiring": r[1],
+        "next_expiry": str(r[2])
+    } for r in rows]), 200
 
-    return jsonify({
+@jobs.task('expiring_assets.rebuild')
+@jobs.task('warranty_digest.rebuild')  # the old kind, for jobs queued before the rename
+def rebuild_expiry_digest(payload):
+    cursor = mysql.connection.cursor()
+    rows = expiring_assets.rebuild(cursor, current_app.config['EXPIRY_DIGEST_WINDOW_DAYS'])
+    cursor.close()
+    return {"rows": rows}
+
+@assets_bp.route('/assets/expiring/digest:rebuild', methods=['POST'])
+@jwt_required()
+def rebuild_expiry_digest_async():
+    principal = current_principal()
+    if not principal.is_company:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    cursor = mysql.connection.cursor()
+    job_id = jobs.enqueue(cursor, 'expiring_assets.rebuild', created_by=principal.user_id)
+    mysql.connection.commit()
+    cursor.close()
+    return jobs.accepted(job_id)
+
+def asset_detail_query(role, user_id, asset_id):
+    columns = "id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status, assigned_to, version"
+    if role == 'user':
+        return (
+            "SELECT " + columns + " FROM assets WHERE id=%s AND assigned_to=%s AND deleted_at IS NULL",
+            (asset_id, user_id)
+        )
+    return "SELECT " + columns + " FROM assets WHERE id=%s AND deleted_at IS NULL", (asset_id,)
+
+def asset_detail_to_dict(asset):
+    return {
         "id": asset[0],
         "asset_name": asset[1],
         "asset_type": asset[2],
@@ -107,44 +445,83 @@ def get_asset(asset_id):
         "warranty_expiry": str(asset[5]),
         "status": asset[6],
         "user_id": asset[7]
-    }), 200
+    }
+
+@assets_bp.route('/assets:batchGet', methods=['POST'])
+@jwt_required()
+def batch_get_assets():
+    principal = current_principal()
+    user_id, role = principal.user_id, principal.role
+    try:
+        ids = batch_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = mysql.connection.cursor()
+    rows = fetch_by_ids(
+        cursor,
+        "SELECT id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status, assigned_to "
+        "FROM assets WHERE id IN ({ids}) AND deleted_at IS NULL",
+        ids
+    )
+    cursor.close()
+
+    # Same rule as get_asset: role user only sees assets assigned to them
+    visible = None if role != 'user' else lambda a: str(a[7]) == str(user_id)
+    return jsonify(batch_response(ids, rows, asset_detail_to_dict, visible)), 200
+
+@assets_bp.route('/assets/<int:asset_id>', methods=['GET'])
+@jwt_required()
+def get_asset(asset_id):
+    principal = current_principal()
+    user_id, role = principal.user_id, principal.role
+
+    cursor = mysql.connection.cursor()
+    cursor.execute(*asset_detail_query(role, user_id, asset_id))
+    asset = cursor.fetchone()
+    cursor.close()
+
+    if not asset:
+        return jsonify({"error": "Asset not found"}), 404
+
+    return with_etag(jsonify(asset_detail_to_dict(asset)), asset[8]), 200
 
 @assets_bp.route('/assets/<int:asset_id>', methods=['DELETE'])
 @jwt_required()
 def delete_asset(asset_id):
-    claims = get_jwt()
-    if claims.get('role') != 'company':
+    if not current_principal().is_company:
         return jsonify({"error": "Only company can delete assets"}), 403
 
+    # Hide the asset now; its maintenance history is removed in batches by the assets.purge job
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id FROM assets WHERE id=%s", (asset_id,))
-    if not cursor.fetchone():
+    cursor.execute(ASSET_SOFT_DELETE, (asset_id,))
+    if cursor.rowcount == 0:
         cursor.close()
         return jsonify({"error": "Asset not found"}), 404
-
-    cursor.execute("DELETE FROM maintenance_records WHERE asset_id=%s", (asset_id,))
-    cursor.execute("DELETE FROM assets WHERE id=%s", (asset_id,))
+    changes.record_asset(cursor, asset_id, 'delete')
+    expiring_assets.remove_asset(cursor, asset_id)
+    maintenance_summary.remove_asset(cursor, asset_id)
+    job_id = jobs.enqueue(cursor, 'assets.purge', {"asset_id": asset_id}, created_by=current_principal().user_id)
     mysql.connection.commit()
     cursor.close()
-    return jsonify({"message": "Asset deleted successfully"}), 200
+    return jobs.accepted(job_id, message="Asset deleted successfully")
 
 @assets_bp.route('/assets/<int:asset_id>', methods=['PUT'])
 @jwt_required()
 def update_asset(asset_id):
-    claims = get_jwt()
-    if claims.get('role') != 'company':
+    if not current_principal().is_company:
         return jsonify({"error": "Only company can update assets"}), 403
 
     data = request.json
+    # Lock the row and read its assignee, so a reassignment can tell the previous owner
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id FROM assets WHERE id=%s", (asset_id,))
-    if not cursor.fetchone():
+    cursor.execute("SELECT assigned_to FROM assets WHERE id=%s AND deleted_at IS NULL FOR UPDATE", (asset_id,))
+    asset = cursor.fetchone()
+    if not asset:
         cursor.close()
         return jsonify({"error": "Asset not found"}), 404
-
     cursor.execute(
-        "UPDATE assets SET asset_name=%s, asset_type=%s, serial_number=%s, "
-        "purchase_date=%s, warranty_expiry=%s, status=%s, assigned_to=%s WHERE id=%s",
+        ASSET_UPDATE,
         (
             data.get('asset_name'),
             data.get('asset_type'),
@@ -156,18 +533,71 @@ def update_asset(asset_id):
             asset_id
         )
     )
+    expiring_assets.refresh_asset(cursor, asset_id, current_app.config['EXPIRY_DIGEST_WINDOW_DAYS'])
+    changes.record_asset(cursor, asset_id, 'update', previous_owner=asset[0])
     mysql.connection.commit()
     cursor.close()
     return jsonify({"message": "Asset updated successfully"}), 200
 
+@assets_bp.route('/assets/<int:asset_id>', methods=['PATCH'])
+@jwt_required()
+def patch_asset(asset_id):
+    if not current_principal().is_company:
+        return jsonify({"error": "Only company can update assets"}), 403
+    try:
+        requested = patch_changes(ASSET_PATCH_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Plain read, no lock: the UPDATE below only applies if the version is still the one read here
+    cursor = mysql.connection.cursor()
+    cursor.execute(*asset_detail_query('company', None, asset_id))
+    asset = cursor.fetchone()
+    if not asset:
+        cursor.close()
+        return jsonify({"error": "Asset not found"}), 404
+    version = asset[8]
+    if precondition_failed(version):
+        cursor.close()
+        return jsonify({"error": "Asset has changed since it was read"}), 412
+
+    current = dict(zip(ASSET_PATCH_FIELDS.values(), asset[1:8]))
+    changed = changed_columns(current, requested)
+    if not changed:
+        cursor.close()
+        return with_etag(jsonify(asset_detail_to_dict(asset)), version), 200
+
+    if 'assigned_to' in changed:
+        cursor.execute("SELECT id FROM users WHERE id=%s AND deleted_at IS NULL", (changed['assigned_to'],))
+        if not cursor.fetchone():
+            cursor.close()
+            return jsonify({"error": "User not found"}), 404
+
+    assignments, params = set_clause(changed)
+    cursor.execute(f"UPDATE assets SET {assignments} WHERE id=%s AND version=%s", (*params, asset_id, version))
+    if cursor.rowcount == 0:
+        mysql.connection.rollback()
+        cursor.close()
+        return jsonify({"error": "Asset was changed concurrently, read it again"}), conflict_status()
+    if changed.keys() & {'warranty_expiry', 'assigned_to'}:
+        expiring_assets.refresh_asset(cursor, asset_id, current_app.config['EXPIRY_DIGEST_WINDOW_DAYS'])
+    changes.record_asset(cursor, asset_id, 'update', previous_owner=current['assigned_to'])
+    mysql.connection.commit()
+    cursor.close()
+
+    current.update(changed)
+    return with_etag(jsonify(asset_detail_to_dict((asset_id, *current.values()))), version + 1), 200
+
 # Ensure /users route returns username
 @assets_bp.route('/users', methods=['GET'])
 @jwt_required()
 def get_users():
+    return cache.response(USERS_DIRECTORY_KEY, load_user_directory, private=True)
+
+def load_user_directory():
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id, username FROM users")
+    cursor.execute("SELECT id, username FROM users WHERE deleted_at IS NULL")
+    to_dict = row_mapper(cursor.description)
     users = cursor.fetchall()
     cursor.close()
-    return jsonify([
-        {"id": u[0], "username": u[1]} for u in users
-    ])
+    return [to_dict(u) for u in users]
@@ -0,0 +1,139 @@
+import collections
+import hashlib
+import threading
+import time
+from flask import g, current_app
+from flask_jwt_extended import JWTManager, get_jwt
+from cache import RedisCache
+
+REVOKED_KEY = 'revoked:{}'
+# Issue time with sub-second precision; iat is whole seconds, which cannot tell a token issued
+# just after a revocation from one issued just before it
+ISSUED_CLAIM = 'issued_at'
+
+
+class Principal:
+    # The caller as stated by the verified access token; resolved once per request
+    __slots__ = ('user_id', 'role')
+
+    def __init__(self, user_id, role):
+        self.user_id = user_id
+        self.role = role
+
+    @property
+    def is_company(self):
+        return self.role == 'company'
+
+
+def current_principal():
+    principal = g.get('principal')
+    if principal is None:
+        claims = get_jwt()
+        principal = g.principal = Principal(claims['sub'], claims.get('role') or 'user')
+    return principal
+
+
+class VerifiedTokens:
+    # LRU of decoded claims keyed by token hash; an entry never outlives the token's exp
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            claims = self._data.get(key)
+            if claims is None or claims.get('exp', 0) <= time.time():
+                if claims is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return claims
+
+    def put(self, key, claims):
+        with self._lock:
+            self._data[key] = claims
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard_subject(self, sub):
+        with self._lock:
+            for key in [k for k, c in self._data.items() if c.get('sub') == sub]:
+                del self._data[key]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+class CachingJWTManager(JWTManager):
+    # JWTManager that skips signature verification for tokens it has already verified, and rejects
+    # tokens issued before revoke_user() for that user. Revocations reach the other worker processes
+    # only through a Redis cache backend (CACHE_REDIS_URL).
+    def __init__(self, app=None, cache=None):
+        self.tokens = VerifiedTokens()
+        self.revoked = {}
+        self.cache = cache
+        self.revoked_ttl = 3600
+        super().__init__(app)
+
+    def init_app(self, app, add_context_processor=False):
+        super().init_app(app, add_context_processor)
+        app.config.setdefault('JWT_VERIFIED_CACHE_SIZE', 1024)  # 0 disables the cache
+        app.config.setdefault('JWT_REVOCATION_TTL', 3600)  # keep at least as long as access tokens live
+
+        self.tokens = VerifiedTokens(app.config['JWT_VERIFIED_CACHE_SIZE'])
+        self.revoked_ttl = app.config['JWT_REVOCATION_TTL']
+        self.token_in_blocklist_loader(self.is_revoked)
+        self.additional_claims_loader(self.issue_claims)
+
+    def issue_claims(self, _identity):
+        return {ISSUED_CLAIM: time.time()}
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        if csrf_value is not None or allow_expired or not self.tokens.max_entries:
+            return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        key = hashlib.sha256(encoded_token.encode('utf-8')).hexdigest()
+        claims = self.tokens.get(key)
+        if claims is None:
+            claims = super()._decode_jwt_from_config(encoded_token)
+            if 'exp' in claims:
+                self.tokens.put(key, claims)
+        return claims
+
+    def verified_claims(self, encoded_token):
+        # Claims of a token this process has already verified, else None; skips revocation checks
+        if not self.tokens.max_entries:
+            return None
+        return self.tokens.get(hashlib.sha256(encoded_token.encode('utf-8')).hexdigest())
+
+    def is_revoked(self, _header, claims):
+        sub = claims.get('sub')
+        revoked_at = self.revoked.get(sub)
+        if revoked_at is None and self.cache is not None:
+            # Shared with the other workers when the cache is backed by Redis
+            revoked_at = self.cache.get(REVOKED_KEY.format(sub))
+        # Tokens from before issued_at was added only have iat
+        return revoked_at is not None and claims.get(ISSUED_CLAIM, claims.get('iat', 0)) <= revoked_at
+
+    def revoke_user(self, user_id):
+        # Rejects every token already issued to the user, e.g. once the account is deleted
+        self.tokens.discard_subject(str(user_id))
+        now = time.time()
+        self.revoked = {k: v for k, v in self.revoked.items() if v > now - self.revoked_ttl}
+        self.revoked[str(user_id)] = now
+        if self.cache is None or not isinstance(self.cache.backend, RedisCache):
+            current_app.logger.warning(
+                "Revoked user %s in this process only; set CACHE_REDIS_URL to share revocations between workers",
+                user_id
+            )
+            return
+        try:
+            self.cache.backend.set(REVOKED_KEY.format(user_id), now, self.revoked_ttl)
+        except Exception:
+            current_app.logger.exception("Could not share revocation of user %s", user_id)
@@ -0,0 +1,39 @@
+from flask import request, current_app
+from bulk import chunked
+
+
+def batch_ids(field='ids'):
+    # {"ids": [...]} request body; duplicates collapse, order is kept
+    data = request.get_json(silent=True)
+    ids = data.get(field) if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids:
+        raise ValueError(f"Expected a JSON object with a non-empty {field} array")
+    if any(isinstance(i, bool) or not isinstance(i, int) for i in ids):
+        raise ValueError(f"{field} must be integers")
+    max_ids = current_app.config['BATCH_MAX_IDS']
+    if len(ids) > max_ids:
+        raise ValueError(f"At most {max_ids} ids per request")
+    return list(dict.fromkeys(ids))
+
+
+def fetch_by_ids(cursor, query, ids):
+    # query has one {ids} placeholder for the IN list and selects the id first; returns {id: row}
+    rows = {}
+    for chunk in chunked(ids, current_app.config['BATCH_CHUNK_SIZE']):
+        cursor.execute(query.format(ids=", ".join(["%s"] * len(chunk))), tuple(chunk))
+        for row in cursor.fetchall():
+            rows[row[0]] = row
+    return rows
+
+
+def batch_response(ids, rows, serialize, visible=None):
+    results = []
+    for i in ids:
+        row = rows.get(i)
+        if row is None:
+            results.append({"id": i, "status": "not_found"})
+        elif visible is not None and not visible(row):
+            results.append({"id": i, "status": "forbidden"})
+        else:
+            results.append({"id": i, "status": "ok", "item": serialize(row)})
+    return {"results": results}
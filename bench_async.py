@@ -0,0 +1,98 @@
+"""Compare the WSGI (main.py) and ASGI (asgi.py) serving modes.
+
+Start both servers against the same database, then:
+
+    python bench_async.py --sync http://127.0.0.1:5000 --async http://127.0.0.1:8000 \\
+        --email admin@example.com --password secret --concurrency 64 --requests 2000
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+from loadtest import login, percentile
+
+DEFAULT_PATHS = ['/assets?limit=100', '/maintenance/all?limit=100', '/user-services']
+
+
+def run(base_url, path, token, concurrency, total):
+    url = urlsplit(base_url)
+    headers = {'Authorization': 'Bearer ' + token}
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker():
+        # One keep-alive connection per worker thread
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                ok = resp.status < 400
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / wall, 1) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sync', default='http://127.0.0.1:5000')
+    parser.add_argument('--async', dest='async_', default='http://127.0.0.1:8000')
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--path', action='append', dest='paths')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    token = login(args.sync, args.email, args.password)
+    results = {}
+    for mode, base_url in (('sync', args.sync), ('async', args.async_)):
+        for path in args.paths or DEFAULT_PATHS:
+            run(base_url, path, token, min(args.concurrency, 4), 20)  # warm up pools
+            results.setdefault(path, {})[mode] = run(base_url, path, token, args.concurrency, args.requests)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'path':<32} {'mode':<6} {'rps':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for path, modes in results.items():
+        for mode, r in modes.items():
+            print(f"{path:<32} {mode:<6} {r['rps']:>9} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Measure what rate limiting adds to a request.
+
+Times the token-bucket take() on its own (per-process buckets, and Redis with --redis), then the whole
+per-request check (token identity, cost lookup, take) in a request context, against the same request
+with limiting disabled. No database or running server is needed.
+
+    python bench_ratelimit.py --iterations 200000
+    python bench_ratelimit.py --redis redis://localhost:6379/0 --keys 10000
+"""
+import argparse
+import json
+import time
+from flask_jwt_extended import create_access_token
+from config import limiter
+from main import app
+from ratelimit import LocalBuckets, RedisBuckets
+
+
+def per_call_us(fn, iterations):
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return round((time.perf_counter() - started) / iterations * 1e6, 3)
+
+
+def bench_store(store, keys, iterations):
+    # Generous limits so every call takes the normal path, never the rejection
+    return per_call_us(lambda i: store.take(f"user:{i % keys}", 1e9, 1e9, 1, time.time()), iterations)
+
+
+def bench_check(token, iterations):
+    headers = {'Authorization': 'Bearer ' + token}
+    with app.test_request_context('/assets', headers=headers):
+        limiter.check()  # verify the token once, as the first request of a client would
+        return per_call_us(lambda i: limiter.check(), iterations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=100000)
+    parser.add_argument('--keys', type=int, default=1000, help='distinct callers cycled through')
+    parser.add_argument('--redis', help='also time the shared store at this URL')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = {"take_local_us": bench_store(LocalBuckets(args.keys), args.keys, args.iterations)}
+    if args.redis:
+        import redis
+        store = RedisBuckets(redis.Redis.from_url(args.redis), prefix='bench-ratelimit:')
+        results["take_redis_us"] = bench_store(store, args.keys, max(1, args.iterations // 100))
+
+    with app.app_context():
+        token = create_access_token(identity='1', additional_claims={'role': 'company'})
+    limiter.limits = {role: (1e9, 1e9) for role in limiter.limits}
+    limiter.enabled = False
+    results["check_disabled_us"] = bench_check(token, args.iterations)
+    limiter.enabled = True
+    results["check_enabled_us"] = bench_check(token, args.iterations)
+    results["overhead_us"] = round(results["check_enabled_us"] - results["check_disabled_us"], 3)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, value in results.items():
+        print(f"{name:<20} {value:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+from flask import request
+
+BULK_FORMATS = {
+    'application/json': 'json',
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson'
+}
+
+
+def bulk_format():
+    return BULK_FORMATS.get(request.mimetype)
+
+
+def iter_bulk_rows(fmt):
+    # Yields (row, error) pairs; CSV and NDJSON bodies are read incrementally from the request stream
+    if fmt == 'json':
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get('assets')
+        if not isinstance(data, list):
+            raise ValueError("Expected a JSON array of assets")
+        for row in data:
+            if isinstance(row, dict):
+                yield row, None
+            else:
+                yield None, "Row must be an object"
+        return
+
+    text = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        for row in csv.DictReader(text):
+            yield row, None
+        return
+
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield None, "Invalid JSON"
+            continue
+        if isinstance(row, dict):
+            yield row, None
+        else:
+            yield None, "Row must be an object"
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,130 @@
+import collections
+import hashlib
+import json
+import threading
+import time
+from flask import Response, current_app, request
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+SERVICES_KEY = 'services'
+SERVICE_IDS_KEY = 'services:ids'
+SERVICE_KEYS = (SERVICES_KEY, SERVICE_IDS_KEY)
+USERS_LIST_KEY = 'users:list'
+USERS_DIRECTORY_KEY = 'users:directory'
+USER_KEYS = (USERS_LIST_KEY, USERS_DIRECTORY_KEY)
+
+
+class LocalCache:
+    # In-process TTL + LRU store
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+
+class RedisCache:
+    # Shared store so every worker sees the same entries and invalidations
+    def __init__(self, url, prefix='cache:'):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.setex(self.prefix + key, int(ttl), json.dumps(value))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + k for k in keys])
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = 60
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_TTL', 60)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 256)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+
+        self.ttl = app.config['CACHE_TTL']
+        url = app.config['CACHE_REDIS_URL']
+        if url and redis is not None:
+            self.backend = RedisCache(url)
+        else:
+            if url:
+                app.logger.warning("CACHE_REDIS_URL is set but redis is not installed; using local cache")
+            self.backend = LocalCache(app.config['CACHE_MAX_ENTRIES'])
+
+    def get(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception:
+            current_app.logger.exception("Cache read failed for %s", key)
+            return None
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception:
+            current_app.logger.exception("Cache write failed for %s", key)
+
+    def invalidate(self, *keys):
+        try:
+            self.backend.delete(*keys)
+        except Exception:
+            current_app.logger.exception("Cache invalidation failed for %s", keys)
+
+    def response(self, key, loader, private=False):
+        # Read-through: serve the cached body or build it with loader(), then answer
+        # If-None-Match / If-Modified-Since with a 304 when the client copy is current
+        entry = self.get(key)
+        if entry is None:
+            body = current_app.json.dumps(loader())
+            entry = {
+                "body": body,
+                "etag": hashlib.sha1(body.encode('utf-8')).hexdigest(),
+                "last_modified": int(time.time())
+            }
+            self.set(key, entry)
+
+        resp = Response(entry['body'], mimetype='application/json')
+        resp.set_etag(entry['etag'])
+        resp.last_modified = entry['last_modified']
+        resp.cache_control.no_cache = True
+        if private:
+            resp.cache_control.private = True
+        return resp.make_conditional(request)
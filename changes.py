@@ -0,0 +1,257 @@
+"""Change feed for asset and maintenance writes.
+
+The write handlers append to change_log inside their own transaction. Its ids are assigned at
+INSERT time, not at commit, so a transaction can commit a lower id after a poller has read past it.
+A poll therefore returns every visible entry after the cursor but only advances the cursor over
+entries older than CHANGES_SETTLE_SECONDS, and never past a newer one: entries are delivered at
+least once, and none is skipped as long as write transactions commit within that window. Clients
+take a cursor from GET /changes, do one full sync, then poll GET /changes?since=<cursor> or hold
+GET /changes/stream open for live events, and treat a repeated entry as a no-op.
+
+    python changes.py --prune   # drop entries older than CHANGE_LOG_RETENTION_DAYS
+"""
+import argparse
+import time
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from flask_jwt_extended import jwt_required
+from config import mysql
+from auth import current_principal
+from pagination import encode_cursor, decode_cursor, DEFAULT_LIMIT, MAX_LIMIT
+from serialize import dumps
+
+changes_bp = Blueprint('changes', __name__)
+
+CHANGE_INSERT = "INSERT INTO change_log (entity, entity_id, op, owner_id) "
+
+
+def record_asset(cursor, asset_id, op, previous_owner=None):
+    # Call after the write for create/update and before it for delete, so the owner can still be read.
+    # previous_owner is the assignee before an update; if it changed they get an 'unassign' entry.
+    cursor.execute(CHANGE_INSERT + "SELECT 'asset', id, %s, assigned_to FROM assets WHERE id=%s", (op, asset_id))
+    if previous_owner is not None:
+        cursor.execute(
+            CHANGE_INSERT + "SELECT 'asset', id, 'unassign', %s FROM assets WHERE id=%s AND NOT (assigned_to <=> %s)",
+            (previous_owner, asset_id, previous_owner)
+        )
+
+
+def record_assets(cursor, asset_ids, op):
+    cursor.execute(
+        CHANGE_INSERT + "SELECT 'asset', id, %s, assigned_to FROM assets WHERE id IN ("
+        + ", ".join(["%s"] * len(asset_ids)) + ")",
+        (op, *asset_ids)
+    )
+
+
+def record_maintenance(cursor, maintenance_id, op):
+    cursor.execute(
+        CHANGE_INSERT + "SELECT 'maintenance', mr.id, %s, a.assigned_to FROM maintenance_records mr "
+        "JOIN assets a ON a.id = mr.asset_id WHERE mr.id=%s",
+        (op, maintenance_id)
+    )
+
+
+def record_maintenance_deleted(cursor, maintenance_ids):
+    # Call before the rows are deleted
+    cursor.execute(
+        CHANGE_INSERT + "SELECT 'maintenance', mr.id, 'delete', a.assigned_to FROM maintenance_records mr "
+        "JOIN assets a ON a.id = mr.asset_id WHERE mr.id IN (" + ", ".join(["%s"] * len(maintenance_ids)) + ")",
+        tuple(maintenance_ids)
+    )
+
+
+def change_to_dict(r):
+    return {
+        "entity": r[1],
+        "id": r[2],
+        "op": r[3],
+        "changed_at": r[4]
+    }
+
+
+def changes_query(owner_id, after, limit, settle_seconds):
+    # owner_id None reads every entry (company). The last column says whether the entry is
+    # older than the settle window.
+    query = (
+        "SELECT id, entity, entity_id, op, changed_at, changed_at < NOW(3) - INTERVAL %s SECOND "
+        "FROM change_log WHERE id > %s"
+    )
+    params = [settle_seconds, after]
+    if owner_id is not None:
+        query += " AND owner_id = %s"
+        params.append(owner_id)
+    query += " ORDER BY id LIMIT %s"
+    params.append(limit)
+    return query, tuple(params)
+
+
+def fetch_changes(cursor, principal, after, limit, settle_seconds):
+    owner_id = None if principal.is_company else principal.user_id
+    cursor.execute(*changes_query(owner_id, after, limit, settle_seconds))
+    return cursor.fetchall()
+
+
+def settled_position(rows, after):
+    # Cursor after the leading run of settled entries; an unsettled entry may still have uncommitted
+    # entries with lower ids, so the cursor stops before it
+    for r in rows:
+        if not r[5]:
+            break
+        after = r[0]
+    return after
+
+
+def head(cursor, settle_seconds):
+    # Starting cursor: just before the oldest unsettled entry, else the newest entry
+    cursor.execute(
+        "SELECT MIN(id) - 1 FROM change_log WHERE changed_at >= NOW(3) - INTERVAL %s SECOND", (settle_seconds,)
+    )
+    position = cursor.fetchone()[0]
+    if position is not None:
+        return position
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_log")
+    return cursor.fetchone()[0]
+
+
+def expired(cursor, after):
+    # True when entries after the cursor have been pruned and the client must resync
+    cursor.execute("SELECT MIN(id) FROM change_log")
+    oldest = cursor.fetchone()[0]
+    return oldest is not None and after < oldest - 1
+
+
+def parse_since(value):
+    if not value:
+        return None
+    position = decode_cursor(value, 1)[0]
+    if not isinstance(position, int):
+        raise ValueError("Invalid cursor")
+    return position
+
+
+@changes_bp.route('/changes', methods=['GET'])
+@jwt_required()
+def get_changes():
+    principal = current_principal()
+    try:
+        since = parse_since(request.args.get('since'))
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "Invalid since cursor or limit"}), 400
+    if limit < 1 or limit > MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {MAX_LIMIT}"}), 400
+
+    settle_seconds = current_app.config['CHANGES_SETTLE_SECONDS']
+    cursor = mysql.connection.cursor()
+    if since is None:
+        # No cursor yet: hand out the current head to start from
+        position = head(cursor, settle_seconds)
+        cursor.close()
+        return jsonify({"items": [], "next_cursor": encode_cursor([position]), "has_more": False}), 200
+    if expired(cursor, since):
+        cursor.close()
+        return jsonify({"error": "Cursor is older than the change log retention; resync"}), 410
+
+    rows = fetch_changes(cursor, principal, since, limit + 1, settle_seconds)
+    cursor.close()
+    rows = rows[:limit] if len(rows) > limit else rows
+    position = settled_position(rows, since)
+    return jsonify({
+        "items": [change_to_dict(r) for r in rows],
+        "next_cursor": encode_cursor([position]),
+        # Only when the whole page settled; otherwise the next poll would return this page again
+        "has_more": len(rows) == limit and position == rows[-1][0]
+    }), 200
+
+
+@changes_bp.route('/changes/stream', methods=['GET'])
+@jwt_required()
+def stream_changes():
+    principal = current_principal()
+    try:
+        since = parse_since(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    except ValueError:
+        return jsonify({"error": "Invalid since cursor"}), 400
+
+    settle_seconds = current_app.config['CHANGES_SETTLE_SECONDS']
+    with mysql.borrow() as conn:
+        cursor = conn.cursor()
+        if since is None:
+            since = head(cursor, settle_seconds)
+        elif expired(cursor, since):
+            cursor.close()
+            return jsonify({"error": "Cursor is older than the change log retention; resync"}), 410
+        cursor.close()
+
+    config = current_app.config
+    poll_interval = config['CHANGES_POLL_INTERVAL']
+    keepalive = config['CHANGES_KEEPALIVE_SECONDS']
+    deadline = time.monotonic() + config['CHANGES_STREAM_MAX_SECONDS']
+
+    def generate():
+        # The stream ends after CHANGES_STREAM_MAX_SECONDS; EventSource reconnects with Last-Event-ID.
+        # Unsettled entries are sent once and remembered until the cursor moves past them; their
+        # event id is the settled cursor, so a reconnect replays rather than skips them.
+        after = since
+        sent = set()
+        last_sent = time.monotonic()
+        yield b"retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            # Borrow a connection per poll instead of holding one for the life of the stream
+            with mysql.borrow() as conn:
+                cursor = conn.cursor()
+                rows = fetch_changes(cursor, principal, after, MAX_LIMIT, settle_seconds)
+                cursor.close()
+            position = settled_position(rows, after)
+            fresh = [r for r in rows if r[0] not in sent]
+            for r in fresh:
+                event_id = encode_cursor([r[0] if r[0] <= position else position]).encode('ascii')
+                yield b"id: " + event_id + b"\ndata: " + dumps(change_to_dict(r)) + b"\n\n"
+                sent.add(r[0])
+            after = position
+            sent = {i for i in sent if i > after}
+            if fresh:
+                last_sent = time.monotonic()
+                if len(rows) == MAX_LIMIT and position == rows[-1][0]:
+                    continue
+            elif time.monotonic() - last_sent >= keepalive:
+                yield b": keepalive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+def prune(cursor, retention_days, batch=10000):
+    # Deletes in batches so the purge never holds long locks on the log
+    total = 0
+    while True:
+        cursor.execute(
+            "DELETE FROM change_log WHERE changed_at < NOW() - INTERVAL %s DAY LIMIT %s", (retention_days, batch)
+        )
+        removed = cursor.rowcount
+        mysql.connection.commit()
+        total += removed
+        if removed < batch:
+            return total
+
+
+def main():
+    from config import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prune', action='store_true', required=True)
+    parser.parse_args()
+
+    with app.app_context():
+        cursor = mysql.connection.cursor()
+        removed = prune(cursor, app.config['CHANGE_LOG_RETENTION_DAYS'])
+        cursor.close()
+    print(f"pruned {removed} change log entries")
+
+
+if __name__ == '__main__':
+    main()
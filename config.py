@@ -1,27 +1,178 @@
 from flask import Flask
-from flask_mysqldb import MySQL
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+from db import MySQLPool
+from cache import ResponseCache
+from hashing import PasswordHasher
+from sql_metrics import SQLMetrics
+from auth import CachingJWTManager
+from serialize import FastJSONProvider
+from compression import ResponseCompressor
+from ratelimit import RateLimiter
+from profiling import Profiler
+import settings
+
+DEV_JWT_SECRET = 'super-secret-jwt-key'
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # CORS Configuration
 CORS(app, resources={r"/*": {"origins": "http://localhost:3000"}}, supports_credentials=True)
 
+# Defaults for local development. Deployments override any key below with an APP_<KEY>
+# environment variable or a file named by APP_CONFIG_FILE (see settings.py).
+
 # MySQL Configuration
 app.config['MYSQL_HOST'] = '127.0.0.1'
 app.config['MYSQL_PORT'] = 3306
 app.config['MYSQL_USER'] = 'root'
 app.config['MYSQL_PASSWORD'] = ''
 app.config['MYSQL_DB'] = 'xform_asset_management'
+app.config['MYSQL_CHARSET'] = 'utf8mb4'
+app.config['MYSQL_CONNECT_TIMEOUT'] = 10  # seconds
+app.config['MYSQL_READ_TIMEOUT'] = None  # seconds per query result; None waits indefinitely
+app.config['MYSQL_WRITE_TIMEOUT'] = None
+app.config['MYSQL_AUTOCOMMIT'] = False  # the write paths rely on explicit transactions
+
+# Read replica for GET handlers that tolerate slightly stale data; None reads everything from the primary
+app.config['MYSQL_REPLICA_HOST'] = None
+app.config['MYSQL_REPLICA_PORT'] = None  # replica port, user and password default to the primary's
+app.config['MYSQL_REPLICA_USER'] = None
+app.config['MYSQL_REPLICA_PASSWORD'] = None
+app.config['MYSQL_REPLICA_MAX_LAG'] = 2  # seconds behind the primary before reads go back to it
+app.config['MYSQL_REPLICA_LAG_CHECK_INTERVAL'] = 5  # seconds between SHOW REPLICA STATUS checks
+
+# Connection pool
+app.config['MYSQL_POOL_SIZE'] = 5
+app.config['MYSQL_POOL_MAX_OVERFLOW'] = 10
+app.config['MYSQL_POOL_TIMEOUT'] = 30  # seconds to wait for a free connection
+app.config['MYSQL_POOL_RECYCLE'] = 3600  # reconnect connections older than this
+app.config['MYSQL_POOL_PRE_PING'] = True
+
+# Production server (serve.py). Each worker has its own pool, so keep
+# workers * (MYSQL_POOL_SIZE + MYSQL_POOL_MAX_OVERFLOW) below the server's max_connections.
+app.config['SERVER_BIND'] = '0.0.0.0:5000'
+app.config['SERVER_WORKERS'] = None  # None: one per CPU core
+app.config['SERVER_THREADS'] = 4
+app.config['SERVER_MAX_REQUESTS'] = 5000  # recycle a worker after this many requests
+app.config['SERVER_MAX_REQUESTS_JITTER'] = 500
+app.config['SERVER_TIMEOUT'] = 60  # seconds before a silent worker is killed and replaced
+app.config['SERVER_GRACEFUL_TIMEOUT'] = 30  # seconds old workers get to finish requests on reload or stop
+
+# SQL instrumentation (Server-Timing header, slow-query log, /metrics)
+app.config['SLOW_QUERY_THRESHOLD_MS'] = 200
+app.config['SLOW_QUERY_LOG_FILE'] = None  # e.g. 'slow_query.log'; defaults to the app log
+app.config['SQL_SERVER_TIMING'] = True
+
+# Response cache for rarely-changing listings (services, user directory)
+app.config['CACHE_TTL'] = 60
+app.config['CACHE_MAX_ENTRIES'] = 256
+app.config['CACHE_REDIS_URL'] = None  # e.g. redis://localhost:6379/0 to share across workers
+
+# Bulk import
+app.config['ASSET_BULK_CHUNK_SIZE'] = 1000  # rows per INSERT batch / transaction
+app.config['BATCH_MAX_IDS'] = 1000  # ids accepted by one :batchGet call
+app.config['BATCH_CHUNK_SIZE'] = 500  # ids per IN (...) query
+
+# Password hashing (bcrypt runs in a separate process pool)
+app.config['BCRYPT_LOG_ROUNDS'] = 12  # existing hashes are upgraded on next login when this changes
+app.config['PASSWORD_HASH_WORKERS'] = 2
+app.config['PASSWORD_HASH_MAX_PENDING'] = 16  # admitted hash/check calls before returning 503
+app.config['PASSWORD_HASH_ADMISSION_TIMEOUT'] = 2
+
+# Expiring-asset index behind the warranty expiry digest (see expiring_assets.py)
+app.config['EXPIRY_DIGEST_WINDOW_DAYS'] = 90
+app.config['EXPIRY_DIGEST_REFRESH_HOUR'] = 2  # local time of the daily refresh
+
+# Response compression (gzip, or brotli when the brotli package is installed)
+app.config['COMPRESS_MIN_SIZE'] = 1024  # bytes; None disables compression
+app.config['COMPRESS_GZIP_LEVEL'] = 6
+app.config['COMPRESS_BROTLI_QUALITY'] = 4
+
+# Change feed (see changes.py)
+app.config['CHANGE_LOG_RETENTION_DAYS'] = 7  # older cursors get 410 and must resync
+app.config['CHANGES_POLL_INTERVAL'] = 1.0  # seconds between change_log polls per SSE stream
+app.config['CHANGES_KEEPALIVE_SECONDS'] = 15
+app.config['CHANGES_STREAM_MAX_SECONDS'] = 300  # clients reconnect with Last-Event-ID after this
+app.config['CHANGES_SETTLE_SECONDS'] = 10  # longest a write transaction may stay open after logging its change
+
+# Background jobs (jobs.py, worker.py)
+app.config['JOB_WORKER_CONCURRENCY'] = 4
+app.config['JOB_POLL_INTERVAL'] = 1.0  # seconds an idle worker thread waits before polling again
+app.config['JOB_MAX_ATTEMPTS'] = 5  # then the job moves to job_dead_letters
+app.config['JOB_BACKOFF_BASE'] = 2  # seconds before the first retry, doubling per attempt
+app.config['JOB_BACKOFF_MAX'] = 300
+app.config['JOB_LEASE_SECONDS'] = 600  # running jobs with no progress for this long are assumed orphaned and requeued
+app.config['JOB_RETENTION_DAYS'] = 7  # finished jobs stay queryable through GET /jobs/<id> this long
+
+# Idempotency-Key records (idempotency.py); retries within this window replay the first response
+app.config['IDEMPOTENCY_KEY_TTL_HOURS'] = 24
+
+# Cascade deletes (deletes.py): rows per short transaction, and the pause that lets other writers in
+app.config['DELETE_BATCH_SIZE'] = 500
+app.config['DELETE_BATCH_PAUSE'] = 0.05  # seconds
+
+# Rate limiting (ratelimit.py): token buckets per user, or per IP when anonymous and on /login and /register
+app.config['RATE_LIMIT_ENABLED'] = True
+app.config['RATE_LIMITS'] = {  # role: [tokens refilled per second, bucket size]
+    'company': [20, 200],
+    'user': [10, 100],
+    'anonymous': [2, 60]  # per client address, so shared by everyone behind one NAT
+}
+app.config['RATE_LIMIT_COSTS'] = {  # tokens per request by endpoint; anything else costs 1
+    'assets.list_assets': 5,
+    'assets.bulk_create_assets': 20,
+    'maintenance.get_all_maintenance': 5,
+    'users.login': 1,
+    'users.register': 5
+}
+app.config['RATE_LIMIT_SHARED'] = False  # True keeps the buckets in CACHE_REDIS_URL, shared by every worker
+app.config['RATE_LIMIT_MAX_KEYS'] = 10000  # per-process buckets kept when not shared
+# Reverse proxies in front of the app. Each one appends to X-Forwarded-For, and the client address is
+# read that many entries from the right. Leave at 0 when clients connect directly: the header can
+# then be forged.
+app.config['TRUSTED_PROXIES'] = 0
+
+# Sampling profiler (profiling.py); /debug/profile needs a company token
+app.config['PROFILE_DIR'] = 'profiles'  # collapsed-stack (.folded) files for flamegraph.pl or speedscope
+app.config['PROFILE_REQUEST_HEADER'] = 'X-Profile'  # send 'X-Profile: 1' with a company token to profile that request
+app.config['PROFILE_REQUEST_INTERVAL'] = 0.001  # seconds between samples of a single profiled request
+app.config['PROFILE_CONTINUOUS'] = False  # sample every request in the background, aggregated per endpoint
+app.config['PROFILE_CONTINUOUS_INTERVAL'] = 0.05
+app.config['PROFILE_FLUSH_SECONDS'] = 60  # rewrite PROFILE_DIR/continuous-<pid>.folded this often
+app.config['PROFILE_MAX_STACKS'] = 20000  # distinct stacks kept per process; later new ones are counted as dropped
 
 # JWT Configuration
-app.config["JWT_SECRET_KEY"] = "super-secret-jwt-key"
+app.config["JWT_SECRET_KEY"] = DEV_JWT_SECRET
 app.config['JWT_TOKEN_LOCATION'] = ['headers']
+app.config['JWT_VERIFIED_CACHE_SIZE'] = 1024  # verified tokens kept per process; 0 disables
+app.config['JWT_REVOCATION_TTL'] = 3600  # must cover the access-token lifetime set in users.login
+# Token revocation (delete_user) is shared between workers only when CACHE_REDIS_URL is set
+
+# Types of the settings above that default to None; the others are strings
+OPTIONAL_SETTING_TYPES = {
+    'MYSQL_READ_TIMEOUT': int,
+    'MYSQL_WRITE_TIMEOUT': int,
+    'MYSQL_REPLICA_PORT': int,
+    'SERVER_WORKERS': int
+}
+
+settings.load(app.config, types=OPTIONAL_SETTING_TYPES)
+if app.config['JWT_SECRET_KEY'] == DEV_JWT_SECRET:
+    app.logger.warning("JWT_SECRET_KEY is the development default; set APP_JWT_SECRET_KEY")
+
+# request.remote_addr is the client behind TRUSTED_PROXIES proxies; rate limiting keys on it
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
 
 # Extensions
-mysql = MySQL(app)
-bcrypt = Bcrypt(app)
-jwt = JWTManager(app)
+cache = ResponseCache(app)
+mysql = MySQLPool(app, cache)
+sql_metrics = SQLMetrics(app, mysql)
+bcrypt = PasswordHasher(app)
+jwt = CachingJWTManager(app, cache)
+compress = ResponseCompressor(app)
+limiter = RateLimiter(app, cache, jwt)
+profiler = Profiler(app)
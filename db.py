@@ -0,0 +1,470 @@
+import collections
+import contextlib
+import logging
+import os
+import threading
+import time
+import weakref
+import MySQLdb
+from MySQLdb.constants import CLIENT
+from flask import g, request
+from cache import RedisCache
+
+log = logging.getLogger('db')
+
+RECENT_WRITE_KEY = 'recent-write:{}'
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class RecentWrites:
+    # User id -> monotonic time until which that user reads from the primary. Kept apart from the
+    # response cache, whose LRU would evict these markers under load and silently break
+    # read-your-writes. Expired entries are dropped once the map has doubled since the last sweep.
+    def __init__(self):
+        self._until = {}
+        self._lock = threading.Lock()
+        self._sweep_at = 1024
+
+    def add(self, user_id, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._until[user_id] = now + ttl
+            if len(self._until) >= self._sweep_at:
+                self._until = {k: v for k, v in self._until.items() if v > now}
+                self._sweep_at = max(1024, 2 * len(self._until))
+
+    def __contains__(self, user_id):
+        until = self._until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+class ConnectionPool:
+    # Bounded pool: `size` connections are kept open, up to `max_overflow` extra ones
+    # are opened under load and closed again when they are returned.
+    def __init__(self, connect, size=5, max_overflow=10, timeout=30, recycle=3600, pre_ping=True):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._idle = collections.deque()
+        self._created = {}
+        self._open = 0
+        self._cond = threading.Condition()
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._reconnects = 0
+
+        # A forked worker must not reuse the parent's sockets; the weakref lets discarded pools go
+        ref = weakref.ref(self)
+        os.register_at_fork(after_in_child=lambda: ref() and ref()._after_fork())
+
+    def _after_fork(self):
+        # Forget inherited connections without closing them: closing would send COM_QUIT on a
+        # socket the parent still owns. The child opens its own on first checkout.
+        self._idle = collections.deque()
+        self._created = {}
+        self._open = 0
+        self._cond = threading.Condition()
+
+    def _new_connection(self):
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_stale(self, conn):
+        if self.recycle and time.monotonic() - self._created.get(id(conn), 0) > self.recycle:
+            return True
+        if self.pre_ping:
+            try:
+                conn.ping()
+            except Exception:
+                return True
+        return False
+
+    def checkout(self):
+        conn = None
+        waited = None
+        with self._cond:
+            deadline = None
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    self._open += 1
+                    break
+                if deadline is None:
+                    waited = time.monotonic()
+                    deadline = waited + self.timeout
+                    self._waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._wait_time += time.monotonic() - waited
+                    raise PoolTimeout(
+                        f"Timed out after {self.timeout}s waiting for a database connection"
+                    )
+                self._cond.wait(remaining)
+            if waited is not None:
+                self._wait_time += time.monotonic() - waited
+            self._checkouts += 1
+
+        if conn is None:
+            return self._new_connection()
+
+        if self._is_stale(conn):
+            self._discard(conn)
+            self._reconnects += 1
+            return self._new_connection()
+        return conn
+
+    def checkin(self, conn):
+        # Reset any transaction left open by the request before the connection is reused
+        try:
+            conn.rollback()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if len(self._idle) >= self.size:
+                self._open -= 1
+                self._discard(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def dispose(self):
+        with self._cond:
+            while self._idle:
+                self._open -= 1
+                self._discard(self._idle.pop())
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_total": round(self._wait_time, 6),
+                "timeouts": self._timeouts,
+                "reconnects": self._reconnects
+            }
+
+
+class InstrumentedCursor:
+    # Forwards to the driver cursor and reports every statement to the pool's listeners
+    def __init__(self, cursor, listeners):
+        self._cursor = cursor
+        self._listeners = listeners
+
+    def _notify(self, query, started):
+        duration = time.perf_counter() - started
+        for listener in self._listeners:
+            listener(query, duration, self._cursor.rowcount)
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            self._notify(query, started)
+
+    def executemany(self, query, args):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            self._notify(query, started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn, listeners):
+        self._conn = conn
+        self._listeners = listeners
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._listeners)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class MySQLPool:
+    # Drop-in replacement for flask_mysqldb.MySQL: `mysql.connection` hands out a pooled
+    # connection bound to the current app context and returns it on teardown. With
+    # MYSQL_REPLICA_HOST set, `mysql.read_connection` may hand out a replica connection instead.
+    def __init__(self, app=None, cache=None):
+        self.app = app
+        self.cache = cache
+        self.pool = None
+        self.replica = None
+        self.listeners = []
+        self.max_lag = None
+        self.lag_check_interval = 5
+        self._lag = None
+        self._lag_checked_at = None
+        self._lag_lock = threading.Lock()
+        self.recent_writes = RecentWrites()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MYSQL_HOST', 'localhost')
+        app.config.setdefault('MYSQL_USER', None)
+        app.config.setdefault('MYSQL_PASSWORD', None)
+        app.config.setdefault('MYSQL_DB', None)
+        app.config.setdefault('MYSQL_PORT', 3306)
+        app.config.setdefault('MYSQL_CHARSET', 'utf8mb4')
+        app.config.setdefault('MYSQL_CONNECT_TIMEOUT', 10)
+        app.config.setdefault('MYSQL_READ_TIMEOUT', None)
+        app.config.setdefault('MYSQL_WRITE_TIMEOUT', None)
+        app.config.setdefault('MYSQL_AUTOCOMMIT', False)
+        app.config.setdefault('MYSQL_POOL_SIZE', 5)
+        app.config.setdefault('MYSQL_POOL_MAX_OVERFLOW', 10)
+        app.config.setdefault('MYSQL_POOL_TIMEOUT', 30)
+        app.config.setdefault('MYSQL_POOL_RECYCLE', 3600)
+        app.config.setdefault('MYSQL_POOL_PRE_PING', True)
+        app.config.setdefault('MYSQL_REPLICA_HOST', None)
+        app.config.setdefault('MYSQL_REPLICA_PORT', None)
+        app.config.setdefault('MYSQL_REPLICA_USER', None)
+        app.config.setdefault('MYSQL_REPLICA_PASSWORD', None)
+        app.config.setdefault('MYSQL_REPLICA_MAX_LAG', 2)
+        app.config.setdefault('MYSQL_REPLICA_LAG_CHECK_INTERVAL', 5)
+
+        self.pool = self.create_pool(app, replica=False)
+        app.teardown_appcontext(self.teardown)
+
+        if app.config['MYSQL_REPLICA_HOST']:
+            self.replica = self.create_pool(app, replica=True)
+            self.max_lag = app.config['MYSQL_REPLICA_MAX_LAG']
+            self.lag_check_interval = app.config['MYSQL_REPLICA_LAG_CHECK_INTERVAL']
+            app.after_request(self.remember_write)
+
+    def create_pool(self, app, replica):
+        return ConnectionPool(
+            lambda: self.connect(app, replica),
+            size=app.config['MYSQL_POOL_SIZE'],
+            max_overflow=app.config['MYSQL_POOL_MAX_OVERFLOW'],
+            timeout=app.config['MYSQL_POOL_TIMEOUT'],
+            recycle=app.config['MYSQL_POOL_RECYCLE'],
+            pre_ping=app.config['MYSQL_POOL_PRE_PING']
+        )
+
+    def connect(self, app, replica=False):
+        config = app.config
+
+        def setting(name):
+            # Replica settings fall back to the primary's
+            if replica and config[f'MYSQL_REPLICA_{name}'] is not None:
+                return config[f'MYSQL_REPLICA_{name}']
+            return config[f'MYSQL_{name}']
+
+        kwargs = {
+            'host': setting('HOST'),
+            'port': setting('PORT'),
+            'charset': config['MYSQL_CHARSET'],
+            'use_unicode': True,
+            'connect_timeout': config['MYSQL_CONNECT_TIMEOUT'],
+            'autocommit': config['MYSQL_AUTOCOMMIT'],
+            # rowcount reports matched rows, so an UPDATE that changes nothing still counts as found
+            'client_flag': CLIENT.FOUND_ROWS
+        }
+        if setting('USER'):
+            kwargs['user'] = setting('USER')
+        if setting('PASSWORD'):
+            kwargs['passwd'] = setting('PASSWORD')
+        if config['MYSQL_DB']:
+            kwargs['db'] = config['MYSQL_DB']
+        if config['MYSQL_READ_TIMEOUT']:
+            kwargs['read_timeout'] = config['MYSQL_READ_TIMEOUT']
+        if config['MYSQL_WRITE_TIMEOUT']:
+            kwargs['write_timeout'] = config['MYSQL_WRITE_TIMEOUT']
+        return MySQLdb.connect(**kwargs)
+
+    @property
+    def connection(self):
+        if 'mysql_db' not in g:
+            g.mysql_db = self.pool.checkout()
+            g.mysql_conn = InstrumentedConnection(g.mysql_db, self.listeners)
+        return g.mysql_conn
+
+    @property
+    def read_connection(self):
+        # For GET handlers that can tolerate MYSQL_REPLICA_MAX_LAG seconds of staleness. Falls back
+        # to the primary when no replica is configured or it lags too far, and for callers that
+        # wrote recently, so they always read their own writes.
+        if not self.use_replica():
+            return self.connection
+        if 'mysql_replica_db' not in g:
+            try:
+                g.mysql_replica_db = self.replica.checkout()
+            except (MySQLdb.OperationalError, PoolTimeout):
+                log.exception("replica unavailable, reading from the primary")
+                self._lag = None
+                return self.connection
+            g.mysql_replica_conn = InstrumentedConnection(g.mysql_replica_db, self.listeners)
+        return g.mysql_replica_conn
+
+    def use_replica(self):
+        if self.replica is None:
+            return False
+        principal = g.get('principal')
+        if principal is not None and (principal.user_id in self.recent_writes or self.recent_write_shared(principal.user_id)):
+            return False
+        lag = self.replica_lag()
+        return lag is not None and lag <= self.max_lag
+
+    def replica_lag(self):
+        # Measured at most once per MYSQL_REPLICA_LAG_CHECK_INTERVAL per process; other threads use
+        # the last value meanwhile. None means replication is broken or the replica is unreachable.
+        with self._lag_lock:
+            now = time.monotonic()
+            if self._lag_checked_at is not None and now - self._lag_checked_at < self.lag_check_interval:
+                return self._lag
+            self._lag_checked_at = now
+        self._lag = self.measure_lag()
+        return self._lag
+
+    def measure_lag(self):
+        try:
+            conn = self.replica.checkout()
+        except (MySQLdb.OperationalError, PoolTimeout):
+            log.exception("replica lag check failed")
+            return None
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except MySQLdb.ProgrammingError:
+                cursor.execute("SHOW SLAVE STATUS")  # before MySQL 8.0.22
+            row = cursor.fetchone()
+            if row is None:
+                return 0  # not replicating, e.g. a read-only proxy in front of the primary
+            status = dict(zip([d[0] for d in cursor.description], row))
+            cursor.close()
+            return status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+        except MySQLdb.Error:
+            log.exception("replica lag check failed")
+            return None
+        finally:
+            self.replica.checkin(conn)
+
+    def shared_backend(self):
+        backend = self.cache.backend if self.cache is not None else None
+        return backend if isinstance(backend, RedisCache) else None
+
+    def recent_write_shared(self, user_id):
+        backend = self.shared_backend()
+        return backend is not None and bool(backend.get(RECENT_WRITE_KEY.format(user_id)))
+
+    def remember_write(self, response):
+        # Keep a user who just wrote on the primary until the replica is sure to have caught up.
+        # Other workers see the marker only with a shared cache backend (CACHE_REDIS_URL).
+        principal = g.get('principal')
+        if principal is None:
+            return response
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            ttl = self.max_lag + self.lag_check_interval
+            self.recent_writes.add(principal.user_id, ttl)
+            backend = self.shared_backend()
+            if backend is not None:
+                backend.set(RECENT_WRITE_KEY.format(principal.user_id), True, ttl)
+        return response
+
+    @contextlib.contextmanager
+    def borrow(self):
+        # A pooled connection not tied to the app context, for long-lived responses that should
+        # only hold one while they run a query; checkin rolls back, so each borrow sees fresh data
+        conn = self.pool.checkout()
+        try:
+            yield InstrumentedConnection(conn, self.listeners)
+        finally:
+            self.pool.checkin(conn)
+
+    def teardown(self, exception):
+        g.pop('mysql_conn', None)
+        conn = g.pop('mysql_db', None)
+        if conn is not None:
+            self.pool.checkin(conn)
+        g.pop('mysql_replica_conn', None)
+        conn = g.pop('mysql_replica_db', None)
+        if conn is not None:
+            self.replica.checkin(conn)
+
+    def stats(self):
+        stats = self.pool.stats()
+        if self.replica is not None:
+            stats['replica'] = {**self.replica.stats(), "lag": self._lag, "max_lag": self.max_lag}
+        return stats
+
+    def add_listener(self, listener):
+        # listener(query, duration_seconds, rowcount) is called after every statement
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    @contextlib.contextmanager
+    def capture_queries(self):
+        # Collects the statements issued by the current thread inside the block
+        queries = []
+        thread = threading.get_ident()
+
+        def listener(query, duration, rowcount):
+            if threading.get_ident() == thread:
+                queries.append(query)
+
+        self.add_listener(listener)
+        try:
+            yield queries
+        finally:
+            self.remove_listener(listener)
+
+    @contextlib.contextmanager
+    def assert_num_queries(self, expected):
+        # For tests: pins how many round trips a block of code makes
+        with self.capture_queries() as queries:
+            yield queries
+        if len(queries) != expected:
+            raise AssertionError(
+                f"Expected {expected} queries, got {len(queries)}:\n" + "\n".join(
+                    " ".join(q.split()) for q in queries
+                )
+            )
@@ -0,0 +1,143 @@
+"""Chunked cascade deletes.
+
+DELETE /assets/<id> and DELETE /users/<id> only set deleted_at, which hides the row from every read
+path for the price of one row lock, and enqueue a purge job. The job removes the dependent rows
+DELETE_BATCH_SIZE at a time, each batch in its own short transaction followed by DELETE_BATCH_PAUSE,
+so a long history never holds many locks or much undo at once and other writers get in between
+batches. Progress shows up on GET /jobs/<id>. The parent row goes last, so an interrupted purge
+can simply run again.
+
+    python deletes.py --purge   # finish every pending purge now, e.g. after a job was dead-lettered
+"""
+import argparse
+import logging
+import time
+from flask import current_app
+from config import mysql
+import changes
+import jobs
+import expiring_assets
+
+
+# Each batch takes the next LIMIT ids of one of these
+ASSET_MAINTENANCE_IDS = "SELECT id FROM maintenance_records WHERE asset_id=%s"
+USER_SERVICE_IDS = "SELECT id FROM user_services WHERE user_id=%s"
+USER_ASSET_IDS = "SELECT id FROM assets WHERE assigned_to=%s AND deleted_at IS NULL"
+USER_DELETED_ASSET_IDS = "SELECT id FROM assets WHERE assigned_to=%s AND deleted_at IS NOT NULL"
+
+
+def next_ids(cursor, query, params, batch_size):
+    # Plain consistent read without ORDER BY (that would sort the whole history every batch); the
+    # DELETE or UPDATE that follows then locks exactly these primary keys
+    cursor.execute(query + " LIMIT %s", (*params, batch_size))
+    return [r[0] for r in cursor.fetchall()]
+
+
+def in_list(ids):
+    return "(" + ", ".join(["%s"] * len(ids)) + ")"
+
+
+def end_batch(cursor, **progress):
+    jobs.report_progress(cursor, **progress)
+    mysql.connection.commit()
+    time.sleep(current_app.config['DELETE_BATCH_PAUSE'])
+
+
+@jobs.task('assets.purge')
+def purge_asset(payload):
+    asset_id = payload['asset_id']
+    batch_size = current_app.config['DELETE_BATCH_SIZE']
+    cursor = mysql.connection.cursor()
+    cursor.execute("SELECT id FROM assets WHERE id=%s AND deleted_at IS NOT NULL", (asset_id,))
+    if cursor.fetchone() is None:
+        cursor.close()
+        return {"purged": False}
+
+    removed = 0
+    while True:
+        ids = next_ids(cursor, ASSET_MAINTENANCE_IDS, (asset_id,), batch_size)
+        if not ids:
+            break
+        changes.record_maintenance_deleted(cursor, ids)
+        cursor.execute("DELETE FROM maintenance_records WHERE id IN " + in_list(ids), tuple(ids))
+        removed += cursor.rowcount
+        end_batch(cursor, maintenance_records=removed)
+
+    cursor.execute("DELETE FROM assets WHERE id=%s AND deleted_at IS NOT NULL", (asset_id,))
+    cursor.close()
+    return {"purged": True, "maintenance_records": removed}
+
+
+@jobs.task('users.purge')
+def purge_user(payload):
+    # The user's service requests go; their assets belong to the company and are unassigned
+    user_id = payload['user_id']
+    batch_size = current_app.config['DELETE_BATCH_SIZE']
+    cursor = mysql.connection.cursor()
+    cursor.execute("SELECT id FROM users WHERE id=%s AND deleted_at IS NOT NULL", (user_id,))
+    if cursor.fetchone() is None:
+        cursor.close()
+        return {"purged": False}
+
+    removed = unassigned = 0
+    while True:
+        ids = next_ids(cursor, USER_SERVICE_IDS, (user_id,), batch_size)
+        if not ids:
+            break
+        cursor.execute("DELETE FROM user_services WHERE id IN " + in_list(ids), tuple(ids))
+        removed += cursor.rowcount
+        end_batch(cursor, user_services=removed, assets_unassigned=unassigned)
+
+    while True:
+        ids = next_ids(cursor, USER_ASSET_IDS, (user_id,), batch_size)
+        if not ids:
+            break
+        cursor.execute(
+            "UPDATE assets SET assigned_to=NULL, version=version+1 WHERE id IN " + in_list(ids), tuple(ids)
+        )
+        unassigned += cursor.rowcount
+        expiring_assets.unassign_assets(cursor, ids)
+        changes.record_assets(cursor, ids, 'update')
+        end_batch(cursor, user_services=removed, assets_unassigned=unassigned)
+
+    # Assets deleted before their owner still point at the user until their own purge job runs.
+    # They already left the change feed and expiring_assets when they were deleted.
+    while True:
+        ids = next_ids(cursor, USER_DELETED_ASSET_IDS, (user_id,), batch_size)
+        if not ids:
+            break
+        cursor.execute("UPDATE assets SET assigned_to=NULL WHERE id IN " + in_list(ids), tuple(ids))
+        unassigned += cursor.rowcount
+        end_batch(cursor, user_services=removed, assets_unassigned=unassigned)
+
+    cursor.execute("DELETE FROM users WHERE id=%s AND deleted_at IS NOT NULL", (user_id,))
+    cursor.close()
+    return {"purged": True, "user_services": removed, "assets_unassigned": unassigned}
+
+
+def main():
+    from config import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--purge', action='store_true', required=True)
+    parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    log = logging.getLogger('deletes')
+
+    with app.app_context():
+        cursor = mysql.connection.cursor()
+        cursor.execute("SELECT id FROM assets WHERE deleted_at IS NOT NULL")
+        asset_ids = [r[0] for r in cursor.fetchall()]
+        cursor.execute("SELECT id FROM users WHERE deleted_at IS NOT NULL")
+        user_ids = [r[0] for r in cursor.fetchall()]
+        cursor.close()
+        for asset_id in asset_ids:
+            log.info("asset %s: %s", asset_id, purge_asset({"asset_id": asset_id}))
+            mysql.connection.commit()
+        for user_id in user_ids:
+            log.info("user %s: %s", user_id, purge_user({"user_id": user_id}))
+            mysql.connection.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Expiring-asset index behind the warranty-expiry digest.
+
+expiring_assets holds one row per asset whose warranty expires within EXPIRY_DIGEST_WINDOW_DAYS,
+with the assignee and their company denormalized. It stores no counts: GET /assets/expiring/digest
+takes any window up to EXPIRY_DIGEST_WINDOW_DAYS, so it groups these rows at read time, a range
+scan of (company_name | assigned_to, warranty_expiry) over the few assets in the window instead of
+the whole assets table and a join to users. The asset write paths keep it current row by row; the
+daily job drops expired rows and picks up assets that have moved into the window.
+
+    python expiring_assets.py            # refresh once a day at EXPIRY_DIGEST_REFRESH_HOUR
+    python expiring_assets.py --once     # incremental refresh now
+    python expiring_assets.py --rebuild  # recompute the whole table
+"""
+import argparse
+import datetime
+import logging
+import time
+
+DIGEST_SELECT = (
+    "SELECT a.id, a.assigned_to, u.company_name, a.warranty_expiry FROM assets a "
+    "LEFT JOIN users u ON u.id = a.assigned_to "
+    "WHERE a.deleted_at IS NULL AND a.warranty_expiry BETWEEN CURDATE() AND CURDATE() + INTERVAL %s DAY"
+)
+DIGEST_INSERT = "INSERT IGNORE INTO expiring_assets (asset_id, assigned_to, company_name, warranty_expiry) "
+
+
+def refresh_asset(cursor, asset_id, window_days):
+    # Call inside the transaction that changed the asset
+    cursor.execute("DELETE FROM expiring_assets WHERE asset_id=%s", (asset_id,))
+    cursor.execute(DIGEST_INSERT + DIGEST_SELECT + " AND a.id=%s", (window_days, asset_id))
+
+
+def add_asset(cursor, asset_id, window_days):
+    cursor.execute(DIGEST_INSERT + DIGEST_SELECT + " AND a.id=%s", (window_days, asset_id))
+
+
+def add_assets(cursor, asset_ids, window_days):
+    cursor.execute(
+        DIGEST_INSERT + DIGEST_SELECT + " AND a.id IN (" + ", ".join(["%s"] * len(asset_ids)) + ")",
+        (window_days, *asset_ids)
+    )
+
+
+def refresh_assignee(cursor, user_id):
+    # company_name is copied from users; call when a user's company changes
+    cursor.execute(
+        "UPDATE expiring_assets d JOIN users u ON u.id = d.assigned_to "
+        "SET d.company_name = u.company_name WHERE d.assigned_to=%s", (user_id,)
+    )
+
+
+def unassign_assets(cursor, asset_ids):
+    cursor.execute(
+        "UPDATE expiring_assets SET assigned_to=NULL, company_name=NULL WHERE asset_id IN ("
+        + ", ".join(["%s"] * len(asset_ids)) + ")",
+        tuple(asset_ids)
+    )
+
+
+def remove_asset(cursor, asset_id):
+    cursor.execute("DELETE FROM expiring_assets WHERE asset_id=%s", (asset_id,))
+
+
+def refresh(cursor, window_days):
+    # Daily step: drop warranties that have passed or left the window, add the ones that entered it
+    cursor.execute(
+        "DELETE FROM expiring_assets WHERE warranty_expiry < CURDATE() "
+        "OR warranty_expiry > CURDATE() + INTERVAL %s DAY", (window_days,)
+    )
+    removed = cursor.rowcount
+    cursor.execute(DIGEST_INSERT + DIGEST_SELECT, (window_days,))
+    return removed, cursor.rowcount
+
+
+def rebuild(cursor, window_days):
+    cursor.execute("DELETE FROM expiring_assets")
+    cursor.execute(DIGEST_INSERT + DIGEST_SELECT, (window_days,))
+    return cursor.rowcount
+
+
+def seconds_until(hour):
+    now = datetime.datetime.now()
+    run_at = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += datetime.timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+def main():
+    from config import app, mysql
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--once', action='store_true')
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    log = logging.getLogger('expiring_assets')
+
+    window = app.config['EXPIRY_DIGEST_WINDOW_DAYS']
+    while True:
+        if not (args.once or args.rebuild):
+            time.sleep(seconds_until(app.config['EXPIRY_DIGEST_REFRESH_HOUR']))
+        with app.app_context():
+            cursor = mysql.connection.cursor()
+            if args.rebuild:
+                log.info("rebuilt: %d rows", rebuild(cursor, window))
+            else:
+                removed, added = refresh(cursor, window)
+                log.info("refreshed: %d removed, %d added", removed, added)
+            mysql.connection.commit()
+            cursor.close()
+        if args.once or args.rebuild:
+            break
+
+
+if __name__ == '__main__':
+    main()
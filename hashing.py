@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _hash_password(password, rounds):
+    started = time.time()
+    pw_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds))
+    return pw_hash.decode('utf-8'), started
+
+
+def _check_password(pw_hash, password):
+    started = time.time()
+    try:
+        ok = bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+    except ValueError:
+        ok = False
+    return ok, started
+
+
+def hash_rounds(pw_hash):
+    # bcrypt hashes look like $2b$12$<salt+digest>
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    # Runs bcrypt in a bounded process pool so request threads only wait on a future.
+    # At most max_pending calls are admitted at once; the rest get HashingBusy.
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 1
+        self.max_pending = 1
+        self.admission_timeout = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = None
+        self._stats = {"submitted": 0, "rejected": 0, "rehashed": 0, "queue_time_total": 0.0, "queue_time_max": 0.0,
+                       "pool_restarts": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('PASSWORD_HASH_MAX_PENDING', app.config['PASSWORD_HASH_WORKERS'] * 4)
+        app.config.setdefault('PASSWORD_HASH_ADMISSION_TIMEOUT', 2)
+
+        self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.max_pending = app.config['PASSWORD_HASH_MAX_PENDING']
+        self.admission_timeout = app.config['PASSWORD_HASH_ADMISSION_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def _get_executor(self, broken=None):
+        # Created lazily, and again after a fork, so each worker process owns its own pool. A pool
+        # child that dies (OOM kill, segfault) breaks the whole pool; pass it as broken to replace it,
+        # once, however many threads saw it fail.
+        with self._lock:
+            if broken is not None and self._executor is broken:
+                broken.shutdown(wait=False)
+                self._executor = None
+                self._stats["pool_restarts"] += 1
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.admission_timeout):
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise HashingBusy("Too many concurrent password operations")
+        try:
+            submitted = time.time()
+            executor = self._get_executor()
+            try:
+                result, started = executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # Retry once on a fresh pool; a second failure goes to the caller
+                result, started = self._get_executor(broken=executor).submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+        queued = max(started - submitted, 0.0)
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._stats["queue_time_total"] += queued
+            self._stats["queue_time_max"] = max(self._stats["queue_time_max"], queued)
+        return result
+
+    def generate_password_hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        if not pw_hash or password is None:
+            return False
+        return self._run(_check_password, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        return hash_rounds(pw_hash) != self.rounds
+
+    def record_rehash(self):
+        with self._lock:
+            self._stats["rehashed"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["rounds"] = self.rounds
+        stats["workers"] = self.workers
+        stats["max_pending"] = self.max_pending
+        stats["queue_time_avg"] = stats["queue_time_total"] / stats["submitted"] if stats["submitted"] else 0.0
+        return stats
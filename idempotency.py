@@ -0,0 +1,107 @@
+"""Idempotency-Key support for POST handlers.
+
+The first request with a key inserts (user, key) into idempotency_keys inside the handler's
+transaction and stores its response there before committing. A retry with the same key hits the
+primary key: it waits for the first request's transaction, then replays the stored response, so
+the work is done once even when both arrive together. A failed request rolls back and frees the
+key. Reusing a key for a different request body is rejected with 422.
+
+A key expires IDEMPOTENCY_KEY_TTL_HOURS after it was first used: a request that finds an expired
+key takes it over as a new one. The job worker's housekeeping deletes expired keys in batches.
+
+    python idempotency.py --prune   # drop every expired key now
+"""
+import argparse
+import hashlib
+import json
+import MySQLdb
+from flask import Response, current_app, request
+from config import mysql
+from serialize import dumps
+
+MAX_KEY_LENGTH = 64
+
+
+def request_key():
+    # None when the client sent no key; ValueError for an unusable one
+    key = request.headers.get('Idempotency-Key')
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+    return key
+
+
+def fingerprint():
+    body = json.dumps(request.get_json(silent=True), sort_keys=True)
+    return hashlib.sha256(f"{request.method} {request.path} {body}".encode('utf-8')).hexdigest()
+
+
+CLAIM_INSERT = "INSERT INTO idempotency_keys (user_id, idem_key, fingerprint) VALUES (%s, %s, %s)"
+REPLAY_QUERY = (
+    "SELECT fingerprint, status_code, response, created_at < NOW() - INTERVAL %s HOUR FROM idempotency_keys "
+    "WHERE user_id=%s AND idem_key=%s FOR SHARE"
+)
+PRUNE_QUERY = "DELETE FROM idempotency_keys WHERE created_at < NOW() - INTERVAL %s HOUR LIMIT %s"
+
+
+def claim(cursor, user_id, key):
+    # Returns None when this request owns the key, otherwise the response to send instead
+    digest = fingerprint()
+    try:
+        cursor.execute(CLAIM_INSERT, (user_id, key, digest))
+        return None
+    except MySQLdb.IntegrityError:
+        pass
+    # Locking read: sees the committed row even if this transaction already holds a snapshot
+    cursor.execute(REPLAY_QUERY, (current_app.config['IDEMPOTENCY_KEY_TTL_HOURS'], user_id, key))
+    row = cursor.fetchone()
+    if row is None or row[3]:
+        # Expired (or pruned meanwhile): the key is free again, whether or not a prune got to it
+        cursor.execute("DELETE FROM idempotency_keys WHERE user_id=%s AND idem_key=%s", (user_id, key))
+        cursor.execute(CLAIM_INSERT, (user_id, key, digest))
+        return None
+    if row[0] != digest:
+        body = {"error": "Idempotency-Key was already used for a different request"}
+        return Response(dumps(body), status=422, mimetype='application/json')
+    response = Response(row[2], status=row[1], mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def store(cursor, user_id, key, body, status):
+    # Call before the handler commits, so the response and the work it describes commit together
+    cursor.execute(
+        "UPDATE idempotency_keys SET status_code=%s, response=%s WHERE user_id=%s AND idem_key=%s",
+        (status, dumps(body), user_id, key)
+    )
+
+
+def prune(cursor, ttl_hours, batch=10000):
+    total = 0
+    while True:
+        cursor.execute(PRUNE_QUERY, (ttl_hours, batch))
+        removed = cursor.rowcount
+        mysql.connection.commit()
+        total += removed
+        if removed < batch:
+            return total
+
+
+def main():
+    from config import app
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prune', action='store_true', required=True)
+    parser.parse_args()
+
+    with app.app_context():
+        cursor = mysql.connection.cursor()
+        removed = prune(cursor, app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+        cursor.close()
+    print(f"pruned {removed} idempotency keys")
+
+
+if __name__ == '__main__':
+    main()
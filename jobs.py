@@ -0,0 +1,304 @@
+"""Durable job queue on the jobs table.
+
+Handlers enqueue work inside their own transaction, so a job exists exactly when the write that
+asked for it commits; worker.py claims and runs it. Failed jobs are retried with exponential
+backoff and moved to job_dead_letters once they run out of attempts.
+
+A claimed job is leased to its worker (locked_by) for JOB_LEASE_SECONDS from locked_at. Long tasks
+renew the lease through report_progress, which bumps locked_at; a job whose lease runs out is
+requeued for another worker, and the first one's completion and failure updates then match no row.
+"""
+import importlib
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from flask import Blueprint, jsonify, current_app, g
+from flask_jwt_extended import jwt_required
+from config import mysql
+from auth import current_principal
+import idempotency
+
+jobs_bp = Blueprint('jobs', __name__)
+log = logging.getLogger('jobs')
+
+TASKS = {}
+# Every module with @task functions; load_tasks imports them all, so a kind is registered whether
+# or not some blueprint happens to import its module
+TASK_MODULES = ('assets', 'maintenance', 'services', 'deletes')
+
+CLAIM_QUERY = (
+    "SELECT id, kind, payload, attempts, max_attempts FROM jobs "
+    "WHERE status='queued' AND run_at <= NOW(3) ORDER BY run_at, id LIMIT 1 FOR UPDATE SKIP LOCKED"
+)
+REQUEUE_EXPIRED = (
+    "UPDATE jobs SET status='queued', locked_by=NULL "
+    "WHERE status='running' AND attempts < max_attempts AND locked_at < NOW(3) - INTERVAL %s SECOND"
+)
+# Expired leases on a job's last attempt: the worker died on it, so it is dead-lettered instead
+EXPIRED_LAST_ATTEMPTS = (
+    "SELECT id FROM jobs WHERE status='running' AND attempts >= max_attempts "
+    "AND locked_at < NOW(3) - INTERVAL %s SECOND FOR UPDATE"
+)
+LEASE_EXPIRED_ERROR = "lease expired on the last attempt"
+
+
+def task(kind):
+    # Registers fn(payload) -> JSON-serializable result; it runs inside an app context and its
+    # writes are committed together with the job's completion
+    def register(fn):
+        TASKS[kind] = fn
+        return fn
+    return register
+
+
+def load_tasks():
+    for name in TASK_MODULES:
+        importlib.import_module(name)
+
+
+def enqueue(cursor, kind, payload=None, created_by=None, delay=0):
+    # Call inside the request's transaction; the job becomes visible to workers on commit
+    if kind not in TASKS:
+        raise KeyError(f"Unknown job kind: {kind}")
+    cursor.execute(
+        "INSERT INTO jobs (kind, payload, created_by, max_attempts, run_at) "
+        "VALUES (%s, %s, %s, %s, NOW(3) + INTERVAL %s SECOND)",
+        (kind, json.dumps(payload or {}), created_by, current_app.config['JOB_MAX_ATTEMPTS'], delay)
+    )
+    return cursor.lastrowid
+
+
+def accepted(job_id, **body):
+    response = jsonify({**body, "job_id": job_id, "status_url": f"/jobs/{job_id}"})
+    response.headers['Location'] = f"/jobs/{job_id}"
+    return response, 202
+
+
+def job_row_to_dict(r):
+    return {
+        "id": r[0],
+        "kind": r[1],
+        "status": r[2],
+        "attempts": r[3],
+        "max_attempts": r[4],
+        "run_at": r[5],
+        "last_error": r[6],
+        "result": json.loads(r[7]) if r[7] else None,
+        "created_at": r[8],
+        "finished_at": r[9],
+        "progress": json.loads(r[10]) if r[10] else None
+    }
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def report_progress(cursor, **progress):
+    # Written on the task's connection, so it becomes visible with the task's next commit, which
+    # also renews the lease; a task that runs longer than JOB_LEASE_SECONDS must commit progress
+    # more often than that
+    job_id = g.get('job_id')
+    if job_id is None:
+        log.info("progress: %s", progress)
+        return
+    cursor.execute(
+        "UPDATE jobs SET progress=%s, locked_at=NOW(3) WHERE id=%s AND locked_by=%s",
+        (json.dumps(progress), job_id, g.job_worker)
+    )
+    if cursor.rowcount == 0:
+        raise LeaseLost(f"job {job_id} was requeued after its lease expired")
+
+
+@jobs_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    principal = current_principal()
+    cursor = mysql.connection.cursor()
+    cursor.execute(
+        "SELECT id, kind, status, attempts, max_attempts, run_at, last_error, result, created_at, finished_at, "
+        "progress, created_by FROM jobs WHERE id=%s", (job_id,)
+    )
+    job = cursor.fetchone()
+    cursor.close()
+    if not job or (not principal.is_company and str(job[11]) != str(principal.user_id)):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_row_to_dict(job)), 200
+
+
+class Worker:
+    def __init__(self, app, concurrency=None):
+        self.app = app
+        config = app.config
+        self.concurrency = concurrency or config['JOB_WORKER_CONCURRENCY']
+        self.poll_interval = config['JOB_POLL_INTERVAL']
+        self.backoff_base = config['JOB_BACKOFF_BASE']
+        self.backoff_max = config['JOB_BACKOFF_MAX']
+        self.lease_seconds = config['JOB_LEASE_SECONDS']
+        self.retention_days = config['JOB_RETENTION_DAYS']
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.housekeeping_lock = threading.Lock()
+        self.next_housekeeping = 0
+
+    def run(self):
+        threads = [
+            threading.Thread(target=self.loop, name=f"job-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for t in threads:
+            t.start()
+        log.info("worker %s started with %d threads", self.name, self.concurrency)
+        for t in threads:
+            t.join()
+        log.info("worker %s stopped", self.name)
+
+    def stop(self, *_):
+        # Finish the jobs in hand, claim no new ones
+        self.stopping.set()
+
+    def loop(self):
+        while not self.stopping.is_set():
+            try:
+                self.housekeeping()
+                with self.app.app_context():
+                    job = self.claim()
+                if job is None:
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                with self.app.app_context():
+                    self.execute(*job)
+            except Exception:
+                log.exception("worker loop error")
+                self.stopping.wait(self.poll_interval)
+
+    def owner(self):
+        # locked_by value: per thread, so a job requeued and claimed again by another thread of
+        # this process is not mistaken for the first run
+        return f"{self.name}/{threading.current_thread().name}"
+
+    def claim(self):
+        # SKIP LOCKED lets concurrent workers claim different rows without waiting on each other
+        cursor = mysql.connection.cursor()
+        cursor.execute(CLAIM_QUERY)
+        job = cursor.fetchone()
+        if job is None:
+            mysql.connection.rollback()
+            cursor.close()
+            return None
+        cursor.execute(
+            "UPDATE jobs SET status='running', attempts=attempts+1, locked_by=%s, locked_at=NOW(3) "
+            "WHERE id=%s AND status='queued'",
+            (self.owner(), job[0])
+        )
+        claimed = cursor.rowcount
+        mysql.connection.commit()
+        cursor.close()
+        if not claimed:
+            return None
+        job_id, kind, payload, attempts, max_attempts = job
+        return job_id, kind, json.loads(payload or '{}'), attempts + 1, max_attempts
+
+    def execute(self, job_id, kind, payload, attempt, max_attempts):
+        fn = TASKS.get(kind)
+        try:
+            if fn is None:
+                raise LookupError(f"No task registered for {kind}")
+            g.job_id = job_id
+            g.job_worker = self.owner()
+            result = fn(payload)
+            cursor = mysql.connection.cursor()
+            cursor.execute(
+                "UPDATE jobs SET status='done', result=%s, last_error=NULL, locked_by=NULL, finished_at=NOW(3) "
+                "WHERE id=%s AND locked_by=%s", (json.dumps(result), job_id, self.owner())
+            )
+            if cursor.rowcount == 0:
+                cursor.close()
+                raise LeaseLost(f"job {job_id} was requeued after its lease expired")
+            mysql.connection.commit()
+            cursor.close()
+            log.info("job %s (%s) done", job_id, kind)
+        except LeaseLost as e:
+            # Another worker owns the job now; leave its row alone
+            mysql.connection.rollback()
+            log.warning("%s (%s); dropping this run", e, kind)
+        except Exception:
+            mysql.connection.rollback()
+            self.fail(job_id, kind, payload, attempt, max_attempts, traceback.format_exc(limit=5), fn is None)
+
+    def fail(self, job_id, kind, payload, attempt, max_attempts, error, permanent=False):
+        # Both updates only apply while this worker still holds the lease
+        cursor = mysql.connection.cursor()
+        if permanent or attempt >= max_attempts:
+            cursor.execute(
+                "UPDATE jobs SET status='dead', last_error=%s, locked_by=NULL, finished_at=NOW(3) "
+                "WHERE id=%s AND locked_by=%s",
+                (error, job_id, self.owner())
+            )
+            if cursor.rowcount == 0:
+                mysql.connection.rollback()
+                cursor.close()
+                log.warning("job %s (%s) failed after its lease expired; left to its new worker", job_id, kind)
+                return
+            cursor.execute(
+                "INSERT INTO job_dead_letters (job_id, kind, payload, attempts, error) VALUES (%s, %s, %s, %s, %s)",
+                (job_id, kind, json.dumps(payload), attempt, error)
+            )
+            log.error("job %s (%s) dead after %d attempts", job_id, kind, attempt)
+        else:
+            # Exponential backoff with jitter so a failing dependency is not hammered in lockstep
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+            cursor.execute(
+                "UPDATE jobs SET status='queued', last_error=%s, locked_by=NULL, "
+                "run_at=NOW(3) + INTERVAL %s MICROSECOND WHERE id=%s AND locked_by=%s",
+                (error, int(delay * 1000000), job_id, self.owner())
+            )
+            if cursor.rowcount == 0:
+                mysql.connection.rollback()
+                cursor.close()
+                log.warning("job %s (%s) failed after its lease expired; left to its new worker", job_id, kind)
+                return
+            log.warning("job %s (%s) failed, retry %d/%d in %.1fs", job_id, kind, attempt, max_attempts, delay)
+        mysql.connection.commit()
+        cursor.close()
+
+    def housekeeping(self):
+        # One thread at a time, at most once a minute: requeue jobs whose worker died (tasks must
+        # therefore tolerate running twice) or dead-letter them if that was their last attempt,
+        # drop finished jobs past retention and expired idempotency keys
+        with self.housekeeping_lock:
+            now = time.monotonic()
+            if now < self.next_housekeeping:
+                return
+            self.next_housekeeping = now + min(self.lease_seconds, 60)
+        with self.app.app_context():
+            cursor = mysql.connection.cursor()
+            cursor.execute(REQUEUE_EXPIRED, (self.lease_seconds,))
+            if cursor.rowcount:
+                log.warning("requeued %d jobs with expired leases", cursor.rowcount)
+            cursor.execute(EXPIRED_LAST_ATTEMPTS, (self.lease_seconds,))
+            dead = [r[0] for r in cursor.fetchall()]
+            if dead:
+                ids = "(" + ", ".join(["%s"] * len(dead)) + ")"
+                cursor.execute(
+                    "INSERT INTO job_dead_letters (job_id, kind, payload, attempts, error) "
+                    "SELECT id, kind, payload, attempts, %s FROM jobs WHERE id IN " + ids,
+                    (LEASE_EXPIRED_ERROR, *dead)
+                )
+                cursor.execute(
+                    "UPDATE jobs SET status='dead', last_error=%s, locked_by=NULL, finished_at=NOW(3) WHERE id IN " + ids,
+                    (LEASE_EXPIRED_ERROR, *dead)
+                )
+                log.error("dead-lettered %d jobs whose last attempt's lease expired", len(dead))
+            cursor.execute(
+                "DELETE FROM jobs WHERE status='done' AND finished_at < NOW(3) - INTERVAL %s DAY LIMIT 10000",
+                (self.retention_days,)
+            )
+            cursor.execute(idempotency.PRUNE_QUERY, (self.app.config['IDEMPOTENCY_KEY_TTL_HOURS'], 10000))
+            mysql.connection.commit()
+            cursor.close()
@@ -0,0 +1,433 @@
+"""Seeded load test for every blueprint, producing a diffable JSON baseline.
+
+Local database (any MySQL 8 compatible server works):
+
+    docker run -d --name xform-bench -p 3306:3306 -e MYSQL_ALLOW_EMPTY_PASSWORD=yes \\
+        -e MYSQL_DATABASE=xform_asset_management mysql:8
+
+    python loadtest.py seed --assets 50000 --maintenance 200000 [--reset]
+    APP_RATE_LIMIT_ENABLED=false python main.py &   # or the ASGI / production server under test
+    python loadtest.py run --url http://127.0.0.1:5000 --concurrency 32 --out baseline.json
+    python loadtest.py compare baseline.json current.json
+
+seed empties every table the app writes (see SEED_TABLES), bulk-loads the data, rebuilds the derived
+expiring_assets and asset_maintenance_summary tables, and writes loadtest_seed.json (credentials and
+id ranges) which run reads back. Run the server with
+the rate limiter off: at the default concurrency it would answer most requests with 429. Those are
+counted as throttled, apart from errors and latencies, and compare flags any.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+
+SEED_MANIFEST = 'loadtest_seed.json'
+SEED_PASSWORD = 'loadtest-password'
+# Everything the app writes, so a reseed starts from nothing: the seeded tables, the ones derived
+# from them (rebuilt after seeding) and the logs and queues that name their ids
+SEED_TABLES = (
+    'user_services', 'maintenance_records', 'assets', 'services', 'users', 'expiring_assets',
+    'asset_maintenance_summary', 'change_log', 'jobs', 'job_dead_letters', 'idempotency_keys'
+)
+ASSET_TYPES = ['Laptop', 'Monitor', 'Phone', 'Printer', 'Server', 'Router', 'Tablet']
+ASSET_STATUSES = ['active', 'in_repair', 'retired']
+MAINTENANCE_TYPES = ['inspection', 'repair', 'upgrade', 'cleaning']
+MAINTENANCE_STATUSES = ['open', 'in_progress', 'closed']
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def random_date(start, days):
+    return start + datetime.timedelta(days=random.randrange(days))
+
+
+# ---------------------------------------------------------------- seeding
+
+def insert_batches(cursor, conn, query, rows, batch_size=5000):
+    for i in range(0, len(rows), batch_size):
+        cursor.executemany(query, rows[i:i + batch_size])
+        conn.commit()
+
+
+def seed(args):
+    from config import app, mysql, bcrypt
+    import migrate
+    import maintenance_summary
+    import expiring_assets
+
+    random.seed(args.seed)
+    with app.app_context():
+        migrate.upgrade()
+        conn = mysql.connection
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users")
+        if cursor.fetchone()[0] and not args.reset:
+            raise SystemExit("Database already has users; pass --reset to wipe it before seeding")
+        for table in SEED_TABLES:
+            cursor.execute("DELETE FROM " + table)
+        conn.commit()
+
+        pw_hash = bcrypt.generate_password_hash(SEED_PASSWORD)
+        users = []
+        for i in range(args.users):
+            role = 'company' if i < max(1, args.users // 100) else 'user'
+            users.append((f"User {i}", f"user{i}", f"user{i}@loadtest.local", f"555-{i:07d}",
+                          f"Company {i % 20}", f"City {i % 50}", pw_hash, role))
+        insert_batches(cursor, conn,
+                       "INSERT INTO users (name, username, email, contact, company_name, location, password_hash, role) "
+                       "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)", users)
+        cursor.execute("SELECT id, role, email FROM users ORDER BY id")
+        user_rows = cursor.fetchall()
+        company_emails = [r[2] for r in user_rows if r[1] == 'company']
+        user_ids = [r[0] for r in user_rows if r[1] == 'user']
+        user_emails = [r[2] for r in user_rows if r[1] == 'user']
+
+        # The first regular user gets a fixed slice of assets so per-user endpoints have data
+        bench_user = user_ids[0]
+        today = datetime.date.today()
+        assets = []
+        for i in range(args.assets):
+            owner = bench_user if i < 200 else random.choice(user_ids)
+            purchased = random_date(today - datetime.timedelta(days=5 * 365), 5 * 365)
+            assets.append((f"{random.choice(ASSET_TYPES)} {i}", random.choice(ASSET_TYPES), f"SN-{i:09d}",
+                           purchased, purchased + datetime.timedelta(days=random.choice([365, 730, 1095])),
+                           random.choice(ASSET_STATUSES), owner))
+        insert_batches(cursor, conn,
+                       "INSERT INTO assets (asset_name, asset_type, serial_number, purchase_date, warranty_expiry, "
+                       "status, assigned_to) VALUES (%s, %s, %s, %s, %s, %s, %s)", assets)
+        cursor.execute("SELECT MIN(id), MAX(id) FROM assets")
+        asset_range = cursor.fetchone()
+        cursor.execute("SELECT id FROM assets WHERE assigned_to=%s", (bench_user,))
+        bench_assets = [r[0] for r in cursor.fetchall()]
+
+        records = []
+        for _ in range(args.maintenance):
+            asset_id = random.choice(bench_assets) if random.random() < 0.01 else random.randint(*asset_range)
+            records.append((asset_id, random_date(today - datetime.timedelta(days=3 * 365), 3 * 365),
+                            random.choice(MAINTENANCE_TYPES), f"Tech {random.randrange(50)}",
+                            "Seeded record", random.choice(MAINTENANCE_STATUSES)))
+        insert_batches(cursor, conn,
+                       "INSERT INTO maintenance_records (asset_id, maintenance_date, maintenance_type, performed_by, "
+                       "notes, status) VALUES (%s, %s, %s, %s, %s, %s)", records)
+
+        services = [(f"Service {i}", f"Description of service {i}", datetime.datetime.utcnow())
+                    for i in range(args.services)]
+        insert_batches(cursor, conn,
+                       "INSERT INTO services (service_name, description, created_at) VALUES (%s, %s, %s)", services)
+        cursor.execute("SELECT id FROM services")
+        service_ids = [r[0] for r in cursor.fetchall()]
+
+        requests_ = [(random.choice(user_ids), random.choice(service_ids)) for _ in range(args.service_requests)]
+        insert_batches(cursor, conn, "INSERT INTO user_services (user_id, service_id) VALUES (%s, %s)", requests_)
+
+        # The bulk inserts bypass the handlers that keep these current
+        expiring = expiring_assets.rebuild(cursor, app.config['EXPIRY_DIGEST_WINDOW_DAYS'])
+        summarized = maintenance_summary.rebuild(cursor)
+        conn.commit()
+
+        cursor.execute("SELECT MIN(id), MAX(id) FROM users")
+        user_range = cursor.fetchone()
+        cursor.execute("SELECT MIN(id), MAX(id) FROM maintenance_records")
+        maintenance_range = cursor.fetchone()
+        cursor.close()
+
+    manifest = {
+        "password": SEED_PASSWORD,
+        "company_email": company_emails[0],
+        "user_email": user_emails[0],
+        "bench_user_id": bench_user,
+        "bench_asset_ids": bench_assets,
+        "user_id_range": list(user_range),
+        "asset_id_range": list(asset_range),
+        "maintenance_id_range": list(maintenance_range),
+        "counts": {
+            "users": args.users, "assets": args.assets, "maintenance_records": args.maintenance,
+            "services": args.services, "user_services": args.service_requests,
+            "expiring_assets": expiring, "asset_maintenance_summary": summarized
+        }
+    }
+    with open(args.manifest, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Seeded {manifest['counts']}; manifest written to {args.manifest}")
+
+
+# ---------------------------------------------------------------- driving
+
+class Client:
+    def __init__(self, base_url):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.conn = None
+
+    def request(self, method, path, body=None, token=None):
+        # Returns (status, parsed body or None, db query count from Server-Timing or None)
+        headers = {}
+        if token:
+            headers['Authorization'] = 'Bearer ' + token
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body, headers)
+                resp = self.conn.getresponse()
+                raw = resp.read()
+                break
+            except (OSError, http.client.HTTPException):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        match = SERVER_TIMING_QUERIES.search(resp.getheader('Server-Timing') or '')
+        try:
+            parsed = json.loads(raw) if raw else None
+        except ValueError:
+            parsed = None
+        return resp.status, parsed, int(match.group(1)) if match else None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+def login(base_url, email, password):
+    client = Client(base_url)
+    status, body, _ = client.request('POST', '/login', {"email": email, "password": password})
+    client.close()
+    if status != 200:
+        raise SystemExit(f"Login failed against {base_url}: {body}")
+    return body['access_token']
+
+
+def scenarios(manifest, company_token, user_token):
+    # name -> (method, path factory, body factory, token)
+    asset_lo, asset_hi = manifest['asset_id_range']
+    user_lo, user_hi = manifest['user_id_range']
+    bench_assets = manifest['bench_asset_ids']
+    counter = iter(range(10 ** 9))
+
+    def new_asset():
+        n = next(counter)
+        return {"asset_name": f"Bench {n}", "asset_type": "Laptop", "serial_number": f"BENCH-{time.time_ns()}-{n}",
+                "purchase_date": "2024-01-01", "warranty_expiry": "2027-01-01", "user_id": manifest['bench_user_id']}
+
+    def updated_asset():
+        return dict(new_asset(), status=random.choice(ASSET_STATUSES))
+
+    def new_record():
+        return {"maintenance_date": "2025-06-01", "maintenance_type": "inspection",
+                "performed_by": "Bench", "status": "open", "notes": "load test"}
+
+    login_body = {"email": manifest['user_email'], "password": manifest['password']}
+    return {
+        'users.login': ('POST', lambda: '/login', lambda: login_body, None),
+        'users.profile': ('GET', lambda: '/profile', None, user_token),
+        'users.list': ('GET', lambda: '/users', None, company_token),
+        'users.detail': ('GET', lambda: f'/users/{random.randint(user_lo, user_hi)}', None, company_token),
+        'assets.list_company': ('GET', lambda: '/assets?limit=100', None, company_token),
+        'assets.list_user': ('GET', lambda: '/assets', None, user_token),
+        'assets.detail': ('GET', lambda: f'/assets/{random.randint(asset_lo, asset_hi)}', None, company_token),
+        'assets.create': ('POST', lambda: '/assets', new_asset, company_token),
+        'assets.update': ('PUT', lambda: f'/assets/{random.choice(bench_assets)}', updated_asset, company_token),
+        'maintenance.all_company': ('GET', lambda: '/maintenance/all?limit=100', None, company_token),
+        'maintenance.all_user': ('GET', lambda: '/maintenance/all', None, user_token),
+        'maintenance.for_asset': ('GET', lambda: f'/assets/{random.choice(bench_assets)}/maintenance',
+                                  None, user_token),
+        'maintenance.create': ('POST', lambda: f'/assets/{random.choice(bench_assets)}/maintenance',
+                               new_record, user_token),
+        'services.list': ('GET', lambda: '/services', None, None),
+        'services.user_requests': ('GET', lambda: '/user-services', None, user_token),
+    }
+
+
+def drive(base_url, scenario, concurrency, total):
+    method, path_fn, body_fn, token = scenario
+    latencies, queries = [], []
+    errors, throttled = [0], [0]
+    remaining = [total]
+    lock = threading.Lock()
+
+    def worker():
+        client = Client(base_url)
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                status, _, count = client.request(method, path_fn(), body_fn() if body_fn else None, token)
+            except (OSError, http.client.HTTPException):
+                status, count = 599, None
+            elapsed = time.perf_counter() - started
+            with lock:
+                if status == 429:
+                    throttled[0] += 1
+                    continue
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors[0] += 1
+                if count is not None:
+                    queries.append(count)
+        client.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throttled": throttled[0],
+        "rps": round(len(latencies) / wall, 1) if wall else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p90_ms": ms(percentile(latencies, 90)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(max(latencies) if latencies else None),
+        "db_queries_per_request": round(sum(queries) / len(queries), 2) if queries else None
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    random.seed(args.seed)
+    company_token = login(args.url, manifest['company_email'], manifest['password'])
+    user_token = login(args.url, manifest['user_email'], manifest['password'])
+    all_scenarios = scenarios(manifest, company_token, user_token)
+    selected = args.endpoint or list(all_scenarios)
+
+    results = {}
+    for name in selected:
+        if args.warmup:
+            drive(args.url, all_scenarios[name], min(args.concurrency, 4), args.warmup)
+        results[name] = drive(args.url, all_scenarios[name], args.concurrency, args.requests)
+        r = results[name]
+        print(f"{name:<26} {r['rps']:>9} rps  p50 {r['p50_ms']:>8} ms  p99 {r['p99_ms']:>8} ms  "
+              f"queries {r['db_queries_per_request']}  errors {r['errors']}  throttled {r['throttled']}")
+    throttled = sum(r['throttled'] for r in results.values())
+    if throttled:
+        print(f"{throttled} requests got 429; restart the server with APP_RATE_LIMIT_ENABLED=false for a usable baseline")
+
+    baseline = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.datetime.utcnow().isoformat() + 'Z',
+            "url": args.url,
+            "concurrency": args.concurrency,
+            "requests_per_endpoint": args.requests,
+            "dataset": manifest['counts']
+        },
+        "endpoints": results
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.out}")
+
+
+def compare(args):
+    # Exits non-zero when throughput drops, p99 grows or query counts grow beyond the threshold
+    with open(args.old) as f:
+        old = json.load(f)['endpoints']
+    with open(args.new) as f:
+        new = json.load(f)['endpoints']
+
+    def delta(a, b):
+        if a in (None, 0) or b is None:
+            return None
+        return (b - a) / a * 100
+
+    regressions = 0
+    print(f"{'endpoint':<26} {'rps':>18} {'p99 ms':>20} {'queries':>14}")
+    for name in sorted(set(old) & set(new)):
+        o, n = old[name], new[name]
+        rps, p99 = delta(o['rps'], n['rps']), delta(o['p99_ms'], n['p99_ms'])
+        flags = []
+        if rps is not None and rps < -args.threshold:
+            flags.append('rps')
+        if p99 is not None and p99 > args.threshold:
+            flags.append('p99')
+        if (n['db_queries_per_request'] or 0) > (o['db_queries_per_request'] or 0):
+            flags.append('queries')
+        if n.get('throttled'):
+            flags.append('throttled')
+        regressions += bool(flags)
+        fmt = lambda d: f"{d:+.1f}%" if d is not None else "n/a"
+        print(f"{name:<26} {o['rps']:>8}->{n['rps']:<8}{fmt(rps):>8}  {o['p99_ms']:>8}->{n['p99_ms']:<8}{fmt(p99):>8}  "
+              f"{o['db_queries_per_request']}->{n['db_queries_per_request']}  {' '.join(flags)}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('seed', help='create the schema and load a synthetic dataset')
+    p.add_argument('--users', type=int, default=1000)
+    p.add_argument('--assets', type=int, default=50000)
+    p.add_argument('--maintenance', type=int, default=200000)
+    p.add_argument('--services', type=int, default=50)
+    p.add_argument('--service-requests', type=int, default=20000)
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--manifest', default=SEED_MANIFEST)
+    p.add_argument('--reset', action='store_true', help='delete existing rows from the seeded tables first')
+
+    p = sub.add_parser('run', help='drive every endpoint and record a baseline')
+    p.add_argument('--url', default='http://127.0.0.1:5000')
+    p.add_argument('--concurrency', type=int, default=16)
+    p.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    p.add_argument('--warmup', type=int, default=20)
+    p.add_argument('--endpoint', action='append', help='only run the named scenario (repeatable)')
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--manifest', default=SEED_MANIFEST)
+    p.add_argument('--out')
+
+    p = sub.add_parser('compare', help='diff two baselines')
+    p.add_argument('old')
+    p.add_argument('new')
+    p.add_argument('--threshold', type=float, default=10.0, help='allowed change in percent')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args)
+    elif args.command == 'run':
+        run(args)
+    else:
+        raise SystemExit(compare(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,42 @@
 from flask import Flask
 from flask_cors import CORS
-from config import app  # Ensure app is created in config.py
+from flask_jwt_extended import jwt_required
+from config import app, limiter  # Ensure app is created in config.py
 from users import user_bp
 from assets import assets_bp
 from services import services_bp
 from maintenance import maintenance_bp
+from changes import changes_bp
+from jobs import jobs_bp, load_tasks
+from db import PoolTimeout
+from hashing import HashingBusy
+from auth import current_principal
 
 # Enable CORS
 CORS(app, supports_credentials=True)
 
+# Rate-limit every blueprint; must happen before registration
+for bp in (user_bp, assets_bp, services_bp, maintenance_bp, changes_bp, jobs_bp):
+    limiter.protect(bp)
+
 # Register blueprints ONLY ONCE
 app.register_blueprint(user_bp)
 app.register_blueprint(assets_bp)
 app.register_blueprint(services_bp)
 app.register_blueprint(maintenance_bp)
+app.register_blueprint(changes_bp)
+app.register_blueprint(jobs_bp)
+
+# Register every job task, for the handlers that enqueue them and for worker.py
+load_tasks()
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    return {"error": "Database busy, try again"}, 503, {"Retry-After": "1"}
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    return {"error": "Server busy, try again"}, 503, {"Retry-After": "1"}
 
 @app.route('/test_db')
 def test_db():
@@ -27,5 +50,30 @@ def test_db():
     except Exception as e:
         return {"error": str(e)}, 500
 
+# Operational stats, company only; each answers for the worker process that serves the request
+@app.route('/db_pool')
+@jwt_required()
+def db_pool():
+    if not current_principal().is_company:
+        return {"error": "Unauthorized"}, 403
+    from config import mysql
+    return mysql.stats()
+
+@app.route('/hash_pool')
+@jwt_required()
+def hash_pool():
+    if not current_principal().is_company:
+        return {"error": "Unauthorized"}, 403
+    from config import bcrypt
+    return bcrypt.stats()
+
+@app.route('/rate_limit')
+@jwt_required()
+def rate_limit():
+    if not current_principal().is_company:
+        return {"error": "Unauthorized"}, 403
+    from config import limiter
+    return limiter.stats()
+
 if __name__ == "__main__":
     app.run(debug=True)
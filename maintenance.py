@@ -1,70 +1,114 @@
 from flask import request, jsonify, Blueprint
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
+import MySQLdb.cursors
 from config import mysql
+from auth import current_principal
+from pagination import page_args, page_response, stream_rows, DEFAULT_LIMIT, MAX_LIMIT
+import maintenance_summary
+import changes
+import jobs
+from batch import batch_ids, fetch_by_ids, batch_response
+from serialize import row_mapper
+from patch import patch_changes, precondition_failed, changed_columns, set_clause, conflict_status, with_etag
 
 maintenance_bp = Blueprint('maintenance', __name__)
 
+
+MAINTENANCE_PATCH_FIELDS = {
+    k: k for k in ('maintenance_date', 'maintenance_type', 'performed_by', 'notes', 'status')
+}
+MAINTENANCE_LIST_NAMES = (
+    'id', 'maintenance_date', 'maintenance_type', 'performed_by', 'notes',
+    'created_at', 'status', 'asset_id', 'asset_name'
+)
+_maintenance_row = row_mapper(MAINTENANCE_LIST_NAMES)
+
+
+MAINTENANCE_FOR_ASSET_QUERY = (
+    "SELECT id, maintenance_date, maintenance_type, performed_by, notes, created_at, status "
+    "FROM maintenance_records WHERE asset_id=%s"
+)
+MAINTENANCE_DETAIL_QUERY = """
+    SELECT mr.id, mr.maintenance_date, mr.maintenance_type, mr.performed_by, mr.notes, mr.created_at, mr.status,
+           mr.version, mr.asset_id
+    FROM maintenance_records mr
+    JOIN assets a ON mr.asset_id = a.id
+    WHERE mr.id = %s AND a.assigned_to = %s AND a.deleted_at IS NULL
+"""
+# Locks a record the caller may write and reads what the summary delta needs
+MAINTENANCE_LOCK_QUERY = """
+    SELECT mr.asset_id, mr.status, mr.maintenance_date FROM maintenance_records mr
+    JOIN assets a ON mr.asset_id = a.id
+    WHERE mr.id = %s AND a.assigned_to = %s AND a.deleted_at IS NULL
+    FOR UPDATE
+"""
+MAINTENANCE_UPDATE = """
+    UPDATE maintenance_records mr
+    JOIN assets a ON mr.asset_id = a.id
+    SET mr.maintenance_date=%s, mr.maintenance_type=%s, mr.performed_by=%s, mr.notes=%s, mr.status=%s,
+        mr.version=mr.version+1
+    WHERE mr.id = %s AND a.assigned_to = %s AND a.deleted_at IS NULL
+"""
+
+def maintenance_row_to_dict(r):
+    record = _maintenance_row(r)
+    if not record['asset_name']:
+        record['asset_name'] = f"# {r[7]}"  # Fallback if name is None
+    return record
+
 # Get all maintenance records for a specific asset
 @maintenance_bp.route('/assets/<int:asset_id>/maintenance', methods=['GET'])
 @jwt_required()
 def get_maintenance(asset_id):
-    user_id = get_jwt_identity()
+    user_id = current_principal().user_id
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id FROM assets WHERE id=%s AND assigned_to=%s", (asset_id, user_id))
+    cursor.execute("SELECT id FROM assets WHERE id=%s AND assigned_to=%s AND deleted_at IS NULL", (asset_id, user_id))
     if not cursor.fetchone():
         cursor.close()
         return jsonify({"error": "Asset not found or not authorized"}), 404
 
-    cursor.execute(
-        "SELECT id, maintenance_date, maintenance_type, performed_by, notes, created_at, status FROM maintenance_records WHERE asset_id=%s",
-        (asset_id,)
-    )
+    cursor.execute(MAINTENANCE_FOR_ASSET_QUERY, (asset_id,))
+    to_dict = row_mapper(cursor.description)
     records = cursor.fetchall()
     cursor.close()
 
-    return jsonify([{
-        "id": r[0],
-        "maintenance_date": str(r[1]),
-        "maintenance_type": r[2],
-        "performed_by": r[3],
-        "notes": r[4],
-        "created_at": str(r[5]),
-        "status": r[6]
-    } for r in records])
+    return jsonify([to_dict(r) for r in records])
 
 
 # Add maintenance record
 @maintenance_bp.route('/assets/<int:asset_id>/maintenance', methods=['POST'])
 @jwt_required()
 def add_maintenance(asset_id):
-    user_id = get_jwt_identity()
+    user_id = current_principal().user_id
     data = request.get_json()
 
     required_fields = ['maintenance_date', 'maintenance_type', 'performed_by', 'status']
     if not all(field in data and data[field] for field in required_fields):
         return jsonify({"error": "Missing required fields"}), 400
 
+    # Insert only if the asset belongs to the caller, in one statement
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id FROM assets WHERE id=%s AND assigned_to=%s", (asset_id, user_id))
-    if not cursor.fetchone():
-        cursor.close()
-        return jsonify({"error": "Asset not found or not authorized"}), 404
-
     cursor.execute(
         '''
-        INSERT INTO maintenance_records 
+        INSERT INTO maintenance_records
         (asset_id, maintenance_date, maintenance_type, performed_by, notes, status)
-        VALUES (%s, %s, %s, %s, %s, %s)
+        SELECT id, %s, %s, %s, %s, %s FROM assets WHERE id=%s AND assigned_to=%s AND deleted_at IS NULL
         ''',
         (
-            asset_id,
             data['maintenance_date'],
             data['maintenance_type'],
             data['performed_by'],
             data.get('notes', ''),
-            data['status']
+            data['status'],
+            asset_id,
+            user_id
         )
     )
+    if cursor.rowcount == 0:
+        cursor.close()
+        return jsonify({"error": "Asset not found or not authorized"}), 404
+    changes.record_maintenance(cursor, cursor.lastrowid, 'create')
+    maintenance_summary.record_added(cursor, asset_id, data['status'], data['maintenance_date'])
     mysql.connection.commit()
     cursor.close()
 
@@ -75,15 +119,10 @@ def add_maintenance(asset_id):
 @maintenance_bp.route('/maintenance/<int:maintenance_id>', methods=['GET'])
 @jwt_required()
 def get_maintenance_detail(maintenance_id):
-    user_id = get_jwt_identity()
+    user_id = current_principal().user_id
     cursor = mysql.connection.cursor()
 
-    cursor.execute('''
-        SELECT mr.id, mr.maintenance_date, mr.maintenance_type, mr.performed_by, mr.notes, mr.created_at, mr.status
-        FROM maintenance_records mr
-        JOIN assets a ON mr.asset_id = a.id
-        WHERE mr.id = %s AND a.assigned_to = %s
-    ''', (maintenance_id, user_id))
+    cursor.execute(MAINTENANCE_DETAIL_QUERY, (maintenance_id, user_id))
 
     record = cursor.fetchone()
     cursor.close()
@@ -91,7 +130,10 @@ def get_maintenance_detail(maintenance_id):
     if not record:
         return jsonify({"error": "Maintenance record not found or not authorized"}), 404
 
-    return jsonify({
+    return with_etag(jsonify(maintenance_detail_to_dict(record)), record[7])
+
+def maintenance_detail_to_dict(record):
+    return {
         "id": record[0],
         "maintenance_date": str(record[1]),
         "maintenance_type": record[2],
@@ -99,109 +141,285 @@ def get_maintenance_detail(maintenance_id):
         "notes": record[4],
         "created_at": str(record[5]),
         "status": record[6]
-    })
+    }
+
+@maintenance_bp.route('/maintenance:batchGet', methods=['POST'])
+@jwt_required()
+def batch_get_maintenance():
+    user_id = current_principal().user_id
+    try:
+        ids = batch_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = mysql.connection.cursor()
+    rows = fetch_by_ids(cursor, '''
+        SELECT mr.id, mr.maintenance_date, mr.maintenance_type, mr.performed_by, mr.notes, mr.created_at, mr.status,
+               a.assigned_to
+        FROM maintenance_records mr
+        JOIN assets a ON mr.asset_id = a.id
+        WHERE mr.id IN ({ids}) AND a.deleted_at IS NULL
+    ''', ids)
+    cursor.close()
+
+    # Same rule as get_maintenance_detail: only records on the caller's own assets
+    return jsonify(batch_response(
+        ids, rows, maintenance_detail_to_dict, lambda r: str(r[7]) == str(user_id)
+    )), 200
 
 
 # Update maintenance record
 @maintenance_bp.route('/maintenance/<int:maintenance_id>', methods=['PUT'])
 @jwt_required()
 def update_maintenance(maintenance_id):
-    user_id = get_jwt_identity()
+    user_id = current_principal().user_id
     data = request.get_json()
     cursor = mysql.connection.cursor()
 
-    cursor.execute('''
-        SELECT mr.id FROM maintenance_records mr
-        JOIN assets a ON mr.asset_id = a.id
-        WHERE mr.id = %s AND a.assigned_to = %s
-    ''', (maintenance_id, user_id))
-
-    if not cursor.fetchone():
+    cursor.execute(MAINTENANCE_LOCK_QUERY, (maintenance_id, user_id))
+    record = cursor.fetchone()
+    if not record:
+        mysql.connection.rollback()
         cursor.close()
         return jsonify({"error": "Record not found or not authorized"}), 404
-
     cursor.execute(
-        '''
-        UPDATE maintenance_records 
-        SET maintenance_date=%s, maintenance_type=%s, performed_by=%s, notes=%s, status=%s 
-        WHERE id=%s
-        ''',
+        MAINTENANCE_UPDATE,
         (
             data.get('maintenance_date'),
             data.get('maintenance_type'),
             data.get('performed_by'),
             data.get('notes', ''),
             data.get('status'),
-            maintenance_id
+            maintenance_id,
+            user_id
         )
     )
+    maintenance_summary.record_changed(
+        cursor, record[0], record[1], record[2], data.get('status'), data.get('maintenance_date')
+    )
+    changes.record_maintenance(cursor, maintenance_id, 'update')
     mysql.connection.commit()
     cursor.close()
     return jsonify({"message": "Record updated successfully"}), 200
 
 
+# Partial update: only the supplied fields are written, and nothing at all if they already match
+@maintenance_bp.route('/maintenance/<int:maintenance_id>', methods=['PATCH'])
+@jwt_required()
+def patch_maintenance(maintenance_id):
+    user_id = current_principal().user_id
+    try:
+        requested = patch_changes(MAINTENANCE_PATCH_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = mysql.connection.cursor()
+    cursor.execute(MAINTENANCE_DETAIL_QUERY, (maintenance_id, user_id))
+    record = cursor.fetchone()
+    if not record:
+        cursor.close()
+        return jsonify({"error": "Record not found or not authorized"}), 404
+    version = record[7]
+    if precondition_failed(version):
+        cursor.close()
+        return jsonify({"error": "Record has changed since it was read"}), 412
+
+    current = {
+        "maintenance_date": record[1], "maintenance_type": record[2], "performed_by": record[3],
+        "notes": record[4], "status": record[6]
+    }
+    changed = changed_columns(current, requested)
+    if not changed:
+        cursor.close()
+        return with_etag(jsonify(maintenance_detail_to_dict(record)), version), 200
+
+    assignments, params = set_clause(changed)
+    cursor.execute(
+        f"UPDATE maintenance_records SET {assignments} WHERE id = %s AND version = %s",
+        (*params, maintenance_id, version)
+    )
+    if cursor.rowcount == 0:
+        mysql.connection.rollback()
+        cursor.close()
+        return jsonify({"error": "Record was changed concurrently, read it again"}), conflict_status()
+    if changed.keys() & {'maintenance_date', 'status'}:
+        maintenance_summary.record_changed(
+            cursor, record[8], record[6], record[1],
+            changed.get('status', record[6]), changed.get('maintenance_date', record[1])
+        )
+    changes.record_maintenance(cursor, maintenance_id, 'update')
+    mysql.connection.commit()
+    cursor.close()
+
+    current.update(changed)
+    return with_etag(jsonify(maintenance_detail_to_dict((
+        maintenance_id, current['maintenance_date'], current['maintenance_type'], current['performed_by'],
+        current['notes'], record[5], current['status']
+    ))), version + 1), 200
+
+
 # Delete maintenance record
 @maintenance_bp.route('/maintenance/<int:maintenance_id>', methods=['DELETE'])
 @jwt_required()
 def delete_maintenance(maintenance_id):
-    user_id = get_jwt_identity()
+    user_id = current_principal().user_id
     cursor = mysql.connection.cursor()
 
-    cursor.execute('''
-        SELECT mr.id FROM maintenance_records mr
-        JOIN assets a ON mr.asset_id = a.id
-        WHERE mr.id = %s AND a.assigned_to = %s
-    ''', (maintenance_id, user_id))
-
-    if not cursor.fetchone():
+    cursor.execute(MAINTENANCE_LOCK_QUERY, (maintenance_id, user_id))
+    record = cursor.fetchone()
+    if not record:
+        mysql.connection.rollback()
         cursor.close()
         return jsonify({"error": "Record not found or not authorized"}), 404
-
-    cursor.execute("DELETE FROM maintenance_records WHERE id=%s", (maintenance_id,))
+    changes.record_maintenance(cursor, maintenance_id, 'delete')
+    cursor.execute("DELETE FROM maintenance_records WHERE id = %s", (maintenance_id,))
+    maintenance_summary.record_removed(cursor, record[0], record[1], record[2])
     mysql.connection.commit()
     cursor.close()
     return jsonify({"message": "Record deleted successfully"}), 200
 
+def maintenance_summary_row_to_dict(r):
+    return {
+        "asset_id": r[0],
+        "asset_name": r[1],
+        "record_count": r[2] or 0,
+        "open_count": int(r[3] or 0),
+        "last_maintenance_date": str(r[4]) if r[4] else None
+    }
+
+def maintenance_summary_query(role, user_id, ids, limit, after):
+    where, params = ["a.deleted_at IS NULL"], []
+    if role != 'company':
+        where.append("a.assigned_to = %s")
+        params.append(user_id)
+    if ids:
+        where.append("a.id IN (" + ", ".join(["%s"] * len(ids)) + ")")
+        params.extend(ids)
+    if after is not None:
+        where.append("a.id > %s")
+        params.append(after[0])
+
+    query = """
+        SELECT a.id, a.asset_name, s.record_count, s.open_count, s.last_maintenance_date
+        FROM assets a
+        LEFT JOIN asset_maintenance_summary s ON s.asset_id = a.id
+    """
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY a.id"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+    return query, tuple(params)
+
+# Maintenance summaries for many assets at once: ?ids=1,2,3, or every visible asset page by page
+@maintenance_bp.route('/assets/summary', methods=['GET'])
+@jwt_required()
+def get_maintenance_summaries():
+    principal = current_principal()
+    user_id, role = principal.user_id, principal.role
+
+    try:
+        limit, after, _ = page_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+    except ValueError:
+        return jsonify({"error": "ids must be a comma-separated list of integers"}), 400
+    if len(ids) > MAX_LIMIT:
+        return jsonify({"error": f"At most {MAX_LIMIT} ids per request"}), 400
+    if ids and request.args.get('limit') is None and after is None:
+        # The ids bound the result, so they come back in one list
+        limit = None
+    elif limit is None:
+        # Without ids this lists every visible asset, so it is always paged, even for limit=all
+        limit = DEFAULT_LIMIT
+
+    cursor = mysql.connection.cursor()
+    cursor.execute(*maintenance_summary_query(role, user_id, ids, limit, after))
+    rows = cursor.fetchall()
+    cursor.close()
+    if limit is None:
+        return jsonify([maintenance_summary_row_to_dict(r) for r in rows])
+    return jsonify(page_response(rows, limit, maintenance_summary_row_to_dict, lambda r: [r[0]]))
+
+@jobs.task('maintenance_summary.rebuild')
+def rebuild_maintenance_summaries(payload):
+    cursor = mysql.connection.cursor()
+    rows = maintenance_summary.rebuild(cursor)
+    cursor.close()
+    return {"rows": rows}
+
+@maintenance_bp.route('/assets/summary:rebuild', methods=['POST'])
+@jwt_required()
+def rebuild_maintenance_summaries_async():
+    principal = current_principal()
+    if not principal.is_company:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    cursor = mysql.connection.cursor()
+    job_id = jobs.enqueue(cursor, 'maintenance_summary.rebuild', created_by=principal.user_id)
+    mysql.connection.commit()
+    cursor.close()
+    return jobs.accepted(job_id)
+
+def maintenance_list_query(user_role, user_id, limit, after, stream):
+    # Shared with the async entry point (asgi.py)
+    where, params = ["a.deleted_at IS NULL"], []
+    if user_role != "company":
+        where.append("a.assigned_to = %s")
+        params.append(user_id)
+
+    # Keyset on (maintenance_date, id), both descending
+    if after is not None:
+        where.append("(mr.maintenance_date < %s OR (mr.maintenance_date = %s AND mr.id < %s))")
+        params.extend([after[0], after[0], after[1]])
+
+    query = """
+        SELECT mr.id, mr.maintenance_date, mr.maintenance_type, mr.performed_by, mr.notes,
+               mr.created_at, mr.status, mr.asset_id, a.asset_name
+        FROM maintenance_records mr
+        JOIN assets a ON mr.asset_id = a.id
+    """
+    if where:
+        query += " WHERE " + " AND ".join(where)
+
+    if limit is None and not stream:
+        query += " ORDER BY mr.maintenance_date DESC"
+    else:
+        query += " ORDER BY mr.maintenance_date DESC, mr.id DESC"
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit if stream else limit + 1)
+    return query, tuple(params)
+
+def maintenance_cursor_key(r):
+    return [str(r[1]), r[0]]
+
+
 # Get all maintenance records for company user
 @maintenance_bp.route('/maintenance/all', methods=['GET'])
 @jwt_required()
 def get_all_maintenance():
-    user_id = get_jwt_identity()
-    cursor = mysql.connection.cursor()
+    principal = current_principal()
 
-    # Check user role
-    cursor.execute("SELECT role FROM users WHERE id = %s", (user_id,))
-    user_role = cursor.fetchone()[0]
-
-    if user_role == "company":
-        cursor.execute("""
-            SELECT mr.id, mr.maintenance_date, mr.maintenance_type, mr.performed_by, mr.notes, 
-                   mr.created_at, mr.status, mr.asset_id, a.name
-            FROM maintenance_records mr
-            JOIN assets a ON mr.asset_id = a.id
-            ORDER BY mr.maintenance_date DESC
-        """)
-    else:
-        cursor.execute("""
-            SELECT mr.id, mr.maintenance_date, mr.maintenance_type, mr.performed_by, mr.notes, 
-                   mr.created_at, mr.status, mr.asset_id, a.name
-            FROM maintenance_records mr
-            JOIN assets a ON mr.asset_id = a.id
-            WHERE a.assigned_to = %s
-            ORDER BY mr.maintenance_date DESC
-        """, (user_id,))
+    try:
+        limit, after, stream = page_args(cursor_size=2)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query, params = maintenance_list_query(principal.role, principal.user_id, limit, after, stream)
 
+    if stream:
+        cursor = mysql.read_connection.cursor(MySQLdb.cursors.SSCursor)
+        cursor.execute(query, params)
+        return stream_rows(cursor, maintenance_row_to_dict, stream)
+
+    cursor = mysql.read_connection.cursor()
+    cursor.execute(query, params)
     records = cursor.fetchall()
     cursor.close()
-
-    return jsonify([{
-        "id": r[0],
-        "maintenance_date": str(r[1]),
-        "maintenance_type": r[2],
-        "performed_by": r[3],
-        "notes": r[4],
-        "created_at": str(r[5]),
-        "status": r[6],
-        "asset_id": r[7],
-        "asset_name": r[8] or f"# {r[7]}"  # Fallback if name is None
-    } for r in records])
+    if limit is None:
+        return jsonify([maintenance_row_to_dict(r) for r in records])
+    return jsonify(page_response(records, limit, maintenance_row_to_dict, maintenance_cursor_key))
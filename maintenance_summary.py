@@ -0,0 +1,96 @@
+"""Materialized per-asset maintenance summary.
+
+asset_maintenance_summary holds, for every asset with maintenance history, the record count, the
+number of records not yet closed and the latest maintenance date. The maintenance write paths
+apply each change to the asset's row as a delta inside their own transaction: the counts move by
+the record added, changed or removed, and the date by GREATEST. Only when the record holding the
+latest date moves back or goes away is MAX(maintenance_date) read again, a single probe of
+idx_maintenance_asset_date. A write never re-reads the asset's history, so the table needs no
+periodic job; --rebuild exists to recover from drift, e.g. after rows were edited by hand.
+
+    python maintenance_summary.py --rebuild
+"""
+import argparse
+import logging
+
+# Statuses that count as done; anything else is open. The column collation is case-insensitive.
+CLOSED_STATUSES = ('closed', 'completed', 'done', 'cancelled')
+
+SUMMARY_SELECT = (
+    "SELECT asset_id, COUNT(*), "
+    "SUM(status NOT IN (" + ", ".join(["%s"] * len(CLOSED_STATUSES)) + ")), "
+    "MAX(maintenance_date) FROM maintenance_records"
+)
+SUMMARY_REPLACE = (
+    "REPLACE INTO asset_maintenance_summary "
+    "(asset_id, record_count, open_count, last_maintenance_date) "
+)
+SUMMARY_DELTA = (
+    "INSERT INTO asset_maintenance_summary (asset_id, record_count, open_count, last_maintenance_date) "
+    "VALUES (%s, %s, %s, %s) ON DUPLICATE KEY UPDATE "
+    "record_count = record_count + VALUES(record_count), open_count = open_count + VALUES(open_count), "
+    "last_maintenance_date = GREATEST(COALESCE(last_maintenance_date, VALUES(last_maintenance_date)), "
+    "COALESCE(VALUES(last_maintenance_date), last_maintenance_date))"
+)
+LAST_DATE_QUERY = "SELECT MAX(maintenance_date) FROM maintenance_records WHERE asset_id=%s"
+# Re-reads the latest date only when the given date was it
+LAST_DATE_REFRESH = (
+    "UPDATE asset_maintenance_summary SET last_maintenance_date = (" + LAST_DATE_QUERY + ") "
+    "WHERE asset_id=%s AND last_maintenance_date = %s"
+)
+
+
+def is_open(status):
+    return 0 if (status or '').lower() in CLOSED_STATUSES else 1
+
+
+def apply_delta(cursor, asset_id, records, open_records, added_date=None, removed_date=None):
+    # Call inside the transaction that changed the asset's maintenance records, after the change
+    cursor.execute(SUMMARY_DELTA, (asset_id, records, open_records, added_date))
+    if removed_date is not None:
+        cursor.execute(LAST_DATE_REFRESH, (asset_id, asset_id, removed_date))
+    if records < 0:
+        cursor.execute("DELETE FROM asset_maintenance_summary WHERE asset_id=%s AND record_count <= 0", (asset_id,))
+
+
+def record_added(cursor, asset_id, status, maintenance_date):
+    apply_delta(cursor, asset_id, 1, is_open(status), added_date=maintenance_date)
+
+
+def record_changed(cursor, asset_id, old_status, old_date, status, maintenance_date):
+    apply_delta(cursor, asset_id, 0, is_open(status) - is_open(old_status),
+                added_date=maintenance_date, removed_date=old_date)
+
+
+def record_removed(cursor, asset_id, status, maintenance_date):
+    apply_delta(cursor, asset_id, -1, -is_open(status), removed_date=maintenance_date)
+
+
+def remove_asset(cursor, asset_id):
+    cursor.execute("DELETE FROM asset_maintenance_summary WHERE asset_id=%s", (asset_id,))
+
+
+def rebuild(cursor):
+    cursor.execute("DELETE FROM asset_maintenance_summary")
+    cursor.execute(SUMMARY_REPLACE + SUMMARY_SELECT + " GROUP BY asset_id", CLOSED_STATUSES)
+    return cursor.rowcount
+
+
+def main():
+    from config import app, mysql
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rebuild', action='store_true', required=True)
+    parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    with app.app_context():
+        cursor = mysql.connection.cursor()
+        count = rebuild(cursor)
+        mysql.connection.commit()
+        cursor.close()
+    logging.getLogger('maintenance_summary').info("rebuilt: %d assets", count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Schema migrations and query-plan checks.
+
+    python migrate.py status    # list applied / pending migrations
+    python migrate.py upgrade   # apply pending migrations from migrations/
+    python migrate.py check     # EXPLAIN the blueprints' hot queries, fail on unindexed full scans
+                                # (except the whole-table listings in FULL_SCAN_OK)
+"""
+import os
+import re
+import sys
+import MySQLdb
+from config import app, mysql
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# MySQL errors that mean the object is already there (hand-made databases)
+ALREADY_APPLIED = {
+    1050,  # table exists
+    1060,  # duplicate column
+    1061,  # duplicate key name
+}
+
+# Listings that return the whole table by design: a full scan is the plan they need, so check
+# reports it without failing
+FULL_SCAN_OK = {
+    'services.get_services',
+}
+
+# Asset listing variants: (label, role, query args, keyset position)
+ASSET_LIST_CHECKS = [
+    ('assets.list_assets', 'company', {}, None),
+    ('assets.list_assets[page]', 'company', {}, [1000]),
+    ('assets.list_assets[user]', 'user', {}, None),
+    ('assets.list_assets[filter]', 'company', {'asset_type': 'Laptop', 'status': 'active'}, None),
+    ('assets.list_assets[warranty]', 'company',
+     {'warranty_from': '2025-01-01', 'warranty_to': '2025-03-01', 'sort': 'warranty_expiry'}, None),
+    ('assets.list_assets[search]', 'company', {'q': 'laptop'}, None),
+    ('assets.list_assets[serial]', 'company', {'serial': 'SN-00'}, None),
+]
+
+
+def check_queries():
+    # Built from the SQL constants and query builders the handlers use, so the check follows the
+    # blueprints instead of a hand-kept copy. Imported here: the blueprints need the app config.
+    import assets
+    import changes
+    import deletes
+    import idempotency
+    import jobs
+    import maintenance
+    import maintenance_summary
+    import services
+    import users
+
+    queries = [
+        ('users.login', users.LOGIN_QUERY, ('a@b.c',)),
+        ('users.register', users.EMAIL_TAKEN_QUERY, ('a@b.c',)),
+        ('users.get_users', users.USERS_QUERY, ()),
+        ('users.get_single_user', users.USER_QUERY, (1,)),
+        ('users.delete_user', users.USER_SOFT_DELETE, (1,)),
+        ('deletes.purge_user', deletes.USER_SERVICE_IDS + " LIMIT %s", (1, 500)),
+        ('deletes.purge_user[assets]', deletes.USER_ASSET_IDS + " LIMIT %s", (1, 500)),
+        ('deletes.purge_asset', deletes.ASSET_MAINTENANCE_IDS + " LIMIT %s", (1, 500)),
+    ]
+    for label, role, args, after in ASSET_LIST_CHECKS:
+        queries.append((label, *assets.asset_list_query(role, 1, args, 100, after, None)))
+    queries += [
+        ('assets.get_asset', *assets.asset_detail_query('company', 1, 1)),
+        ('assets.get_asset[user]', *assets.asset_detail_query('user', 1, 1)),
+        ('assets.create_asset', assets.ASSET_INSERT_FOR_USER, ('a', 't', 's', '2024-01-01', '2025-01-01', 1)),
+        ('assets.update_asset', assets.ASSET_UPDATE, ('a', 't', 's', '2024-01-01', '2025-01-01', 'active', 1, 1)),
+        ('assets.delete_asset', assets.ASSET_SOFT_DELETE, (1,)),
+        ('assets.expiry_digest', *assets.expiry_digest_query('company', 'company', 1, 90)),
+        ('assets.expiry_digest[user]', *assets.expiry_digest_query('assignee', 'user', 1, 90)),
+        ('maintenance.get_maintenance', maintenance.MAINTENANCE_FOR_ASSET_QUERY, (1,)),
+        ('maintenance.get_maintenance_detail', maintenance.MAINTENANCE_DETAIL_QUERY, (1, 1)),
+        ('maintenance.update_maintenance', maintenance.MAINTENANCE_UPDATE,
+         ('2025-01-01', 'repair', 'x', '', 'done', 1, 1)),
+        ('maintenance.get_maintenance_summaries', *maintenance.maintenance_summary_query('user', 1, [], 100, None)),
+        ('maintenance.update_maintenance[lock]', maintenance.MAINTENANCE_LOCK_QUERY, (1, 1)),
+        ('maintenance_summary.last_date', maintenance_summary.LAST_DATE_QUERY, (1,)),
+        ('maintenance.get_all_maintenance', *maintenance.maintenance_list_query('company', 1, 100, None, None)),
+        ('maintenance.get_all_maintenance[user]', *maintenance.maintenance_list_query('user', 1, 100, None, None)),
+        ('changes.get_changes', *changes.changes_query(None, 0, 100, 10)),
+        ('changes.get_changes[user]', *changes.changes_query(1, 0, 100, 10)),
+        ('services.get_services', services.SERVICES_QUERY, ()),
+        ('services.service_catalog', services.SERVICE_IDS_QUERY, ()),
+        ('services.get_user_requested_services', services.USER_SERVICES_QUERY, (1,)),
+        ('idempotency.claim', idempotency.REPLAY_QUERY, (24, 1, 'k')),
+        ('jobs.claim', jobs.CLAIM_QUERY, ()),
+        ('jobs.housekeeping', jobs.REQUEUE_EXPIRED, (600,)),
+        ('jobs.housekeeping[dead]', jobs.EXPIRED_LAST_ATTEMPTS, (600,)),
+    ]
+    return queries
+
+
+def split_statements(sql):
+    sql = re.sub(r'^\s*--.*$', '', sql, flags=re.MULTILINE)
+    return [s.strip() for s in sql.split(';') if s.strip()]
+
+
+def available_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = re.match(r'^(\d+)_(\w+)\.sql$', filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def ensure_version_table(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INT PRIMARY KEY, name VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    )
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {r[0] for r in cursor.fetchall()}
+
+
+def status():
+    cursor = mysql.connection.cursor()
+    ensure_version_table(cursor)
+    applied = applied_versions(cursor)
+    cursor.close()
+    for version, name, _ in available_migrations():
+        print(f"{version:04d} {name:<40} {'applied' if version in applied else 'pending'}")
+    return 0
+
+
+def upgrade():
+    cursor = mysql.connection.cursor()
+    ensure_version_table(cursor)
+    applied = applied_versions(cursor)
+    for version, name, path in available_migrations():
+        if version in applied:
+            continue
+        print(f"Applying {version:04d} {name}")
+        with open(path) as f:
+            statements = split_statements(f.read())
+        for statement in statements:
+            try:
+                cursor.execute(statement)
+            except MySQLdb.MySQLError as e:
+                if e.args[0] not in ALREADY_APPLIED:
+                    raise
+                print(f"  skipped (already present): {e.args[1]}")
+        cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+        mysql.connection.commit()
+    cursor.close()
+    return 0
+
+
+def check():
+    # A full scan with no usable index is an error; a full scan the optimizer picked over an
+    # existing index (usually on a near-empty table) is only a warning.
+    failures = 0
+    cursor = mysql.connection.cursor()
+    queries = check_queries()
+    for endpoint, query, params in queries:
+        cursor.execute("EXPLAIN " + query, params)
+        columns = [d[0] for d in cursor.description]
+        for row in cursor.fetchall():
+            plan = dict(zip(columns, row))
+            if plan.get('type') != 'ALL':
+                continue
+            if endpoint in FULL_SCAN_OK:
+                print(f"OK   {endpoint}: full scan on {plan.get('table')} (whole-table listing)")
+            elif plan.get('possible_keys'):
+                print(f"WARN {endpoint}: full scan on {plan.get('table')} although {plan['possible_keys']} exists")
+            else:
+                print(f"FAIL {endpoint}: full scan on {plan.get('table')}, no usable index")
+                failures += 1
+    cursor.close()
+    print(f"{len(queries)} queries checked, {failures} failing")
+    return 1 if failures else 0
+
+
+COMMANDS = {'status': status, 'upgrade': upgrade, 'check': check}
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or sys.argv[1] not in COMMANDS:
+        print(__doc__)
+        sys.exit(2)
+    with app.app_context():
+        sys.exit(COMMANDS[sys.argv[1]]())
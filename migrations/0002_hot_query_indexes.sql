@@ -0,0 +1,16 @@
+-- Indexes for the filters and sorts the blueprints run on every request.
+
+-- login / register lookups
+ALTER TABLE users ADD UNIQUE INDEX idx_users_email (email);
+
+-- list_assets for a user, keyset-paginated on id
+ALTER TABLE assets ADD INDEX idx_assets_assigned_to_id (assigned_to, id);
+
+-- per-asset maintenance history and ownership joins, ordered by date
+ALTER TABLE maintenance_records ADD INDEX idx_maintenance_asset_date (asset_id, maintenance_date);
+
+-- GET /maintenance/all keyset on (maintenance_date DESC, id DESC)
+ALTER TABLE maintenance_records ADD INDEX idx_maintenance_date_id (maintenance_date, id);
+
+-- GET /user-services
+ALTER TABLE user_services ADD INDEX idx_user_services_user (user_id, created_at);
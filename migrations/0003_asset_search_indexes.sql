@@ -0,0 +1,16 @@
+-- Server-side filtering, sorting and search on GET /assets.
+
+-- equality filters, ordered by id for keyset pagination
+ALTER TABLE assets ADD INDEX idx_assets_type_id (asset_type, id);
+ALTER TABLE assets ADD INDEX idx_assets_status_id (status, id);
+
+-- date range filters and sort keys
+ALTER TABLE assets ADD INDEX idx_assets_warranty_id (warranty_expiry, id);
+ALTER TABLE assets ADD INDEX idx_assets_purchase_id (purchase_date, id);
+ALTER TABLE assets ADD INDEX idx_assets_name_id (asset_name, id);
+
+-- serial number prefix lookups
+ALTER TABLE assets ADD INDEX idx_assets_serial (serial_number);
+
+-- word/prefix search over name and serial number
+ALTER TABLE assets ADD FULLTEXT INDEX ft_assets_name_serial (asset_name, serial_number);
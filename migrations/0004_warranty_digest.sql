@@ -0,0 +1,12 @@
+-- Materialized warranty-expiry digest, maintained by warranty_digest.py and the asset write paths.
+
+CREATE TABLE IF NOT EXISTS warranty_digest (
+    asset_id INT PRIMARY KEY,
+    assigned_to INT NULL,
+    company_name VARCHAR(255) NULL,
+    warranty_expiry DATE NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX idx_digest_company (company_name, warranty_expiry),
+    INDEX idx_digest_assignee (assigned_to, warranty_expiry),
+    INDEX idx_digest_expiry (warranty_expiry)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,9 @@
+-- Per-asset maintenance summary, maintained by maintenance_summary.py and the maintenance write paths.
+
+CREATE TABLE IF NOT EXISTS asset_maintenance_summary (
+    asset_id INT PRIMARY KEY,
+    record_count INT NOT NULL DEFAULT 0,
+    open_count INT NOT NULL DEFAULT 0,
+    last_maintenance_date DATE NULL,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,12 @@
+-- Append-only log of asset and maintenance writes, read by GET /changes and /changes/stream.
+
+CREATE TABLE IF NOT EXISTS change_log (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    entity VARCHAR(20) NOT NULL,
+    entity_id INT NOT NULL,
+    op VARCHAR(10) NOT NULL,
+    owner_id INT NULL,
+    changed_at TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    INDEX idx_change_log_owner (owner_id, id),
+    INDEX idx_change_log_changed_at (changed_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
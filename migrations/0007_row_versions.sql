@@ -0,0 +1,5 @@
+-- Row versions for optimistic concurrency: PATCH compares If-Match against them and every write bumps them.
+
+ALTER TABLE assets ADD COLUMN version INT NOT NULL DEFAULT 1;
+ALTER TABLE users ADD COLUMN version INT NOT NULL DEFAULT 1;
+ALTER TABLE maintenance_records ADD COLUMN version INT NOT NULL DEFAULT 1;
@@ -0,0 +1,32 @@
+-- Durable background jobs (jobs.py, worker.py) and the dead-letter table for jobs that ran out of attempts.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(64) NOT NULL,
+    payload TEXT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'queued',
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    locked_by VARCHAR(100) NULL,
+    locked_at DATETIME(3) NULL,
+    last_error TEXT NULL,
+    result TEXT NULL,
+    created_by INT NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    finished_at DATETIME(3) NULL,
+    INDEX idx_jobs_status_run_at (status, run_at),
+    INDEX idx_jobs_status_locked_at (status, locked_at),
+    INDEX idx_jobs_status_finished_at (status, finished_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS job_dead_letters (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    job_id BIGINT NOT NULL,
+    kind VARCHAR(64) NOT NULL,
+    payload TEXT NULL,
+    attempts INT NOT NULL,
+    error TEXT NULL,
+    failed_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    INDEX idx_job_dead_letters_job (job_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
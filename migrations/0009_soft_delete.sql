@@ -0,0 +1,7 @@
+-- Soft delete for assets and users (deletes.py purges the dependent rows in batches), and job progress for GET /jobs/<id>.
+
+ALTER TABLE assets ADD COLUMN deleted_at DATETIME NULL;
+ALTER TABLE assets ADD INDEX idx_assets_deleted_at (deleted_at);
+ALTER TABLE users ADD COLUMN deleted_at DATETIME NULL;
+ALTER TABLE users ADD INDEX idx_users_deleted_at (deleted_at);
+ALTER TABLE jobs ADD COLUMN progress TEXT NULL;
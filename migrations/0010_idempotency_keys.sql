@@ -0,0 +1,12 @@
+-- Idempotency-Key records (idempotency.py): the first request with a key stores its response, retries replay it.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id INT NOT NULL,
+    idem_key VARCHAR(64) NOT NULL,
+    fingerprint CHAR(64) NOT NULL,
+    status_code SMALLINT NULL,
+    response TEXT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, idem_key),
+    INDEX idx_idempotency_created_at (created_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,7 @@
+-- warranty_digest holds one row per expiring asset, not counts: rename it to the expiring-asset index it is (warranty_digest.py).
+
+RENAME TABLE warranty_digest TO expiring_assets;
+ALTER TABLE expiring_assets
+    RENAME INDEX idx_digest_company TO idx_expiring_company,
+    RENAME INDEX idx_digest_assignee TO idx_expiring_assignee,
+    RENAME INDEX idx_digest_expiry TO idx_expiring_expiry;
@@ -0,0 +1,7 @@
+-- Email is unique among live users only, so a soft-deleted account's address can register again before its purge runs.
+
+ALTER TABLE users ADD COLUMN active_email VARCHAR(255) AS (IF(deleted_at IS NULL, email, NULL)) VIRTUAL;
+ALTER TABLE users ADD UNIQUE INDEX idx_users_active_email (active_email);
+ALTER TABLE users DROP INDEX idx_users_email;
+-- login / register lookups
+ALTER TABLE users ADD INDEX idx_users_email (email);
@@ -0,0 +1,115 @@
+import base64
+import json
+from flask import Response, request, stream_with_context
+from serialize import dumps
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_CHUNK_SIZE = 500
+STREAM_FORMATS = ('json', 'ndjson')
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    # Cursors are [sort value, ..., id]: sort values are encoded as strings (None for NULL), the id as an int
+    last_id = values[-1]
+    if isinstance(last_id, bool) or not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    if not all(v is None or isinstance(v, str) for v in values[:-1]):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def page_args(cursor_size=1, args=None):
+    # Returns (limit, after, stream). Without limit a page holds DEFAULT_LIMIT rows; limit is None
+    # for a stream without one and for limit=all, the explicit opt-in to the legacy unpaginated call.
+    args = request.args if args is None else args
+    limit = args.get('limit')
+    after = args.get('after')
+    stream = args.get('stream')
+
+    if stream is not None and stream not in STREAM_FORMATS:
+        raise ValueError("stream must be one of: " + ", ".join(STREAM_FORMATS))
+
+    if limit == 'all':
+        if after is not None:
+            raise ValueError("limit=all cannot be combined with after")
+        limit = None
+    elif limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if limit < 1 or limit > MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    elif stream is None:
+        limit = DEFAULT_LIMIT
+
+    if after is not None:
+        after = decode_cursor(after, cursor_size)
+
+    return limit, after, stream
+
+
+def page_response(rows, limit, serialize, cursor_key):
+    # rows holds up to limit + 1 entries; the extra row only signals that another page exists
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(cursor_key(rows[-1])) if has_more and rows else None
+    return {
+        "items": [serialize(r) for r in rows],
+        "next_cursor": next_cursor
+    }
+
+
+def explain_estimate(description, rows):
+    # Row estimate from EXPLAIN output: rows examined scaled by the filtered percentage
+    columns = [d[0] for d in description]
+    estimate = 0
+    for row in rows:
+        plan = dict(zip(columns, row))
+        examined = plan.get('rows') or 0
+        filtered = plan.get('filtered')
+        estimate = max(estimate, int(examined * (float(filtered) if filtered is not None else 100.0) / 100))
+    return estimate
+
+
+def encode_stream(batches, serialize, fmt):
+    # batches yields lists of rows; yields one encoded chunk per batch
+    first = True
+    if fmt == 'json':
+        yield b'['
+    for rows in batches:
+        if not rows:
+            break
+        if fmt == 'ndjson':
+            yield b''.join(dumps(serialize(r)) + b'\n' for r in rows)
+        else:
+            chunk = b','.join(dumps(serialize(r)) for r in rows)
+            yield chunk if first else b',' + chunk
+        first = False
+    if fmt == 'json':
+        yield b']'
+
+
+def stream_rows(cursor, serialize, fmt):
+    # cursor should be a server-side (unbuffered) cursor with the query already executed
+    def generate():
+        try:
+            yield from encode_stream(iter(lambda: cursor.fetchmany(STREAM_CHUNK_SIZE), ()), serialize, fmt)
+        finally:
+            cursor.close()
+
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
@@ -0,0 +1,46 @@
+from flask import request
+
+
+def patch_changes(fields):
+    # fields maps request keys to columns; returns {column: value} for the keys the client sent
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data:
+        raise ValueError("Expected a JSON object with the fields to change")
+    unknown = sorted(set(data) - set(fields))
+    if unknown:
+        raise ValueError("Unknown or read-only fields: " + ", ".join(unknown))
+    return {fields[k]: v for k, v in data.items()}
+
+
+def precondition_failed(version):
+    # If-Match carries the ETag from a previous GET/PATCH; absent or * means no precondition
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return False
+    return not if_match.contains_weak(str(version))
+
+
+def changed_columns(current, changes):
+    # current maps columns to stored values; dates and numbers compare by their str() form
+    return {
+        column: value for column, value in changes.items()
+        if (current[column] is None) != (value is None) or str(current[column]) != str(value)
+    }
+
+
+def set_clause(changes, alias=''):
+    # SET list for the changed columns plus the version bump that invalidates older ETags
+    assignments = [f"{alias}{column}=%s" for column in changes]
+    assignments.append(f"{alias}version={alias}version+1")
+    return ", ".join(assignments), list(changes.values())
+
+
+def conflict_status():
+    # The version moved between the read and the UPDATE: a failed precondition if the client sent
+    # one, otherwise a plain conflict the client can retry
+    return 412 if request.if_match else 409
+
+
+def with_etag(response, version):
+    response.set_etag(str(version))
+    return response
@@ -0,0 +1,332 @@
+"""Sampling profiler for request handlers.
+
+A sampler thread reads the Python stack of the thread serving a request at a fixed interval
+(sys._current_frames, so the handler itself runs uninstrumented) and counts collapsed stacks:
+one line per distinct stack, frames root first separated by ';', then the sample count. That is
+the input format of flamegraph.pl, speedscope and most flame-graph viewers.
+
+Single request: send X-Profile: 1 with a company token, or arm the next requests to an endpoint
+with POST /debug/profile. The request is sampled every PROFILE_REQUEST_INTERVAL seconds and written
+to PROFILE_DIR; the response names the file in X-Profile-Capture.
+
+Continuous: with PROFILE_CONTINUOUS on, one thread per process samples every in-flight request at
+PROFILE_CONTINUOUS_INTERVAL, with the endpoint as the root frame, and rewrites
+PROFILE_DIR/continuous-<pid>.folded every PROFILE_FLUSH_SECONDS. Collapsed stacks add up, so the
+workers' files can simply be concatenated.
+
+Native ASGI routes (asgi.py) share the event loop thread with every other coroutine, so their
+samples are kept only while the route's handler frame is on the stack and attributed to the Flask
+endpoint of the same name. Time spent awaiting aiomysql is not on any stack; it shows up in the
+Server-Timing header and the SQL metrics instead.
+
+    curl -H "Authorization: Bearer $TOKEN" -H "X-Profile: 1" http://127.0.0.1:5000/maintenance/all
+    curl -H "Authorization: Bearer $TOKEN" -o maintenance.folded \\
+        "http://127.0.0.1:5000/debug/profile?format=folded&endpoint=maintenance.get_all_maintenance"
+    cat profiles/continuous-*.folded | flamegraph.pl > continuous.svg
+
+All /debug/profile routes need a company token.
+"""
+import collections
+import itertools
+import os
+import sys
+import threading
+import time
+from flask import Response, current_app, g, jsonify, request, send_from_directory
+from flask_jwt_extended import get_jwt, jwt_required, verify_jwt_in_request
+from auth import current_principal
+
+TRUE = ('1', 'true', 'yes', 'on')
+_labels = {}
+
+
+def frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+def collapse(frame, require=None):
+    # None when require (a code object) is given and not on the stack
+    stack = []
+    found = require is None
+    while frame is not None:
+        found = found or frame.f_code is require
+        stack.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    if not found:
+        return None
+    stack.reverse()
+    return ';'.join(stack)
+
+
+def render(counts, prefix=None):
+    return ''.join(f"{stack} {n}\n" for stack, n in counts.items() if prefix is None or stack.startswith(prefix))
+
+
+def top_frames(counts, limit=10):
+    # Leaf frames by samples: where the time is actually spent (SQL, JSON encoding, JWT, ...)
+    leaves = collections.Counter()
+    for stack, n in counts.items():
+        leaves[stack.rsplit(';', 1)[-1]] += n
+    return [{"frame": frame, "samples": n} for frame, n in leaves.most_common(limit)]
+
+
+class RequestSampler:
+    # Samples one thread until stop(); the GIL switch interval (5 ms by default) bounds how often
+    # it actually gets to run while the handler is busy in Python code. With code set, only stacks
+    # running that function count, as an event loop thread also runs other requests.
+    def __init__(self, thread_id, interval, code=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.code = code
+        self.counts = collections.Counter()
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+        self._thread.start()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = collapse(frame, self.code)
+            if stack is not None:
+                self.counts[stack] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.monotonic() - self.started
+        return self.counts
+
+
+class Profiler:
+    def __init__(self, app=None):
+        self.directory = 'profiles'
+        self.header = 'X-Profile'
+        self.request_interval = 0.001
+        self.continuous = False
+        self.continuous_interval = 0.05
+        self.flush_seconds = 60
+        self.max_stacks = 20000
+        self.active = {}  # thread id -> endpoint of the request it is serving
+        self.handlers = {}  # code of a native async handler -> its endpoint
+        self.loops = set()  # ids of event loop threads running native handlers
+        self.armed = {}  # endpoint -> requests still to capture
+        self.captures = collections.deque(maxlen=50)
+        self.counts = collections.Counter()
+        self.samples = collections.Counter()
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._sampler_pid = None
+        self._sequence = itertools.count(1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILE_DIR', 'profiles')
+        app.config.setdefault('PROFILE_REQUEST_HEADER', 'X-Profile')
+        app.config.setdefault('PROFILE_REQUEST_INTERVAL', 0.001)
+        app.config.setdefault('PROFILE_CONTINUOUS', False)
+        app.config.setdefault('PROFILE_CONTINUOUS_INTERVAL', 0.05)
+        app.config.setdefault('PROFILE_FLUSH_SECONDS', 60)
+        app.config.setdefault('PROFILE_MAX_STACKS', 20000)
+
+        self.directory = os.path.abspath(app.config['PROFILE_DIR'])
+        self.header = app.config['PROFILE_REQUEST_HEADER']
+        self.request_interval = app.config['PROFILE_REQUEST_INTERVAL']
+        self.continuous = app.config['PROFILE_CONTINUOUS']
+        self.continuous_interval = app.config['PROFILE_CONTINUOUS_INTERVAL']
+        self.flush_seconds = app.config['PROFILE_FLUSH_SECONDS']
+        self.max_stacks = app.config['PROFILE_MAX_STACKS']
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule('/debug/profile', 'debug_profile', jwt_required()(self.profile_view),
+                         methods=['GET', 'POST', 'DELETE'])
+        app.add_url_rule('/debug/profile/captures/<name>', 'debug_profile_capture',
+                         jwt_required()(self.capture_view))
+
+    def requested(self):
+        if request.headers.get(self.header, '').strip().lower() not in TRUE:
+            return False
+        try:
+            return verify_jwt_in_request(optional=True) is not None and get_jwt().get('role') == 'company'
+        except Exception:
+            return False
+
+    def take_armed(self, endpoint):
+        with self._lock:
+            remaining = self.armed.get(endpoint)
+            if not remaining:
+                return False
+            if remaining == 1:
+                del self.armed[endpoint]
+            else:
+                self.armed[endpoint] = remaining - 1
+            return True
+
+    def before_request(self):
+        endpoint = request.endpoint or 'none'
+        thread_id = threading.get_ident()
+        if self.continuous:
+            self.ensure_sampler()
+            self.active[thread_id] = endpoint
+        if (self.armed and self.take_armed(endpoint)) or (self.header in request.headers and self.requested()):
+            g.profile_sampler = RequestSampler(thread_id, self.request_interval)
+
+    def after_request(self, response):
+        sampler = g.pop('profile_sampler', None)
+        if sampler is not None:
+            response.headers['X-Profile-Capture'] = self.save_capture(request.endpoint or 'none', sampler)
+        return response
+
+    def teardown_request(self, exception):
+        self.active.pop(threading.get_ident(), None)
+        sampler = g.pop('profile_sampler', None)
+        if sampler is not None:  # after_request did not run: the handler raised
+            self.save_capture(request.endpoint or 'none', sampler)
+
+    def watch_async(self, handler, endpoint):
+        self.handlers[handler.__code__] = endpoint
+
+    def enter_async(self, endpoint, handler, claims, headers):
+        # Called by asgi.py on the event loop thread before the handler runs; returns the
+        # RequestSampler to pass to save_capture afterwards, or None
+        thread_id = threading.get_ident()
+        if self.continuous:
+            self.ensure_sampler()
+            self.loops.add(thread_id)
+        if (self.armed and self.take_armed(endpoint)) or (
+                headers.get(self.header, '').strip().lower() in TRUE and claims.get('role') == 'company'):
+            return RequestSampler(thread_id, self.request_interval, handler.__code__)
+        return None
+
+    def async_endpoint(self, frame):
+        while frame is not None:
+            endpoint = self.handlers.get(frame.f_code)
+            if endpoint is not None:
+                return endpoint
+            frame = frame.f_back
+        return None
+
+    def save_capture(self, endpoint, sampler):
+        counts = sampler.stop()
+        name = f"request-{endpoint}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(self._sequence)}.folded"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), 'w') as f:
+            f.write(render(counts))
+        self.captures.append({
+            "name": name, "endpoint": endpoint, "samples": sum(counts.values()),
+            "duration_ms": round(sampler.elapsed * 1000, 2)
+        })
+        return name
+
+    def ensure_sampler(self):
+        # Started lazily in each process, so serve.py's preloading master never runs one itself
+        pid = os.getpid()
+        if self._sampler_pid == pid:
+            return
+        with self._lock:
+            if self._sampler_pid != pid:
+                self._sampler_pid = pid
+                threading.Thread(target=self.sample_loop, name='profiler', daemon=True).start()
+
+    def sample_loop(self):
+        me = os.getpid()
+        flushed = time.monotonic()
+        while self._sampler_pid == me:
+            time.sleep(self.continuous_interval)
+            frames = sys._current_frames()
+            for thread_id, endpoint in self.active.copy().items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.record(endpoint + ';' + collapse(frame), endpoint)
+            for thread_id in self.loops.copy():
+                frame = frames.get(thread_id)
+                endpoint = self.async_endpoint(frame)
+                if endpoint is not None:
+                    self.record(endpoint + ';' + collapse(frame), endpoint)
+            del frames
+            if time.monotonic() - flushed >= self.flush_seconds:
+                flushed = time.monotonic()
+                self.flush()
+
+    def record(self, stack, endpoint):
+        with self._lock:
+            if stack not in self.counts and len(self.counts) >= self.max_stacks:
+                self.dropped += 1
+                return
+            self.counts[stack] += 1
+            self.samples[endpoint] += 1
+
+    def flush(self):
+        with self._lock:
+            text = render(self.counts)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"continuous-{os.getpid()}.folded")
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    def stats(self):
+        with self._lock:
+            by_endpoint = collections.defaultdict(collections.Counter)
+            for stack, n in self.counts.items():
+                endpoint, _, rest = stack.partition(';')
+                by_endpoint[endpoint][rest] += n
+            return {
+                "pid": os.getpid(),
+                "continuous": {
+                    "enabled": self.continuous,
+                    "interval": self.continuous_interval,
+                    "stacks": len(self.counts),
+                    "dropped": self.dropped,
+                    "endpoints": {
+                        endpoint: {"samples": self.samples[endpoint], "top": top_frames(counts)}
+                        for endpoint, counts in by_endpoint.items()
+                    }
+                },
+                "armed": dict(self.armed),
+                "captures": list(self.captures)
+            }
+
+    def profile_view(self):
+        if not current_principal().is_company:
+            return jsonify({"error": "Unauthorized"}), 403
+
+        if request.method == 'DELETE':
+            with self._lock:
+                self.counts.clear()
+                self.samples.clear()
+                self.dropped = 0
+            return jsonify({"message": "Profile reset"}), 200
+
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            endpoint = data.get('endpoint')
+            count = data.get('requests', 1)
+            if endpoint not in current_app.view_functions:
+                return jsonify({"error": "Unknown endpoint"}), 400
+            if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= 100:
+                return jsonify({"error": "requests must be an integer from 1 to 100"}), 400
+            with self._lock:
+                self.armed[endpoint] = count
+            return jsonify({"pid": os.getpid(), "armed": dict(self.armed)}), 200
+
+        if request.args.get('format') == 'folded':
+            endpoint = request.args.get('endpoint')
+            with self._lock:
+                text = render(self.counts, endpoint + ';' if endpoint else None)
+            return Response(text, mimetype='text/plain', headers={'X-Profile-Pid': str(os.getpid())})
+        return jsonify(self.stats()), 200
+
+    def capture_view(self, name):
+        if not current_principal().is_company:
+            return jsonify({"error": "Unauthorized"}), 403
+        return send_from_directory(self.directory, name, mimetype='text/plain')
@@ -0,0 +1,176 @@
+import collections
+import logging
+import math
+import threading
+import time
+from flask import jsonify, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from cache import RedisCache
+
+log = logging.getLogger('ratelimit')
+
+# Unauthenticated by nature, so always limited per client address
+IP_ENDPOINTS = ('users.login', 'users.register')
+REJECTED = {"error": "Too many requests, slow down"}
+# role -> [tokens per second, burst]; RATE_LIMITS overrides roles individually, and a role missing
+# from both gets the 'user' limits
+DEFAULT_LIMITS = {'company': [20, 200], 'user': [10, 100], 'anonymous': [2, 60]}
+
+# Refill and take in one round trip; state is {t: tokens, s: last refill time}
+TAKE_SCRIPT = """
+local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 't', 's')
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 's', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+def client_address(remote_addr, forwarded_for, trusted_proxies):
+    # The address trusted_proxies hops back, as ProxyFix(x_for=trusted_proxies) resolves it for the
+    # Flask app; the peer address when there are no trusted proxies or the header is too short
+    if trusted_proxies:
+        hops = [h.strip() for h in (forwarded_for or '').split(',') if h.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return remote_addr
+
+
+def retry_after(wait):
+    return str(math.ceil(wait))
+
+
+class LocalBuckets:
+    # Token buckets for this process, least recently used dropped beyond max_entries; a dropped
+    # bucket comes back full, which only ever errs towards letting a request through
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost, now):
+        # Returns the seconds to wait before cost tokens are available; 0 means taken
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + max(0.0, now - stamp) * rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class RedisBuckets:
+    # Shared by every worker using the same Redis, so a client's limit holds across processes
+    def __init__(self, client, prefix='ratelimit:'):
+        self.script = client.register_script(TAKE_SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, rate, burst, cost, now):
+        return float(self.script(keys=[self.prefix + key], args=[rate, burst, cost, now]))
+
+
+class RateLimiter:
+    # Token bucket per caller: the JWT identity (limits chosen by its role claim), or the client IP
+    # for anonymous requests such as /login and /register. Each endpoint costs RATE_LIMIT_COSTS
+    # tokens (default 1); an empty bucket gets 429 with Retry-After.
+    def __init__(self, app=None, cache=None, jwt=None):
+        self.enabled = True
+        self.limits = {}
+        self.costs = {}
+        self.store = None
+        self.cache = cache
+        self.jwt = jwt
+        self.rejected = 0
+        self.trusted_proxies = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('RATE_LIMITS', dict(DEFAULT_LIMITS))
+        app.config.setdefault('RATE_LIMIT_COSTS', {})
+        app.config.setdefault('RATE_LIMIT_SHARED', False)
+        app.config.setdefault('RATE_LIMIT_MAX_KEYS', 10000)
+        app.config.setdefault('TRUSTED_PROXIES', 0)
+
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        limits = {**DEFAULT_LIMITS, **app.config['RATE_LIMITS']}
+        self.limits = {role: (float(rate), float(burst)) for role, (rate, burst) in limits.items()}
+        self.costs = app.config['RATE_LIMIT_COSTS']
+        self.trusted_proxies = app.config['TRUSTED_PROXIES']
+        self.store = LocalBuckets(app.config['RATE_LIMIT_MAX_KEYS'])
+        if app.config['RATE_LIMIT_SHARED']:
+            backend = self.cache.backend if self.cache is not None else None
+            if isinstance(backend, RedisCache):
+                self.store = RedisBuckets(backend.client)
+            else:
+                app.logger.warning("RATE_LIMIT_SHARED needs CACHE_REDIS_URL; limiting per process")
+
+    def protect(self, blueprint):
+        # Call before the blueprint is registered
+        blueprint.before_request(self.check)
+
+    def identify(self):
+        if request.endpoint in IP_ENDPOINTS:
+            return f"ip:{request.remote_addr}", 'anonymous'
+        # A token this process already verified is looked up by hash; only a new one is fully
+        # verified here, after which the handler's jwt_required finds it cached too
+        header = request.headers.get('Authorization', '')
+        claims = None
+        if header.startswith('Bearer ') and self.jwt is not None:
+            claims = self.jwt.verified_claims(header[7:])
+        if claims is None:
+            try:
+                if verify_jwt_in_request(optional=True) is not None:
+                    claims = get_jwt()
+            except Exception:
+                pass  # a bad token is rejected by jwt_required; until then it counts as anonymous
+        if claims is None:
+            return f"ip:{request.remote_addr}", 'anonymous'
+        return f"user:{claims['sub']}", claims.get('role', 'user')
+
+    def take(self, key, role, endpoint):
+        # Seconds until the caller may send this request, 0 if it may go ahead now; shared by the
+        # blueprint hook and the native routes in asgi.py
+        rate, burst = self.limits.get(role) or self.limits['user']
+        # A cost above the burst could never be paid, so such an endpoint just needs a full bucket
+        cost = min(self.costs.get(endpoint, 1), burst)
+        try:
+            wait = self.store.take(key, rate, burst, cost, time.time())
+        except Exception:
+            log.exception("Rate limit store failed; allowing the request")
+            return 0
+        if wait > 0:
+            with self._lock:
+                self.rejected += 1
+        return wait
+
+    @property
+    def shared(self):
+        return isinstance(self.store, RedisBuckets)
+
+    def check(self):
+        if not self.enabled or request.method == 'OPTIONS':
+            return None
+        key, role = self.identify()
+        wait = self.take(key, role, request.endpoint)
+        if wait <= 0:
+            return None
+        response = jsonify(REJECTED)
+        response.headers['Retry-After'] = retry_after(wait)
+        return response, 429
+
+    def stats(self):
+        return {"enabled": self.enabled, "rejected": self.rejected, "shared": self.shared}
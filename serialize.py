@@ -0,0 +1,44 @@
+import datetime
+import decimal
+import json
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    # Dates keep the str() form the API has always returned ('2025-01-31', '2025-01-31 09:30:00')
+    if isinstance(obj, (datetime.date, datetime.time, datetime.timedelta, decimal.Decimal)):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def row_mapper(columns):
+    # columns is a cursor.description or a sequence of output names; resolved once per query, not per row
+    names = tuple(c if isinstance(c, str) else c[0] for c in columns)
+    return lambda row: dict(zip(names, row))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify() and current_app.json.dumps() through orjson when it is installed
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
@@ -0,0 +1,107 @@
+"""Production server.
+
+Runs the app under gunicorn with SERVER_WORKERS processes (default: one per CPU core) of
+SERVER_THREADS threads each. The app is imported once in the master before forking, so workers
+share its pages; each worker opens its own database connections on first use (see db.py). A worker
+is replaced after SERVER_MAX_REQUESTS requests, plus jitter so they do not all restart together.
+
+    python serve.py
+    kill -HUP <master pid>   # re-import the code, start new workers, then retire the old ones gracefully
+
+Startup time and the RSS of the master and of every worker are logged at boot, and a worker's RSS
+again when it is recycled.
+"""
+import os
+import resource
+import sys
+import time
+import traceback
+
+STARTED = time.monotonic()
+
+from gunicorn.app.base import BaseApplication
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # No procfs: fall back to the peak, which Linux and BSD report in KiB
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_app():
+    # Drop this project's modules first so a reload imports the current code, not the cached one
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if path and name not in ('__main__', __name__) and os.path.dirname(os.path.abspath(path)) == PROJECT_DIR:
+            del sys.modules[name]
+    from main import app
+    return app
+
+
+def when_ready(server):
+    server.log.info("app loaded in %.2fs, master RSS %.1f MB", server.app.load_seconds, rss_mb())
+
+
+def post_worker_init(worker):
+    worker.log.info("worker %s ready, RSS %.1f MB", worker.pid, rss_mb())
+
+
+def on_reload(server):
+    server.log.info("code reloaded in %.2fs, master RSS %.1f MB", server.app.load_seconds, rss_mb())
+
+
+def worker_exit(server, worker):
+    server.log.info("worker %s exiting after %d requests, RSS %.1f MB", worker.pid, worker.nr, rss_mb())
+
+
+class Server(BaseApplication):
+    def __init__(self):
+        self.application = load_app()
+        self.load_seconds = time.monotonic() - STARTED
+        super().__init__()
+
+    def load_config(self):
+        config = self.application.config
+        settings = {
+            'bind': config['SERVER_BIND'],
+            'workers': config['SERVER_WORKERS'] or os.cpu_count() or 1,
+            'worker_class': 'gthread',
+            'threads': config['SERVER_THREADS'],
+            'preload_app': True,
+            'max_requests': config['SERVER_MAX_REQUESTS'],
+            'max_requests_jitter': config['SERVER_MAX_REQUESTS_JITTER'],
+            'timeout': config['SERVER_TIMEOUT'],
+            'graceful_timeout': config['SERVER_GRACEFUL_TIMEOUT'],
+            'when_ready': when_ready,
+            'post_worker_init': post_worker_init,
+            'on_reload': on_reload,
+            'worker_exit': worker_exit
+        }
+        for key, value in settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+    def reload(self):
+        # SIGHUP: import the new code in the master, then let gunicorn fork fresh workers from it and
+        # stop the old ones once their requests finish. A failed import keeps the running version.
+        started = time.monotonic()
+        try:
+            application = load_app()
+        except Exception:
+            traceback.print_exc()
+            print("reload failed, still serving the previous code", file=sys.stderr)
+            return
+        self.application = self.callable = application
+        self.load_seconds = time.monotonic() - started
+        super().reload()
+
+
+if __name__ == '__main__':
+    Server().run()
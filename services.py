@@ -1,22 +1,45 @@
 from flask import request, jsonify, Blueprint
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 import datetime
-from config import mysql
+import logging
+from config import mysql, cache
+from auth import current_principal
+from cache import SERVICES_KEY, SERVICE_IDS_KEY, SERVICE_KEYS
+from batch import batch_ids
+from serialize import row_mapper
+import jobs
+import idempotency
 
 services_bp = Blueprint('services', __name__)
+log = logging.getLogger('services')
+
+SERVICES_QUERY = "SELECT id, service_name, description FROM services"
+SERVICE_IDS_QUERY = "SELECT id FROM services"
+SERVICE_REQUEST_INSERT = "INSERT INTO user_services (user_id, service_id) VALUES (%s, %s)"
+USER_SERVICES_QUERY = """
+    SELECT us.id, s.service_name, s.description, us.created_at AS requested_at
+    FROM user_services us
+    JOIN services s ON us.service_id = s.id
+    WHERE us.user_id = %s
+"""
+
+
+user_service_row_to_dict = row_mapper(('id', 'service_name', 'description', 'requested_at'))
 
 @services_bp.route('/services', methods=['GET'])
 def get_services():
+    return cache.response(SERVICES_KEY, load_services)
+
+def load_services():
+    # Fills a shared cache entry, so read the primary: a lagging replica would cache the list
+    # from before an add_service for CACHE_TTL
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id, service_name, description FROM services")
+    cursor.execute(SERVICES_QUERY)
+    to_dict = row_mapper(cursor.description)
     services = cursor.fetchall()
     cursor.close()
 
-    return jsonify([{
-        "id": s[0],
-        "service_name": s[1],
-        "description": s[2]
-    } for s in services])
+    return [to_dict(s) for s in services]
 
 @services_bp.route('/services', methods=['POST'])
 @jwt_required()
@@ -36,51 +59,137 @@ def add_service():
     )
     mysql.connection.commit()
     cursor.close()
+    cache.invalidate(*SERVICE_KEYS)
 
     return jsonify({"message": "Service added successfully"}), 201
 
+def service_catalog(refresh=False):
+    # Ids of every service, cached next to the /services listing and invalidated with it
+    ids = None if refresh else cache.get(SERVICE_IDS_KEY)
+    if ids is None:
+        cursor = mysql.connection.cursor()
+        cursor.execute(SERVICE_IDS_QUERY)
+        ids = [r[0] for r in cursor.fetchall()]
+        cursor.close()
+        cache.set(SERVICE_IDS_KEY, ids)
+    return set(ids)
+
+def unknown_services(service_ids):
+    # Ids missing from the cached catalog get one reload, in case the service was added after
+    # this process cached it
+    catalog = service_catalog()
+    unknown = [i for i in service_ids if i not in catalog]
+    if unknown:
+        catalog = service_catalog(refresh=True)
+        unknown = [i for i in unknown if i not in catalog]
+    return unknown
+
+def insert_service_requests(cursor, user_id, service_ids):
+    # One multi-row INSERT for the batch. Under the interleaved auto-increment lock mode (MySQL 8's
+    # default) its ids need not be consecutive, so they are read back: this transaction always sees
+    # its own rows, so a matching count means no other session's rows were read. Otherwise the
+    # batch is undone to the savepoint and inserted row by row, still in the same transaction.
+    if len(service_ids) == 1:
+        cursor.execute(SERVICE_REQUEST_INSERT, (user_id, service_ids[0]))
+        return [cursor.lastrowid]
+    cursor.execute("SAVEPOINT service_requests")
+    cursor.executemany(SERVICE_REQUEST_INSERT, [(user_id, service_id) for service_id in service_ids])
+    cursor.execute("SELECT id FROM user_services WHERE user_id=%s AND id >= %s ORDER BY id", (user_id, cursor.lastrowid))
+    request_ids = [r[0] for r in cursor.fetchall()]
+    if len(request_ids) == len(service_ids):
+        return request_ids
+    cursor.execute("ROLLBACK TO SAVEPOINT service_requests")
+    request_ids = []
+    for service_id in service_ids:
+        cursor.execute(SERVICE_REQUEST_INSERT, (user_id, service_id))
+        request_ids.append(cursor.lastrowid)
+    return request_ids
+
+def request_services(service_ids, response_body):
+    user_id = current_principal().user_id
+    try:
+        key = idempotency.request_key()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    unknown = unknown_services(service_ids)
+    if unknown:
+        return jsonify({"error": "Invalid service ID", "invalid_ids": unknown}), 404
+
+    cursor = mysql.connection.cursor()
+    if key:
+        replay = idempotency.claim(cursor, user_id, key)
+        if replay is not None:
+            mysql.connection.rollback()
+            cursor.close()
+            return replay
+
+    request_ids = insert_service_requests(cursor, user_id, service_ids)
+    jobs.enqueue(cursor, 'services.notify_request', {"request_ids": request_ids}, created_by=user_id)
+    body = response_body(request_ids)
+    if key:
+        idempotency.store(cursor, user_id, key, body, 201)
+    mysql.connection.commit()
+    cursor.close()
+
+    return jsonify(body), 201
+
 @services_bp.route('/user-services', methods=['POST'])
 @jwt_required()
 def user_service_request():
-    user_id = get_jwt_identity()
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     service_id = data.get('service_id')
 
     if not service_id:
         return jsonify({"error": "Service ID is required"}), 400
-
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id FROM services WHERE id=%s", (service_id,))
-    if not cursor.fetchone():
-        cursor.close()
+    # An integer, or its decimal string; int() would also take true and 1.9
+    if isinstance(service_id, str) and service_id.isdecimal():
+        service_id = int(service_id)
+    if isinstance(service_id, bool) or not isinstance(service_id, int):
         return jsonify({"error": "Invalid service ID"}), 404
 
+    return request_services(
+        [service_id], lambda ids: {"message": "Service requested successfully", "request_id": ids[0]}
+    )
+
+# Several services in one call: {"service_ids": [...]}, one transaction and one commit
+@services_bp.route('/user-services:batchCreate', methods=['POST'])
+@jwt_required()
+def batch_user_service_request():
+    try:
+        service_ids = batch_ids('service_ids')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return request_services(
+        service_ids, lambda ids: {"message": "Services requested successfully", "request_ids": ids}
+    )
+
+# Notification hook for new service requests; runs on the worker so the request thread never
+# waits on a mail or chat integration
+@jobs.task('services.notify_request')
+def notify_service_request(payload):
+    # request_id: jobs queued before batch submission existed
+    request_ids = payload.get('request_ids') or [payload['request_id']]
+    cursor = mysql.connection.cursor()
     cursor.execute(
-        "INSERT INTO user_services (user_id, service_id) VALUES (%s, %s)",
-        (user_id, service_id)
+        "SELECT us.id, u.username, s.service_name FROM user_services us "
+        "JOIN users u ON u.id = us.user_id JOIN services s ON s.id = us.service_id WHERE us.id IN ("
+        + ", ".join(["%s"] * len(request_ids)) + ")",
+        tuple(request_ids)
     )
-    mysql.connection.commit()
+    rows = cursor.fetchall()
     cursor.close()
-
-    return jsonify({"message": "Service requested successfully"}), 201
+    for row in rows:
+        log.info("service request %s: %s requested %s", row[0], row[1], row[2])
+    return {"notified": len(rows)}
 
 @services_bp.route('/user-services', methods=['GET'])
 @jwt_required()
 def get_user_requested_services():
-    user_id = get_jwt_identity()
-    cursor = mysql.connection.cursor()
-    cursor.execute("""
-        SELECT us.id, s.service_name, s.description, us.created_at
-        FROM user_services us
-        JOIN services s ON us.service_id = s.id
-        WHERE us.user_id = %s
-    """, (user_id,))
+    user_id = current_principal().user_id
+    cursor = mysql.read_connection.cursor()
+    cursor.execute(USER_SERVICES_QUERY, (user_id,))
     records = cursor.fetchall()
     cursor.close()
 
-    return jsonify([{
-        "id": r[0],
-        "service_name": r[1],
-        "description": r[2],
-        "requested_at": str(r[3])
-    } for r in records])
+    return jsonify([user_service_row_to_dict(r) for r in records])
@@ -0,0 +1,96 @@
+"""Per-deployment configuration.
+
+config.py holds the defaults. load() then applies the file named by APP_CONFIG_FILE (.json or
+.toml), then APP_<KEY> environment variables, e.g. APP_MYSQL_HOST=db1 or APP_MYSQL_POOL_SIZE=20.
+Values are converted to the type of the default (keys defaulting to None are strings unless config.py
+declares their type), and a value that does not convert, or a key with no default (usually a typo),
+stops startup with the offending key instead of failing on first use. Every setting, including the
+ones an extension only reads through app.config.setdefault, needs its default in config.py, because
+load() runs before the extensions are created.
+"""
+import json
+import os
+import tomllib
+
+ENV_PREFIX = 'APP_'
+FILE_VARIABLE = 'APP_CONFIG_FILE'
+TRUE = ('1', 'true', 'yes', 'on')
+FALSE = ('0', 'false', 'no', 'off')
+
+
+def convert(default, value, kind=None):
+    # Strings come from the environment (or a file); anything else must already have the right type.
+    # A None default takes the type given as kind, else it is a string: a password such as 12345
+    # must not turn into an int.
+    if isinstance(value, str) and value.strip().lower() in ('none', 'null'):
+        return None
+    if default is None:
+        return convert(kind() if kind is not None else '', value)
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in TRUE + FALSE:
+            return value.strip().lower() in TRUE
+        raise ValueError(f"expected a boolean, got {value!r}")
+    if isinstance(default, (int, float)):
+        kind = type(default)
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            raise ValueError(f"expected {kind.__name__}, got {value!r}")
+        if isinstance(value, float) and kind is int and not value.is_integer():
+            raise ValueError(f"expected int, got {value!r}")
+        try:
+            return kind(value)
+        except ValueError:
+            raise ValueError(f"expected {kind.__name__}, got {value!r}") from None
+    if isinstance(default, list):
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(',') if item.strip()]
+        if isinstance(value, list):
+            return value
+        raise ValueError(f"expected a list, got {value!r}")
+    if isinstance(default, dict):
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise ValueError(f"expected a JSON object, got {value!r}") from None
+        if isinstance(value, dict):
+            return value
+        raise ValueError(f"expected a JSON object, got {value!r}")
+    if not isinstance(value, str):
+        raise ValueError(f"expected a string, got {value!r}")
+    return value
+
+
+def read_file(path):
+    if path.endswith('.toml'):
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    with open(path) as f:
+        return json.load(f)
+
+
+def load(config, environ=os.environ, types=None):
+    # Every key must already have its default in config; types maps keys whose default is None
+    # to the type of their value (int, float, bool, list or dict)
+    types = types or {}
+    overrides = []
+    path = environ.get(FILE_VARIABLE)
+    if path:
+        overrides.extend((key, value, path) for key, value in read_file(path).items())
+    overrides.extend(
+        (name[len(ENV_PREFIX):], value, name) for name, value in environ.items()
+        if name.startswith(ENV_PREFIX) and name != FILE_VARIABLE
+    )
+
+    errors = []
+    for key, value, source in overrides:
+        if key not in config:
+            errors.append(f"{source}: unknown setting {key}")
+            continue
+        try:
+            config[key] = convert(config[key], value, types.get(key))
+        except ValueError as e:
+            errors.append(f"{source}: {e}")
+    if errors:
+        raise ValueError("Invalid configuration: " + "; ".join(errors))
@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import re
+import threading
+from flask import Response, g, has_app_context, has_request_context, jsonify, request
+from flask_jwt_extended import jwt_required
+from auth import current_principal
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(r"\bVALUES\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(query):
+    # Normalised statement text: literals and placeholders become ?, IN/VALUES lists collapse
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    text = _STRING.sub('?', query)
+    text = _PLACEHOLDER.sub('?', text)
+    text = _NUMBER.sub('?', text)
+    text = _SPACE.sub(' ', text).strip()
+    text = _IN_LIST.sub('IN (...)', text)
+    text = _VALUES_LIST.sub(r'VALUES \1', text)
+    return text
+
+
+def fingerprint_id(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class SQLMetrics:
+    # Hooks the pool's statement listener: per-request query log, Server-Timing header,
+    # slow-query log and Prometheus histograms served at /metrics
+    def __init__(self, app=None, mysql=None):
+        self.mysql = mysql
+        self.slow_threshold = 0.2
+        self.server_timing = True
+        self.logger = logging.getLogger('slow_query')
+        self._lock = threading.Lock()
+        self._query_durations = {}
+        self._query_rows = {}
+        self._request_queries = {}
+        self._statements = {}
+        if app is not None:
+            self.init_app(app, mysql)
+
+    def init_app(self, app, mysql):
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 200)
+        app.config.setdefault('SLOW_QUERY_LOG_FILE', None)
+        app.config.setdefault('SQL_SERVER_TIMING', True)
+
+        self.mysql = mysql
+        self.slow_threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000.0
+        if app.config['SLOW_QUERY_LOG_FILE']:
+            handler = logging.FileHandler(app.config['SLOW_QUERY_LOG_FILE'])
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+
+        self.server_timing = app.config['SQL_SERVER_TIMING']
+
+        mysql.add_listener(self.on_query)
+        app.after_request(self.after_request)
+        app.add_url_rule('/metrics', 'metrics', jwt_required()(self.metrics_view))
+
+    def on_query(self, query, duration, rowcount):
+        endpoint = request.endpoint if has_request_context() else None
+        entry = self.observe_query(endpoint or 'none', query, duration, rowcount)
+        if has_app_context():
+            g.setdefault('sql_queries', []).append(entry)
+
+    def observe_query(self, endpoint, query, duration, rowcount):
+        # Context-free, so asgi.py's native routes record their aiomysql statements here too
+        text = fingerprint(query)
+        key = (endpoint, fingerprint_id(text))
+        rows = max(rowcount or 0, 0)
+
+        with self._lock:
+            self._statements[key[1]] = text
+            hist = self._query_durations.get(key)
+            if hist is None:
+                hist = self._query_durations[key] = Histogram()
+            hist.observe(duration)
+            self._query_rows[key] = self._query_rows.get(key, 0) + rows
+
+        if duration >= self.slow_threshold:
+            self.logger.warning(
+                "slow query endpoint=%s duration_ms=%.1f rows=%d fingerprint=%s query=%s",
+                endpoint, duration * 1000, rows, key[1], text
+            )
+        return key[1], duration, rows
+
+    def after_request(self, response):
+        timing = self.observe_request(request.endpoint or 'none', g.get('sql_queries', []))
+        if timing:
+            existing = response.headers.get('Server-Timing')
+            response.headers['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+        return response
+
+    def observe_request(self, endpoint, queries):
+        # Returns the Server-Timing entry for the request, None when that header is off
+        with self._lock:
+            hist = self._request_queries.get(endpoint)
+            if hist is None:
+                hist = self._request_queries[endpoint] = Histogram(buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+            hist.observe(len(queries))
+
+        if not self.server_timing:
+            return None
+        total_ms = sum(q[1] for q in queries) * 1000
+        return f'db;dur={total_ms:.2f};desc="{len(queries)} queries"'
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.append('# HELP db_query_duration_seconds Time spent executing SQL statements')
+            lines.append('# TYPE db_query_duration_seconds histogram')
+            for (endpoint, fid), hist in sorted(self._query_durations.items()):
+                lines.extend(hist.render(
+                    'db_query_duration_seconds', f'endpoint="{_label(endpoint)}",query="{fid}"'
+                ))
+
+            lines.append('# HELP db_query_rows_total Rows returned or affected by SQL statements')
+            lines.append('# TYPE db_query_rows_total counter')
+            for (endpoint, fid), rows in sorted(self._query_rows.items()):
+                lines.append(f'db_query_rows_total{{endpoint="{_label(endpoint)}",query="{fid}"}} {rows}')
+
+            lines.append('# HELP db_queries_per_request Number of SQL statements issued per request')
+            lines.append('# TYPE db_queries_per_request histogram')
+            for endpoint, hist in sorted(self._request_queries.items()):
+                lines.extend(hist.render('db_queries_per_request', f'endpoint="{_label(endpoint)}"'))
+
+            lines.append('# HELP db_query_info Normalised statement text for each query fingerprint')
+            lines.append('# TYPE db_query_info gauge')
+            for fid, text in sorted(self._statements.items()):
+                lines.append(f'db_query_info{{query="{fid}",statement="{_label(text)}"}} 1')
+
+        pool = self.mysql.stats()
+        lines.append('# HELP db_pool_connections Connection pool state')
+        lines.append('# TYPE db_pool_connections gauge')
+        for state in ('open', 'idle', 'in_use'):
+            lines.append(f'db_pool_connections{{state="{state}"}} {pool[state]}')
+        lines.append('# TYPE db_pool_waits_total counter')
+        lines.append(f'db_pool_waits_total {pool["waits"]}')
+        lines.append('# TYPE db_pool_wait_seconds_total counter')
+        lines.append(f'db_pool_wait_seconds_total {pool["wait_time_total"]}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        # Company only. The counters are this worker process's; under serve.py or several uvicorn
+        # workers each scrape sees whichever worker answered
+        if not current_principal().is_company:
+            return jsonify({"error": "Unauthorized"}), 403
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,132 @@
+import os
+import re
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask_jwt_extended import create_access_token  # noqa: E402
+from config import mysql, limiter, profiler, cache  # noqa: E402
+from cache import SERVICE_KEYS, USER_KEYS  # noqa: E402
+from main import app  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+        self.description = None
+
+    def execute(self, query, args=None):
+        self.db.executed.append((query, args))
+        rows, rowcount, columns = self.db.answer(query, args)
+        self.rows = list(rows)
+        self.description = tuple((c,) for c in columns) if columns else None
+        self.rowcount = len(self.rows) if rowcount is None else rowcount
+        if query.lstrip().upper().startswith('INSERT'):
+            self.lastrowid = self.db.next_id()
+        return self.rowcount
+
+    def executemany(self, query, args):
+        args = list(args)
+        self.db.executed.append((query, args))
+        rows, rowcount, columns = self.db.answer(query, args)
+        self.rows = list(rows)
+        self.rowcount = len(args) if rowcount is None else rowcount
+        ids = [self.db.next_id() for _ in args]
+        self.lastrowid = ids[0] if ids else None
+        return self.rowcount
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = tuple(self.rows), []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    # Stands in for the MySQL connection the pool hands out: each statement is answered by the most
+    # recently added rule whose pattern it matches, and anything else gets no rows and rowcount 1.
+    # A rule added with times=n answers n statements and is then dropped.
+    def __init__(self):
+        self.rules = []
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self._last_id = 0
+        self.open = 1
+
+    def on(self, pattern, rows=(), rowcount=None, error=None, columns=None, times=None):
+        self.rules.insert(0, [re.compile(pattern), rows, rowcount, error, columns, times])
+
+    def answer(self, query, args):
+        for rule in self.rules:
+            pattern, rows, rowcount, error, columns, times = rule
+            if pattern.search(" ".join(query.split())):
+                if times is not None:
+                    rule[5] -= 1
+                    if rule[5] == 0:
+                        self.rules.remove(rule)
+                if error is not None:
+                    raise error
+                return rows, rowcount, columns
+        return (), 1, None
+
+    def next_id(self):
+        self._last_id += 1
+        return self._last_id
+
+    def statements(self):
+        return [" ".join(q.split()) for q, _ in self.executed]
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def profile_dir(tmp_path, monkeypatch):
+    # Captures and continuous flushes go to the test's directory, not the repo's profiles/
+    monkeypatch.setattr(profiler, 'directory', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDatabase()
+    monkeypatch.setattr(mysql.pool, 'checkout', lambda: fake)
+    monkeypatch.setattr(mysql.pool, 'checkin', lambda conn: None)
+    monkeypatch.setattr(limiter, 'enabled', False)
+    cache.invalidate(*SERVICE_KEYS, *USER_KEYS)
+    return fake
+
+
+@pytest.fixture
+def client(db):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth():
+    def headers(user_id, role='user', **extra):
+        with app.app_context():
+            token = create_access_token(identity=str(user_id), additional_claims={'role': role})
+        return {'Authorization': 'Bearer ' + token, **extra}
+    return headers
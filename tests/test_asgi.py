@@ -0,0 +1,114 @@
+import contextlib
+import pytest
+from flask_jwt_extended import create_access_token
+from starlette.testclient import TestClient
+import asgi
+from main import app as flask_app
+
+ASSET_ROW = (3, 'Laptop', 'IT', 'SN1', '2024-01-01', '2026-01-01', 'active', 7, 4)
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    async def execute(self, query, args=None):
+        return self.cursor.execute(query, args)
+
+    async def fetchone(self):
+        return self.cursor.fetchone()
+
+    async def fetchall(self):
+        return self.cursor.fetchall()
+
+    async def fetchmany(self, size):
+        rows, self.cursor.rows = tuple(self.cursor.rows[:size]), self.cursor.rows[size:]
+        return rows
+
+
+class AsyncPool:
+    # aiomysql's pool.acquire() / conn.cursor() over the FakeDatabase the Flask tests use
+    def __init__(self, db):
+        self.db = db
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    @contextlib.asynccontextmanager
+    async def cursor(self, *args):
+        yield AsyncCursor(self.db.cursor())
+
+
+@pytest.fixture
+def native(db, monkeypatch):
+    # Without the lifespan, so no real aiomysql pool is opened
+    monkeypatch.setattr(asgi, 'pool', AsyncPool(db))
+    return TestClient(asgi.app)
+
+
+def token_headers(**claims):
+    with flask_app.app_context():
+        token = create_access_token(identity='7', additional_claims=claims)
+    return {'Authorization': 'Bearer ' + token}
+
+
+def test_get_asset_without_a_role_claim_is_scoped_to_the_caller(native, db):
+    db.on(r"^SELECT id, asset_name", rows=[ASSET_ROW])
+    response = native.get('/assets/3', headers=token_headers())
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"4"'
+    assert db.executed[0][1] == (3, '7')
+    assert 'assigned_to=%s' in db.executed[0][0]
+
+
+def test_company_reads_any_asset(native, db, auth):
+    db.on(r"^SELECT id, asset_name", rows=[ASSET_ROW])
+    assert native.get('/assets/3', headers=auth(1, 'company')).json()['asset_name'] == 'Laptop'
+    assert db.executed[0][1] == (3,)
+
+
+def test_missing_asset_is_a_404(native, db, auth):
+    assert native.get('/assets/3', headers=auth(7)).status_code == 404
+
+
+def test_native_routes_need_a_token(native, db):
+    response = native.get('/assets/3')
+    assert response.status_code == 401
+    assert response.json() == {'msg': 'Missing Authorization Header'}
+    assert db.executed == []
+
+
+def test_user_services_runs_one_query(native, db, auth):
+    response = native.get('/user-services', headers=auth(7))
+    assert response.status_code == 200
+    assert response.json() == []
+    assert db.executed == [(asgi.USER_SERVICES_QUERY, ('7',))]
+
+
+def test_maintenance_stream_is_ndjson(native, db, auth):
+    db.on(r"FROM maintenance_records", rows=[(1, '2024-05-01', 'service', 'Bob', '', '2024-05-01', 'open', 3, 'Laptop')] * 2)
+    response = native.get('/maintenance/all?stream=ndjson', headers=auth(7))
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    assert len(response.text.splitlines()) == 2
+
+
+def test_bad_paging_arguments_are_a_400(native, db, auth):
+    assert native.get('/assets?limit=0', headers=auth(7)).status_code == 400
+    assert native.get('/maintenance/all?after=xyz', headers=auth(7)).status_code == 400
+
+
+def test_other_routes_fall_through_to_flask(native, db, auth):
+    db.on(r"^SELECT id, name, email", rows=[(2, 'A', 'a@b.c', '1', 'Acme', 'X', 1)])
+    response = native.get('/users/2', headers=auth(7))
+    assert response.status_code == 200
+    assert response.json()['email'] == 'a@b.c'
@@ -0,0 +1,50 @@
+import pytest
+from config import app
+
+ASSET_ROW = (1, 'Laptop', 'IT', 'SN1', '2024-01-01', '2026-01-01', 'active', 1)
+OTHER_ASSET_ROW = (2, 'Desk', 'Office', 'SN2', '2024-01-01', '2026-01-01', 'active', 9)
+
+
+def test_batch_get_assets_reports_each_id_in_order(client, db, auth):
+    db.on(r"^SELECT id, asset_name, asset_type, serial_number", rows=[OTHER_ASSET_ROW, ASSET_ROW])
+    response = client.post('/assets:batchGet', json={'ids': [2, 3, 1, 2]}, headers=auth(1))
+    assert response.status_code == 200
+    assert [(r['id'], r['status']) for r in response.json['results']] == [(2, 'forbidden'), (3, 'not_found'), (1, 'ok')]
+    assert response.json['results'][2]['item']['asset_name'] == 'Laptop'
+    assert db.executed == [(
+        "SELECT id, asset_name, asset_type, serial_number, purchase_date, warranty_expiry, status, assigned_to "
+        "FROM assets WHERE id IN (%s, %s, %s) AND deleted_at IS NULL", (2, 3, 1)
+    )]
+
+
+def test_company_sees_every_asset(client, db, auth):
+    db.on(r"^SELECT id, asset_name, asset_type, serial_number", rows=[OTHER_ASSET_ROW])
+    response = client.post('/assets:batchGet', json={'ids': [2]}, headers=auth(1, 'company'))
+    assert response.json['results'][0]['status'] == 'ok'
+
+
+def test_ids_are_fetched_in_chunks(client, db, auth, monkeypatch):
+    monkeypatch.setitem(app.config, 'BATCH_CHUNK_SIZE', 2)
+    response = client.post('/users:batchGet', json={'ids': [1, 2, 3, 4, 5]}, headers=auth(1))
+    assert response.status_code == 200
+    assert [args for query, args in db.executed] == [(1, 2), (3, 4), (5,)]
+
+
+def test_maintenance_batch_only_shows_the_callers_records(client, db, auth):
+    db.on(r"^SELECT mr.id, mr.maintenance_date", rows=[
+        (4, '2024-05-01', 'service', 'Bob', '', '2024-05-01', 'open', 1),
+        (5, '2024-05-01', 'service', 'Bob', '', '2024-05-01', 'open', 2),
+    ])
+    response = client.post('/maintenance:batchGet', json={'ids': [4, 5]}, headers=auth(1))
+    assert [r['status'] for r in response.json['results']] == ['ok', 'forbidden']
+
+
+@pytest.mark.parametrize('body', [{}, {'ids': []}, {'ids': 'x'}, {'ids': [1, 'a']}, {'ids': [True]}, [1, 2]])
+def test_bad_bodies_are_a_400(client, db, auth, body):
+    assert client.post('/assets:batchGet', json=body, headers=auth(1)).status_code == 400
+    assert db.executed == []
+
+
+def test_too_many_ids_is_a_400(client, db, auth, monkeypatch):
+    monkeypatch.setitem(app.config, 'BATCH_MAX_IDS', 3)
+    assert client.post('/users:batchGet', json={'ids': [1, 2, 3, 4]}, headers=auth(1)).status_code == 400
@@ -0,0 +1,61 @@
+import pytest
+from config import app
+
+ASSET = {'asset_name': 'Laptop', 'asset_type': 'laptop', 'serial_number': 'SN1',
+         'purchase_date': '2024-01-01', 'warranty_expiry': '2027-01-01', 'user_id': 7}
+
+
+@pytest.fixture(autouse=True)
+def chunk_size(monkeypatch):
+    monkeypatch.setitem(app.config, 'ASSET_BULK_CHUNK_SIZE', 2)
+
+
+def test_rows_are_validated_then_inserted_per_chunk(client, db, auth):
+    db.on(r"^SELECT id FROM users WHERE deleted_at IS NULL AND id IN", rows=[(7,)])
+    db.on(r"^SELECT id FROM assets WHERE id >= %s", rows=[(1,)])
+    body = [ASSET, {'asset_name': 'No fields'}, {**ASSET, 'user_id': 8}]
+    response = client.post('/assets/bulk', json=body, headers=auth(1, 'company'))
+    assert response.status_code == 207
+    assert response.json['created'] == 1 and response.json['failed'] == 2
+    assert [(r['index'], r['status'], r.get('error')) for r in response.json['results']] == [
+        (0, 'created', None), (1, 'error', 'All fields are required'), (2, 'error', 'User not found')
+    ]
+    inserts = [(q, a) for q, a in db.executed if q.startswith("INSERT INTO assets")]
+    assert len(inserts) == 1 and len(inserts[0][1]) == 1
+    assert db.commits == 1
+
+
+def test_each_chunk_is_one_executemany_and_one_commit(client, db, auth):
+    db.on(r"^SELECT id FROM users WHERE deleted_at IS NULL AND id IN", rows=[(7,)])
+    # rules are matched newest first, so the second chunk is declared first
+    db.on(r"^SELECT id FROM assets WHERE id >= %s", rows=[(3,)], times=1)
+    db.on(r"^SELECT id FROM assets WHERE id >= %s", rows=[(1,), (2,)], times=1)
+    response = client.post('/assets/bulk', json={'assets': [ASSET] * 3}, headers=auth(1, 'company'))
+    assert response.status_code == 201
+    assert response.json['created'] == 3
+    assert [len(a) for q, a in db.executed if q.startswith("INSERT INTO assets")] == [2, 1]
+    assert db.commits == 2
+
+
+def test_unreadable_ids_fall_back_to_row_by_row_inserts(client, db, auth):
+    db.on(r"^SELECT id FROM users WHERE deleted_at IS NULL AND id IN", rows=[(7,)])
+    db.on(r"^SELECT id FROM assets WHERE id >= %s", rows=[(1,), (2,), (99,)])
+    response = client.post('/assets/bulk', json=[ASSET, ASSET], headers=auth(1, 'company'))
+    assert response.status_code == 201
+    assert db.rollbacks == 1
+    assert [type(a) for q, a in db.executed if q.startswith("INSERT INTO assets")] == [list, tuple, tuple]
+
+
+def test_csv_body_is_read_row_by_row(client, db, auth):
+    db.on(r"^SELECT id FROM users WHERE deleted_at IS NULL AND id IN", rows=[(7,)])
+    db.on(r"^SELECT id FROM assets WHERE id >= %s", rows=[(1,)])
+    csv = ("asset_name,asset_type,serial_number,purchase_date,warranty_expiry,user_id\n"
+           "Laptop,laptop,SN1,2024-01-01,2027-01-01,7\n")
+    response = client.post('/assets/bulk', data=csv, content_type='text/csv', headers=auth(1, 'company'))
+    assert response.status_code == 201
+
+
+def test_unknown_body_format_is_a_415(client, db, auth):
+    response = client.post('/assets/bulk', data='x', content_type='text/plain', headers=auth(1, 'company'))
+    assert response.status_code == 415
+    assert db.executed == []
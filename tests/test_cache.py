@@ -0,0 +1,62 @@
+from config import mysql
+from cache import LocalCache
+
+SERVICES = [(1, 'Repair', 'Fix things'), (2, 'Setup', None)]
+SERVICE_COLUMNS = ('id', 'service_name', 'description')
+
+
+def test_local_cache_expires_and_evicts(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('cache.time.monotonic', lambda: now[0])
+    store = LocalCache(max_entries=2)
+    store.set('a', 1, 10)
+    store.set('b', 2, 10)
+    store.get('a')
+    store.set('c', 3, 10)
+    assert (store.get('a'), store.get('b'), store.get('c')) == (1, None, 3)
+    now[0] = 111.0
+    assert store.get('a') is None
+
+
+def test_catalog_is_read_once_then_served_from_the_cache(client, db):
+    db.on(r"^SELECT id, service_name, description FROM services$", rows=SERVICES, columns=SERVICE_COLUMNS)
+    with mysql.assert_num_queries(1):
+        first = client.get('/services')
+    with mysql.assert_num_queries(0):
+        second = client.get('/services')
+    assert first.json == second.json == [
+        {"id": 1, "service_name": "Repair", "description": "Fix things"},
+        {"id": 2, "service_name": "Setup", "description": None}
+    ]
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert 'no-cache' in first.headers['Cache-Control']
+
+
+def test_current_etag_gets_a_304_without_a_query(client, db):
+    db.on(r"^SELECT id, service_name, description FROM services$", rows=SERVICES, columns=SERVICE_COLUMNS)
+    etag = client.get('/services').headers['ETag']
+    with mysql.assert_num_queries(0):
+        response = client.get('/services', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_adding_a_service_invalidates_the_catalog(client, db, auth):
+    db.on(r"^SELECT id, service_name, description FROM services$", rows=SERVICES, columns=SERVICE_COLUMNS)
+    etag = client.get('/services').headers['ETag']
+    assert client.post('/services', json={'service_name': 'Loan'}, headers=auth(1, 'company')).status_code == 201
+    db.on(r"^SELECT id, service_name, description FROM services$", rows=SERVICES + [(3, 'Loan', None)],
+          columns=SERVICE_COLUMNS)
+    with mysql.assert_num_queries(1):
+        response = client.get('/services', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.json) == 3
+
+
+def test_user_list_is_cached_privately(client, db, auth):
+    db.on(r"^SELECT id, name, email", rows=[(2, 'U', 'u@x', '1', 'Acme', 'X')],
+          columns=('id', 'name', 'email', 'contact', 'company_name', 'location'))
+    response = client.get('/users', headers=auth(1, 'company'))
+    assert response.status_code == 200
+    assert 'private' in response.headers['Cache-Control']
+    assert client.get('/users', headers=auth(2)).status_code == 403
@@ -0,0 +1,43 @@
+import datetime
+import pytest
+from config import mysql
+from pagination import encode_cursor
+from changes import settled_position, parse_since
+
+NOW = datetime.datetime(2026, 1, 1)
+
+
+def change(i, settled):
+    return (i, 'asset', 100 + i, 'update', NOW, settled)
+
+
+def test_cursor_stops_before_the_first_unsettled_entry():
+    assert settled_position([change(4, 1), change(5, 1), change(6, 0), change(7, 1)], 3) == 5
+    assert settled_position([change(4, 0)], 3) == 3
+    assert settled_position([], 3) == 3
+
+
+@pytest.mark.parametrize('value', [encode_cursor(['4']), encode_cursor([4, 5]), 'garbage!'])
+def test_since_must_be_one_integer(value):
+    with pytest.raises(ValueError):
+        parse_since(value)
+
+
+def test_poll_returns_new_entries_but_only_moves_past_settled_ones(client, db, auth):
+    db.on(r"^SELECT MIN\(id\) FROM change_log$", rows=[(1,)])
+    db.on(r"^SELECT id, entity, entity_id", rows=[change(4, 1), change(5, 0)])
+    with mysql.assert_num_queries(2):
+        response = client.get('/changes?since=' + encode_cursor([3]), headers=auth(5))
+    assert response.status_code == 200
+    assert [c['id'] for c in response.json['items']] == [104, 105]
+    assert response.json['next_cursor'] == encode_cursor([4])
+    assert response.json['has_more'] is False
+    query, params = db.executed[1]
+    assert "owner_id = %s" in query and params[1:] == (3, '5', 101)
+
+
+def test_pruned_cursor_must_resync(client, db, auth):
+    db.on(r"^SELECT MIN\(id\) FROM change_log$", rows=[(50,)])
+    with mysql.assert_num_queries(1):
+        response = client.get('/changes?since=' + encode_cursor([3]), headers=auth(1, 'company'))
+    assert response.status_code == 410
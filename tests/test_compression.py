@@ -0,0 +1,78 @@
+import datetime
+import decimal
+import gzip
+import zlib
+import pytest
+from flask import Flask, Response, jsonify
+import compression
+from compression import ResponseCompressor
+from serialize import FastJSONProvider, dumps, row_mapper
+
+BODY = [{'id': i, 'asset_name': 'Laptop'} for i in range(200)]
+
+
+@pytest.fixture
+def small_app(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    ResponseCompressor(app)
+
+    @app.route('/big')
+    def big():
+        response = jsonify(BODY)
+        response.set_etag('abc')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/stream')
+    def stream():
+        return Response((b'{"id":%d}\n' % i for i in range(3)), mimetype='application/x-ndjson')
+
+    return app.test_client()
+
+
+def test_large_json_is_gzipped_with_a_weak_etag(small_app):
+    response = small_app.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.headers['ETag'] == 'W/"abc"'
+    assert gzip.decompress(response.data) == dumps(BODY)
+
+
+def test_small_or_unaccepted_bodies_are_sent_as_is(small_app):
+    assert 'Content-Encoding' not in small_app.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    response = small_app.get('/big')
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == '"abc"'
+
+
+def test_streams_are_compressed_chunk_by_chunk(small_app):
+    response = small_app.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert zlib.decompress(response.data, 31) == b'{"id":0}\n{"id":1}\n{"id":2}\n'
+
+
+def test_dumps_keeps_the_str_form_of_dates_and_decimals():
+    value = {'d': datetime.date(2025, 1, 31), 't': datetime.datetime(2025, 1, 31, 9, 30), 'n': decimal.Decimal('1.50')}
+    assert dumps(value) == b'{"d":"2025-01-31","t":"2025-01-31 09:30:00","n":"1.50"}'
+    with pytest.raises(TypeError):
+        dumps({'x': object()})
+
+
+def test_row_mapper_takes_names_or_a_cursor_description():
+    assert row_mapper(['id', 'name'])((1, 'a')) == {'id': 1, 'name': 'a'}
+    assert row_mapper((('id', 3), ('name', 253)))((1, 'a')) == {'id': 1, 'name': 'a'}
+
+
+def test_app_list_responses_are_compressed(client, db, auth):
+    db.on(r"^SELECT id, name, email, contact, company_name, location FROM users",
+          rows=[(i, 'A' * 20, 'a@b.c', '1', 'Acme', 'X') for i in range(100)],
+          columns=('id', 'name', 'email', 'contact', 'company_name', 'location'))
+    response = client.get('/users', headers=dict(auth(1, 'company'), **{'Accept-Encoding': 'gzip'}))
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] in ('gzip', 'br')
@@ -0,0 +1,59 @@
+import pytest
+from config import app
+import deletes
+
+
+@pytest.fixture(autouse=True)
+def small_batches(monkeypatch):
+    monkeypatch.setitem(app.config, 'DELETE_BATCH_SIZE', 2)
+    monkeypatch.setitem(app.config, 'DELETE_BATCH_PAUSE', 0)
+
+
+def test_asset_purge_deletes_history_in_batches_then_the_asset(db):
+    db.on(r"^SELECT id FROM assets WHERE id=%s AND deleted_at IS NOT NULL", rows=[(9,)])
+    db.on(r"^SELECT id FROM maintenance_records", rows=[(1,), (2,)], times=1)
+    db.on(r"^SELECT id FROM maintenance_records", rows=[(3,)], times=1)
+    db.on(r"^DELETE FROM maintenance_records", rowcount=2, times=1)
+    db.on(r"^DELETE FROM maintenance_records", rowcount=1, times=1)
+    with app.app_context():
+        assert deletes.purge_asset({"asset_id": 9}) == {"purged": True, "maintenance_records": 3}
+    statements = db.statements()
+    assert statements[1] == "SELECT id FROM maintenance_records WHERE asset_id=%s LIMIT %s"
+    assert db.executed[1][1] == (9, 2)
+    assert statements[-1] == "DELETE FROM assets WHERE id=%s AND deleted_at IS NOT NULL"
+    # One short transaction per batch; the last one commits with the job
+    assert db.commits == 2
+
+
+def test_purge_of_a_restored_or_purged_asset_does_nothing(db):
+    with app.app_context():
+        assert deletes.purge_asset({"asset_id": 9}) == {"purged": False}
+    assert len(db.executed) == 1
+
+
+def test_user_purge_removes_requests_and_unassigns_assets(db):
+    db.on(r"^SELECT id FROM users WHERE id=%s AND deleted_at IS NOT NULL", rows=[(5,)])
+    db.on(r"^SELECT id FROM user_services", rows=[(1,), (2,)], times=1)
+    db.on(r"^SELECT id FROM assets WHERE assigned_to=%s", rows=[(7,)], times=1)
+    db.on(r"^DELETE FROM user_services", rowcount=2, times=1)
+    with app.app_context():
+        result = deletes.purge_user({"user_id": 5})
+    assert result == {"purged": True, "user_services": 2, "assets_unassigned": 1}
+    statements = db.statements()
+    assert "UPDATE assets SET assigned_to=NULL, version=version+1 WHERE id IN (%s)" in statements
+    assert "UPDATE expiring_assets SET assigned_to=NULL, company_name=NULL WHERE asset_id IN (%s)" in statements
+    assert statements[-1] == "DELETE FROM users WHERE id=%s AND deleted_at IS NOT NULL"
+
+
+def test_user_purge_also_unassigns_assets_deleted_before_the_user(db):
+    db.on(r"^SELECT id FROM users WHERE id=%s AND deleted_at IS NOT NULL", rows=[(5,)])
+    db.on(r"^SELECT id FROM assets WHERE assigned_to=%s AND deleted_at IS NOT NULL", rows=[(8,), (9,)], times=1)
+    db.on(r"^UPDATE assets SET assigned_to=NULL WHERE", rowcount=2)
+    with app.app_context():
+        result = deletes.purge_user({"user_id": 5})
+    assert result == {"purged": True, "user_services": 0, "assets_unassigned": 2}
+    assert ("UPDATE assets SET assigned_to=NULL WHERE id IN (%s, %s)", (8, 9)) in db.executed
+    # Already announced as deleted: no change-feed entry and no expiring_assets update for them
+    assert not any(s.startswith("INSERT INTO change_log") or s.startswith("UPDATE expiring_assets")
+                   for s in db.statements())
+    assert db.statements()[-1] == "DELETE FROM users WHERE id=%s AND deleted_at IS NOT NULL"
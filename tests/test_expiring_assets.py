@@ -0,0 +1,63 @@
+import jobs
+import expiring_assets
+
+ASSET = {'asset_name': 'Laptop', 'asset_type': 'IT', 'serial_number': 'SN1', 'purchase_date': '2024-01-01',
+         'warranty_expiry': '2026-01-01', 'user_id': 7}
+
+
+def test_digest_groups_the_index_rows_by_company(client, db, auth):
+    db.on(r"^SELECT company_name, COUNT\(\*\)", rows=[('Acme', 2, '2025-02-01')])
+    response = client.get('/assets/expiring/digest?days=30', headers=auth(1, 'company'))
+    assert response.status_code == 200
+    assert response.json == [{'company_name': 'Acme', 'expiring': 2, 'next_expiry': '2025-02-01'}]
+    query, args = db.executed[0]
+    assert 'FROM expiring_assets' in query and 'JOIN' not in query
+    assert args == (30,)
+
+
+def test_users_only_see_their_own_assets(client, db, auth):
+    response = client.get('/assets/expiring/digest?group=assignee', headers=auth(7))
+    assert response.status_code == 200
+    query, args = db.executed[0]
+    assert query.startswith("SELECT assigned_to, COUNT(*)") and 'assigned_to=%s' in query
+    assert args == (90, '7')
+
+
+def test_digest_rejects_windows_beyond_the_index(client, db, auth):
+    assert client.get('/assets/expiring/digest?days=91', headers=auth(1)).status_code == 400
+    assert client.get('/assets/expiring/digest?group=x', headers=auth(1)).status_code == 400
+    assert db.executed == []
+
+
+def test_creating_an_asset_indexes_it_in_the_same_transaction(client, db, auth):
+    response = client.post('/assets', json=ASSET, headers=auth(1, 'company'))
+    assert response.status_code == 201
+    digest = [a for q, a in db.executed if q.startswith(expiring_assets.DIGEST_INSERT)]
+    assert digest == [(90, 1)]
+    assert db.commits == 1
+
+
+def test_rebuild_is_queued_under_the_new_kind(client, db, auth):
+    response = client.post('/assets/expiring/digest:rebuild', headers=auth(1, 'company'))
+    assert response.status_code == 202
+    assert [a[0] for q, a in db.executed if q.startswith("INSERT INTO jobs")] == ['expiring_assets.rebuild']
+
+
+def test_jobs_queued_under_the_old_kind_still_run():
+    assert jobs.TASKS['warranty_digest.rebuild'] is jobs.TASKS['expiring_assets.rebuild']
+
+
+def test_refresh_drops_passed_warranties_and_adds_new_ones():
+    class Cursor:
+        rowcount = 2
+
+        def __init__(self):
+            self.executed = []
+
+        def execute(self, query, args=None):
+            self.executed.append((query, args))
+
+    cursor = Cursor()
+    assert expiring_assets.refresh(cursor, 90) == (2, 2)
+    assert cursor.executed[0][0].startswith("DELETE FROM expiring_assets WHERE warranty_expiry < CURDATE()")
+    assert cursor.executed[1] == (expiring_assets.DIGEST_INSERT + expiring_assets.DIGEST_SELECT, (90,))
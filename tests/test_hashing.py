@@ -0,0 +1,67 @@
+import pytest
+from flask import Flask
+from config import bcrypt
+from hashing import HashingBusy, PasswordHasher, hash_rounds
+
+
+@pytest.fixture
+def hasher():
+    app = Flask(__name__)
+    app.config.update(BCRYPT_LOG_ROUNDS=4, PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1,
+                      PASSWORD_HASH_ADMISSION_TIMEOUT=0)
+    hasher = PasswordHasher(app)
+    yield hasher
+    if hasher._executor is not None:
+        hasher._executor.shutdown()
+
+
+def test_hash_and_check_run_in_the_pool(hasher):
+    pw_hash = hasher.generate_password_hash('secret')
+    assert hash_rounds(pw_hash) == 4
+    assert hasher.check_password_hash(pw_hash, 'secret')
+    assert not hasher.check_password_hash(pw_hash, 'wrong')
+    assert not hasher.check_password_hash('not-a-hash', 'secret')
+    assert hasher.stats()['submitted'] == 4
+
+
+def test_calls_over_max_pending_are_rejected(hasher):
+    hasher._slots.acquire()
+    with pytest.raises(HashingBusy):
+        hasher.generate_password_hash('secret')
+    hasher._slots.release()
+    assert hasher.stats()['rejected'] == 1
+
+
+def test_a_broken_pool_is_replaced_and_the_call_retried(hasher):
+    pw_hash = hasher.generate_password_hash('secret')
+    for process in hasher._executor._processes.values():
+        process.kill()
+        process.join()
+    assert hasher.check_password_hash(pw_hash, 'secret')
+    assert hasher.stats()['pool_restarts'] == 1
+
+
+def test_needs_rehash_compares_the_cost(hasher):
+    assert not hasher.needs_rehash('$2b$04$' + 'x' * 53)
+    assert hasher.needs_rehash('$2b$10$' + 'x' * 53)
+    assert hasher.needs_rehash('garbage')
+
+
+def test_busy_hasher_is_a_503(client, db, monkeypatch):
+    def busy(pw_hash, password):
+        raise HashingBusy("Too many concurrent password operations")
+    monkeypatch.setattr(bcrypt, 'check_password_hash', busy)
+    db.on(r"^SELECT id, password_hash, role FROM users", rows=[(1, '$2b$12$' + 'x' * 53, 'user')])
+    response = client.post('/login', json={'email': 'a@b.c', 'password': 'pw'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_login_upgrades_an_old_hash(client, db, monkeypatch):
+    monkeypatch.setattr(bcrypt, 'check_password_hash', lambda pw_hash, password: True)
+    monkeypatch.setattr(bcrypt, 'generate_password_hash', lambda password: 'new-hash')
+    db.on(r"^SELECT id, password_hash, role FROM users", rows=[(1, '$2b$04$' + 'x' * 53, 'user')])
+    response = client.post('/login', json={'email': 'a@b.c', 'password': 'pw'})
+    assert response.status_code == 200
+    assert ("UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s",
+            ('new-hash', 1, '$2b$04$' + 'x' * 53)) in db.executed
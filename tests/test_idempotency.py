@@ -0,0 +1,109 @@
+import json
+import MySQLdb
+from config import app, mysql, cache
+from cache import SERVICE_IDS_KEY
+import idempotency
+import jobs
+
+
+def known_services(*ids):
+    with app.app_context():
+        cache.set(SERVICE_IDS_KEY, list(ids))
+
+
+def fingerprint_of(path, body):
+    with app.test_request_context(path, method='POST', json=body):
+        return idempotency.fingerprint()
+
+
+def test_first_request_stores_its_response_in_the_same_transaction(client, db, auth):
+    known_services(1, 2)
+    with mysql.assert_num_queries(4) as queries:
+        response = client.post('/user-services', json={'service_id': 1}, headers=auth(5, **{'Idempotency-Key': 'k1'}))
+    assert response.status_code == 201
+    assert [q.split(' (')[0] for q in queries] == [
+        "INSERT INTO idempotency_keys", "INSERT INTO user_services", "INSERT INTO jobs",
+        "UPDATE idempotency_keys SET status_code=%s, response=%s WHERE user_id=%s AND idem_key=%s"
+    ]
+    status, body = db.executed[3][1][:2]
+    assert status == 201 and json.loads(body) == response.json
+    assert db.commits == 1
+
+
+def test_retry_replays_the_stored_response(client, db, auth):
+    known_services(1, 2)
+    stored = json.dumps({"message": "Service requested successfully", "request_id": 9})
+    db.on(r"^INSERT INTO idempotency_keys", error=MySQLdb.IntegrityError(1062, "Duplicate entry"))
+    db.on(r"^SELECT fingerprint", rows=[(fingerprint_of('/user-services', {'service_id': 1}), 201, stored, 0)])
+    with mysql.assert_num_queries(2):
+        response = client.post('/user-services', json={'service_id': 1}, headers=auth(5, **{'Idempotency-Key': 'k1'}))
+    assert response.status_code == 201
+    assert response.headers['Idempotent-Replayed'] == 'true'
+    assert response.json['request_id'] == 9
+    assert db.commits == 0
+
+
+def test_reused_key_with_another_body_is_refused(client, db, auth):
+    known_services(1, 2)
+    db.on(r"^INSERT INTO idempotency_keys", error=MySQLdb.IntegrityError(1062, "Duplicate entry"))
+    db.on(r"^SELECT fingerprint", rows=[(fingerprint_of('/user-services', {'service_id': 2}), 201, '{}', 0)])
+    response = client.post('/user-services', json={'service_id': 1}, headers=auth(5, **{'Idempotency-Key': 'k1'}))
+    assert response.status_code == 422
+    assert db.commits == 0
+
+
+def test_oversized_key_is_refused_before_any_query(client, db, auth):
+    response = client.post('/user-services', json={'service_id': 1}, headers=auth(5, **{'Idempotency-Key': 'k' * 65}))
+    assert response.status_code == 400
+    assert db.executed == []
+
+
+def test_expired_key_is_taken_over_as_a_new_one(client, db, auth):
+    known_services(1, 2)
+    db.on(r"^INSERT INTO idempotency_keys", error=MySQLdb.IntegrityError(1062, "Duplicate entry"), times=1)
+    db.on(r"^SELECT fingerprint", rows=[(fingerprint_of('/user-services', {'service_id': 2}), 201, '{}', 1)])
+    response = client.post('/user-services', json={'service_id': 1}, headers=auth(5, **{'Idempotency-Key': 'k1'}))
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    assert db.statements()[2:4] == [
+        "DELETE FROM idempotency_keys WHERE user_id=%s AND idem_key=%s",
+        "INSERT INTO idempotency_keys (user_id, idem_key, fingerprint) VALUES (%s, %s, %s)",
+    ]
+    assert db.commits == 1
+
+
+def test_batch_is_one_multi_row_insert_with_its_ids_read_back(client, db, auth):
+    known_services(1, 2, 3)
+    db.on(r"^SELECT id FROM user_services WHERE user_id=%s AND id >= %s", rows=[(1,), (2,), (3,)])
+    response = client.post('/user-services:batchCreate', json={'service_ids': [3, 1, 2]}, headers=auth(5))
+    assert response.status_code == 201
+    assert response.json['request_ids'] == [1, 2, 3]
+    inserts = [a for q, a in db.executed if q.startswith("INSERT INTO user_services")]
+    assert inserts == [[('5', 3), ('5', 1), ('5', 2)]]
+    assert "ROLLBACK TO SAVEPOINT service_requests" not in db.statements()
+    assert db.commits == 1
+
+
+def test_batch_falls_back_to_row_inserts_when_the_ids_cannot_be_read_back(client, db, auth):
+    known_services(1, 2)
+    db.on(r"^SELECT id FROM user_services WHERE user_id=%s AND id >= %s", rows=[(1,), (2,), (7,)])
+    response = client.post('/user-services:batchCreate', json={'service_ids': [1, 2]}, headers=auth(5))
+    assert response.status_code == 201
+    assert response.json['request_ids'] == [3, 4]
+    assert "ROLLBACK TO SAVEPOINT service_requests" in db.statements()
+    assert [a for q, a in db.executed if q.startswith("INSERT INTO user_services")][1:] == [('5', 1), ('5', 2)]
+    assert db.commits == 1
+
+
+def test_unknown_ids_are_rejected_before_any_insert(client, db, auth):
+    known_services(1)
+    db.on(r"^SELECT id FROM services", rows=[(1,)])
+    response = client.post('/user-services:batchCreate', json={'service_ids': [1, 9]}, headers=auth(5))
+    assert response.status_code == 404
+    assert response.json['invalid_ids'] == [9]
+    assert not any(s.startswith("INSERT") for s in db.statements())
+
+
+def test_worker_housekeeping_deletes_expired_keys(db):
+    jobs.Worker(app, concurrency=1).housekeeping()
+    assert (idempotency.PRUNE_QUERY, (24, 10000)) in db.executed
@@ -0,0 +1,113 @@
+import pytest
+from flask import g
+from config import app, mysql
+import jobs
+
+
+@pytest.fixture
+def worker(db):
+    return jobs.Worker(app, concurrency=1)
+
+
+@pytest.fixture
+def task(monkeypatch):
+    def register(fn):
+        monkeypatch.setitem(jobs.TASKS, 'test.task', fn)
+    return register
+
+
+def test_claim_leases_the_job_to_this_thread(db, worker):
+    db.on(r"^SELECT id, kind, payload", rows=[(7, 'test.task', '{"n": 1}', 0, 5)])
+    with app.app_context(), mysql.assert_num_queries(2):
+        job = worker.claim()
+    assert job == (7, 'test.task', {"n": 1}, 1, 5)
+    query, params = db.executed[1]
+    assert "WHERE id=%s AND status='queued'" in query and params == (worker.owner(), 7)
+    assert db.commits == 1
+
+
+def test_claim_lost_to_another_worker(db, worker):
+    db.on(r"^SELECT id, kind, payload", rows=[(7, 'test.task', '{}', 0, 5)])
+    db.on(r"^UPDATE jobs SET status='running'", rowcount=0)
+    with app.app_context():
+        assert worker.claim() is None
+
+
+def test_completion_only_applies_while_the_lease_is_held(db, worker, task):
+    task(lambda payload: {"ok": True})
+    db.on(r"^UPDATE jobs SET status='done'", rowcount=0)
+    with app.app_context():
+        worker.execute(7, 'test.task', {}, 1, 5)
+    assert db.statements()[0].endswith("WHERE id=%s AND locked_by=%s")
+    assert db.executed[0][1][1:] == (7, worker.owner())
+    assert len(db.executed) == 1
+    assert db.commits == 0 and db.rollbacks == 1
+
+
+def test_progress_renews_the_lease_and_detects_its_loss(db, task):
+    with app.app_context():
+        g.job_id, g.job_worker = 7, 'host:1/job-worker-0'
+        cursor = mysql.connection.cursor()
+        jobs.report_progress(cursor, done=10)
+        assert db.statements()[0] == "UPDATE jobs SET progress=%s, locked_at=NOW(3) WHERE id=%s AND locked_by=%s"
+        db.on(r"^UPDATE jobs SET progress", rowcount=0)
+        with pytest.raises(jobs.LeaseLost):
+            jobs.report_progress(cursor, done=20)
+
+
+def test_lost_lease_during_the_task_drops_the_run(db, worker, task):
+    def long_task(payload):
+        jobs.report_progress(mysql.connection.cursor(), done=1)
+    task(long_task)
+    db.on(r"^UPDATE jobs SET progress", rowcount=0)
+    with app.app_context():
+        worker.execute(7, 'test.task', {}, 1, 5)
+    assert len(db.executed) == 1
+    assert db.rollbacks == 1
+
+
+def test_last_failed_attempt_is_dead_lettered(db, worker, task):
+    def failing(payload):
+        raise RuntimeError("boom")
+    task(failing)
+    with app.app_context():
+        worker.execute(7, 'test.task', {"n": 1}, 5, 5)
+    statements = db.statements()
+    assert statements[0].startswith("UPDATE jobs SET status='dead'") and statements[0].endswith("AND locked_by=%s")
+    assert statements[1].startswith("INSERT INTO job_dead_letters")
+    assert db.commits == 1
+
+
+def test_failure_after_the_lease_expired_leaves_the_row_alone(db, worker, task):
+    def failing(payload):
+        raise RuntimeError("boom")
+    task(failing)
+    db.on(r"^UPDATE jobs SET status='queued'", rowcount=0)
+    with app.app_context():
+        worker.execute(7, 'test.task', {}, 1, 5)
+    assert len(db.executed) == 1
+    assert db.commits == 0
+
+
+def test_enqueue_rejects_unknown_kinds(db):
+    with app.app_context(), pytest.raises(KeyError):
+        jobs.enqueue(mysql.connection.cursor(), 'no.such.task')
+    assert 'assets.purge' in jobs.TASKS and 'users.purge' in jobs.TASKS
+
+
+def test_housekeeping_dead_letters_expired_leases_on_the_last_attempt(db, worker):
+    db.on(r"^SELECT id FROM jobs WHERE status='running' AND attempts >= max_attempts", rows=[(3,), (4,)])
+    worker.housekeeping()
+    statements = db.statements()
+    assert statements[0] == " ".join(jobs.REQUEUE_EXPIRED.split())
+    assert "attempts < max_attempts" in statements[0]
+    assert ("INSERT INTO job_dead_letters (job_id, kind, payload, attempts, error) "
+            "SELECT id, kind, payload, attempts, %s FROM jobs WHERE id IN (%s, %s)",
+            (jobs.LEASE_EXPIRED_ERROR, 3, 4)) in db.executed
+    assert any(s.startswith("UPDATE jobs SET status='dead'") for s in statements)
+    assert db.commits == 1
+
+
+def test_housekeeping_without_expired_last_attempts_writes_no_dead_letters(db, worker):
+    worker.housekeeping()
+    assert not any("job_dead_letters" in s for s in db.statements())
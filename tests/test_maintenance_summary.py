@@ -0,0 +1,76 @@
+import maintenance_summary
+
+RECORD = {'maintenance_date': '2024-05-01', 'maintenance_type': 'service', 'performed_by': 'Bob', 'status': 'open'}
+LOCK = r"^SELECT mr.asset_id, mr.status, mr.maintenance_date FROM maintenance_records mr"
+
+
+def summary_writes(db):
+    return [(q, a) for q, a in db.executed if 'asset_maintenance_summary' in q]
+
+
+def test_adding_a_record_applies_a_delta_in_the_same_transaction(client, db, auth):
+    response = client.post('/assets/5/maintenance', json=RECORD, headers=auth(1))
+    assert response.status_code == 201
+    assert summary_writes(db) == [(maintenance_summary.SUMMARY_DELTA, (5, 1, 1, '2024-05-01'))]
+    assert not any(s.startswith("SELECT asset_id, COUNT(*)") for s in db.statements())
+    assert db.commits == 1
+
+
+def test_closing_a_record_moves_the_open_count_and_refreshes_the_old_date(client, db, auth):
+    db.on(LOCK, rows=[(5, 'open', '2024-05-01')])
+    response = client.put('/maintenance/9', json=dict(RECORD, status='Closed', maintenance_date='2024-04-01'),
+                          headers=auth(1))
+    assert response.status_code == 200
+    assert summary_writes(db) == [
+        (maintenance_summary.SUMMARY_DELTA, (5, 0, -1, '2024-04-01')),
+        (maintenance_summary.LAST_DATE_REFRESH, (5, 5, '2024-05-01')),
+    ]
+
+
+def test_removing_the_last_record_deletes_the_summary_row(client, db, auth):
+    db.on(LOCK, rows=[(5, 'done', '2024-05-01')])
+    assert client.delete('/maintenance/9', headers=auth(1)).status_code == 200
+    queries = [q for q, a in summary_writes(db)]
+    assert queries[0] == maintenance_summary.SUMMARY_DELTA
+    assert summary_writes(db)[0][1] == (5, -1, 0, None)
+    assert queries[-1] == "DELETE FROM asset_maintenance_summary WHERE asset_id=%s AND record_count <= 0"
+
+
+def test_summary_for_ids_is_one_query(client, db, auth):
+    db.on(r"^SELECT a.id, a.asset_name, s.record_count", rows=[(1, 'Laptop', 3, 1, '2024-05-01'), (2, 'Desk', None, None, None)])
+    response = client.get('/assets/summary?ids=1,2', headers=auth(1))
+    assert response.status_code == 200
+    assert len(db.executed) == 1
+    assert response.json == [
+        {'asset_id': 1, 'asset_name': 'Laptop', 'record_count': 3, 'open_count': 1, 'last_maintenance_date': '2024-05-01'},
+        {'asset_id': 2, 'asset_name': 'Desk', 'record_count': 0, 'open_count': 0, 'last_maintenance_date': None},
+    ]
+    query, args = db.executed[0]
+    assert "a.assigned_to = %s" in query and args == ('1', 1, 2)
+
+
+def test_summary_without_ids_is_paged(client, db, auth):
+    response = client.get('/assets/summary', headers=auth(1, 'company'))
+    assert response.status_code == 200
+    assert response.json == {'items': [], 'next_cursor': None}
+    assert db.executed[0][1] == (101,)
+
+
+def test_summary_rejects_bad_ids(client, db, auth):
+    assert client.get('/assets/summary?ids=1,x', headers=auth(1)).status_code == 400
+
+
+def test_rebuild_recomputes_every_asset():
+    class Cursor:
+        rowcount = 4
+
+        def __init__(self):
+            self.executed = []
+
+        def execute(self, query, args=None):
+            self.executed.append(query)
+
+    cursor = Cursor()
+    assert maintenance_summary.rebuild(cursor) == 4
+    assert cursor.executed[0] == "DELETE FROM asset_maintenance_summary"
+    assert cursor.executed[1].startswith(maintenance_summary.SUMMARY_REPLACE + maintenance_summary.SUMMARY_SELECT)
@@ -0,0 +1,37 @@
+from config import app
+import migrate
+
+PLAN_COLUMNS = ('table', 'type', 'possible_keys', 'key', 'rows')
+
+
+def run_check(db, plans):
+    # plans maps a pattern of the EXPLAINed query to its plan row; anything else uses an index
+    db.on(r"^EXPLAIN", rows=[('t', 'ref', 'idx', 'idx', 1)], columns=PLAN_COLUMNS)
+    for pattern, plan in plans.items():
+        db.on(r"^EXPLAIN " + pattern, rows=[plan], columns=PLAN_COLUMNS)
+    with app.app_context():
+        return migrate.check()
+
+
+def test_check_queries_builds_every_query_from_the_blueprints():
+    with app.app_context():
+        queries = migrate.check_queries()
+    assert len({label for label, _, _ in queries}) == len(queries)
+    for label, query, params in queries:
+        assert query.count('%s') == len(params), label
+
+
+def test_indexed_plans_pass(db):
+    assert run_check(db, {}) == 0
+
+
+def test_whole_table_listing_may_scan(db, capsys):
+    plan = ('services', 'ALL', None, None, 40)
+    assert run_check(db, {r"SELECT id, service_name, description FROM services$": plan}) == 0
+    assert "OK   services.get_services" in capsys.readouterr().out
+
+
+def test_unindexed_scan_fails(db, capsys):
+    plan = ('user_services', 'ALL', None, None, 100000)
+    assert run_check(db, {r".*FROM user_services": plan}) == 1
+    assert "FAIL services.get_user_requested_services" in capsys.readouterr().out
@@ -0,0 +1,92 @@
+import datetime
+import pytest
+from config import mysql
+from pagination import encode_cursor, decode_cursor, page_response
+from assets import keyset_clause
+
+
+def asset_row(i):
+    return (i, f"Laptop {i}", 'laptop', f"SN{i}", datetime.date(2024, 1, 1), datetime.date(2027, 1, 1), 'active')
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(['2024-01-01', 42]), 2) == ['2024-01-01', 42]
+
+
+@pytest.mark.parametrize('token', ['not base64!', encode_cursor({'id': 1}), encode_cursor([1, 2])])
+def test_bad_cursor_is_rejected(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token, 1)
+
+
+def test_page_response_uses_the_extra_row_only_as_a_signal():
+    page = page_response([(1,), (2,), (3,)], 2, lambda r: r[0], lambda r: [r[0]])
+    assert page == {"items": [1, 2], "next_cursor": encode_cursor([2])}
+    assert page_response([(1,)], 2, lambda r: r[0], lambda r: [r[0]])["next_cursor"] is None
+
+
+def test_keyset_clause_continues_after_the_last_row():
+    assert keyset_clause('warranty_expiry', False, '2027-01-01', 7) == (
+        "(warranty_expiry > %s OR (warranty_expiry = %s AND id > %s))", ['2027-01-01', '2027-01-01', 7]
+    )
+    assert keyset_clause('warranty_expiry', True, None, 7) == ("(warranty_expiry IS NULL AND id < %s)", [7])
+
+
+def test_first_page_is_one_query_plus_the_estimate(client, db, auth):
+    db.on(r"^SELECT id, asset_name.* FROM assets", rows=[asset_row(1), asset_row(2), asset_row(3)])
+    db.on(r"^EXPLAIN", rows=[(1200, 50.0)], columns=('rows', 'filtered'))
+    with mysql.assert_num_queries(2) as queries:
+        response = client.get('/assets?limit=2', headers=auth(1, 'company'))
+    assert response.status_code == 200
+    assert [a['id'] for a in response.json['items']] == [1, 2]
+    assert response.json['next_cursor'] == encode_cursor([2])
+    assert response.json['total_estimate'] == 600
+    assert queries[1].startswith('EXPLAIN')
+
+
+def test_next_page_seeks_past_the_cursor(client, db, auth):
+    db.on(r"^SELECT id, asset_name.* FROM assets", rows=[asset_row(3)])
+    with mysql.assert_num_queries(1):
+        response = client.get('/assets?limit=2&after=' + encode_cursor([2]), headers=auth(5))
+    assert response.status_code == 200
+    assert response.json == {"items": [response.json['items'][0]], "next_cursor": None}
+    query, params = db.executed[0]
+    assert "assigned_to=%s" in query and "id > %s" in query and query.endswith("ORDER BY id LIMIT %s")
+    assert params == ('5', 2, 3)
+
+
+def test_cursor_of_the_wrong_shape_is_a_400(client, db, auth):
+    response = client.get('/assets?sort=warranty_expiry&after=' + encode_cursor([2]), headers=auth(1, 'company'))
+    assert response.status_code == 400
+    assert db.executed == []
+
+
+def test_no_paging_arguments_get_the_default_page(client, db, auth):
+    db.on(r"^EXPLAIN", rows=[(0, 100.0)], columns=('rows', 'filtered'))
+    response = client.get('/assets', headers=auth(1, 'company'))
+    assert response.status_code == 200
+    assert response.json['items'] == [] and response.json['next_cursor'] is None
+    query, params = db.executed[0]
+    assert query.endswith("ORDER BY id LIMIT %s") and params == (101,)
+
+
+def test_limit_all_opts_in_to_the_unpaginated_array(client, db, auth):
+    db.on(r"FROM maintenance_records", rows=[(1, '2024-05-01', 'service', 'Bob', '', '2024-05-01', 'open', 3, 'Laptop')])
+    response = client.get('/maintenance/all?limit=all', headers=auth(1))
+    assert response.status_code == 200
+    assert [r['id'] for r in response.json] == [1]
+    assert "LIMIT" not in db.executed[0][0]
+    assert client.get('/maintenance/all?limit=all&after=' + encode_cursor(['2024-05-01', 1]),
+                      headers=auth(1)).status_code == 400
+
+
+@pytest.mark.parametrize('values', [[{}], [True], ['1'], [None], [1.5]])
+def test_crafted_id_cursor_is_a_400(client, db, auth, values):
+    assert client.get('/assets?after=' + encode_cursor(values), headers=auth(1)).status_code == 400
+    assert db.executed == []
+
+
+@pytest.mark.parametrize('values', [[{}, 1], [['x'], 1], [1, 1], ['2024-05-01', '1']])
+def test_crafted_keyset_cursor_is_a_400(client, db, auth, values):
+    assert client.get('/maintenance/all?after=' + encode_cursor(values), headers=auth(1)).status_code == 400
+    assert db.executed == []
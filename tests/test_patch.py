@@ -0,0 +1,60 @@
+import datetime
+from config import mysql
+from patch import changed_columns, set_clause
+
+
+def stored_asset(version=4):
+    return (
+        1, 'Laptop', 'laptop', 'SN1', datetime.date(2024, 1, 1), datetime.date(2027, 1, 1), 'active', 7, version
+    )
+
+
+def test_changed_columns_compares_by_string_form():
+    current = {'purchase_date': datetime.date(2024, 1, 1), 'assigned_to': 7, 'status': None}
+    assert changed_columns(current, {'purchase_date': '2024-01-01', 'assigned_to': '7', 'status': None}) == {}
+    assert changed_columns(current, {'assigned_to': 8, 'status': 'lost'}) == {'assigned_to': 8, 'status': 'lost'}
+
+
+def test_set_clause_bumps_the_version():
+    assert set_clause({'status': 'lost'}, 'a.') == ("a.status=%s, a.version=a.version+1", ['lost'])
+
+
+def test_stale_if_match_is_refused_after_one_read(client, db, auth):
+    db.on(r"^SELECT id, asset_name.* FROM assets WHERE id=%s", rows=[stored_asset(version=4)])
+    with mysql.assert_num_queries(1):
+        response = client.patch('/assets/1', json={'status': 'lost'}, headers=auth(1, 'company', **{'If-Match': '"3"'}))
+    assert response.status_code == 412
+    assert db.commits == 0
+
+
+def test_unchanged_fields_skip_the_write(client, db, auth):
+    db.on(r"^SELECT id, asset_name.* FROM assets WHERE id=%s", rows=[stored_asset()])
+    with mysql.assert_num_queries(1):
+        response = client.patch('/assets/1', json={'status': 'active'}, headers=auth(1, 'company'))
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"4"'
+    assert db.commits == 0
+
+
+def test_write_is_conditional_on_the_version_read(client, db, auth):
+    db.on(r"^SELECT id, asset_name.* FROM assets WHERE id=%s", rows=[stored_asset()])
+    # read, UPDATE, and the change_log entries for the asset and a possible previous assignee
+    with mysql.assert_num_queries(4):
+        response = client.patch('/assets/1', json={'status': 'lost'}, headers=auth(1, 'company', **{'If-Match': '"4"'}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"5"'
+    assert response.json['status'] == 'lost'
+    query, params = db.executed[1]
+    assert query == "UPDATE assets SET status=%s, version=version+1 WHERE id=%s AND version=%s"
+    assert params == ('lost', 1, 4)
+    assert db.commits == 1
+
+
+def test_concurrent_change_is_a_conflict(client, db, auth):
+    db.on(r"^SELECT id, asset_name.* FROM assets WHERE id=%s", rows=[stored_asset()])
+    db.on(r"^UPDATE assets SET", rowcount=0)
+    response = client.patch('/assets/1', json={'status': 'lost'}, headers=auth(1, 'company'))
+    assert response.status_code == 409
+    response = client.patch('/assets/1', json={'status': 'lost'}, headers=auth(1, 'company', **{'If-Match': '"4"'}))
+    assert response.status_code == 412
+    assert db.commits == 0 and db.rollbacks >= 2
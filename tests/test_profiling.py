@@ -0,0 +1,68 @@
+import sys
+from config import profiler
+from profiling import collapse, render, top_frames
+
+USER_ROW = (2, 'A', 'a@b.c', '1', 'Acme', 'X', 1)
+
+
+def test_x_profile_writes_a_capture_for_a_company_token(client, db, auth, tmp_path):
+    db.on(r"^SELECT id, name, email", rows=[USER_ROW])
+    response = client.get('/users/2', headers=dict(auth(1, 'company'), **{'X-Profile': '1'}))
+    assert response.status_code == 200
+    name = response.headers['X-Profile-Capture']
+    assert name.startswith('request-users.get_single_user-')
+    assert (tmp_path / name).exists()
+
+    download = client.get('/debug/profile/captures/' + name, headers=auth(1, 'company'))
+    assert download.status_code == 200
+    assert download.mimetype == 'text/plain'
+
+
+def test_x_profile_is_ignored_for_other_roles(client, db, auth, tmp_path):
+    db.on(r"^SELECT id, name, email", rows=[USER_ROW])
+    response = client.get('/users/2', headers=dict(auth(1), **{'X-Profile': '1'}))
+    assert response.status_code == 200
+    assert 'X-Profile-Capture' not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_debug_profile_needs_a_company_token(client, db, auth):
+    assert client.get('/debug/profile').status_code == 401
+    assert client.get('/debug/profile', headers=auth(1)).status_code == 403
+    assert client.post('/debug/profile', json={'endpoint': 'users.get_single_user'}, headers=auth(1)).status_code == 403
+    assert client.get('/debug/profile/captures/x.folded', headers=auth(1)).status_code == 403
+
+
+def test_armed_endpoint_captures_the_next_requests(client, db, auth, monkeypatch):
+    monkeypatch.setattr(profiler, 'armed', {})
+    db.on(r"^SELECT id, name, email", rows=[USER_ROW])
+    response = client.post('/debug/profile', json={'endpoint': 'users.get_single_user', 'requests': 2},
+                           headers=auth(1, 'company'))
+    assert response.status_code == 200
+    assert response.json['armed'] == {'users.get_single_user': 2}
+
+    captured = [('X-Profile-Capture' in client.get('/users/2', headers=auth(1)).headers) for _ in range(3)]
+    assert captured == [True, True, False]
+    assert profiler.armed == {}
+
+
+def test_arming_rejects_unknown_endpoints_and_counts(client, db, auth):
+    company = auth(1, 'company')
+    assert client.post('/debug/profile', json={'endpoint': 'nope'}, headers=company).status_code == 400
+    assert client.post('/debug/profile', json={'endpoint': 'users.get_single_user', 'requests': 0},
+                       headers=company).status_code == 400
+    assert client.post('/debug/profile', json={'endpoint': 'users.get_single_user', 'requests': True},
+                       headers=company).status_code == 400
+
+
+def test_collapsed_stacks_run_root_first():
+    def leaf():
+        return sys._getframe()
+
+    stack = collapse(leaf())
+    assert stack.split(';')[-1].startswith('leaf (test_profiling.py:')
+    assert collapse(leaf(), require=collapse.__code__) is None
+
+    counts = {'a;b': 3, 'a;c': 1, 'x;b': 2}
+    assert render(counts, 'a;') == 'a;b 3\na;c 1\n'
+    assert top_frames(counts) == [{'frame': 'b', 'samples': 5}, {'frame': 'c', 'samples': 1}]
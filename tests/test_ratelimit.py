@@ -0,0 +1,70 @@
+from ratelimit import DEFAULT_LIMITS, LocalBuckets, RateLimiter, client_address
+
+
+def test_bucket_allows_the_burst_then_asks_to_wait():
+    buckets = LocalBuckets()
+    assert [buckets.take('user:1', 1.0, 3.0, 1, 100.0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('user:1', 1.0, 3.0, 1, 100.0) == 1.0
+    assert buckets.take('user:2', 1.0, 3.0, 1, 100.0) == 0
+
+
+def test_bucket_refills_at_the_rate_up_to_the_burst():
+    buckets = LocalBuckets()
+    for _ in range(3):
+        buckets.take('user:1', 2.0, 3.0, 1, 100.0)
+    assert buckets.take('user:1', 2.0, 3.0, 1, 100.25) == 0.25
+    assert buckets.take('user:1', 2.0, 3.0, 1, 100.5) == 0
+    # A long pause refills no more than the burst
+    assert [buckets.take('user:1', 2.0, 3.0, 1, 1000.0) for _ in range(4)][-1] == 0.5
+
+
+def test_evicted_bucket_comes_back_full():
+    buckets = LocalBuckets(max_entries=1)
+    buckets.take('user:1', 1.0, 1.0, 1, 100.0)
+    buckets.take('user:2', 1.0, 1.0, 1, 100.0)
+    assert buckets.take('user:1', 1.0, 1.0, 1, 100.0) == 0
+
+
+def limiter_with(limits, costs=None, store=None):
+    limiter = RateLimiter()
+    limiter.limits = limits
+    limiter.costs = costs or {}
+    limiter.store = store or LocalBuckets()
+    return limiter
+
+
+def test_unknown_role_gets_the_user_limits():
+    limiter = limiter_with({'user': (0.001, 1.0)})
+    assert limiter.take('user:1', 'auditor', 'assets.list_assets') == 0
+    assert limiter.take('user:1', 'auditor', 'assets.list_assets') > 0
+    assert limiter.rejected == 1
+
+
+def test_cost_above_the_burst_needs_a_full_bucket():
+    limiter = limiter_with({'user': (0.001, 2.0)}, costs={'assets.list_assets': 5})
+    assert limiter.take('user:1', 'user', 'assets.list_assets') == 0
+    assert limiter.take('user:1', 'user', 'assets.list_assets') > 0
+
+
+def test_store_failure_lets_the_request_through():
+    class Broken:
+        def take(self, *args):
+            raise ConnectionError("redis down")
+
+    limiter = limiter_with({'user': (1.0, 1.0)}, store=Broken())
+    assert limiter.take('user:1', 'user', 'assets.list_assets') == 0
+
+
+def test_client_address_counts_trusted_hops_from_the_right():
+    assert client_address('10.0.0.1', '203.0.113.7, 198.51.100.2', 1) == '198.51.100.2'
+    assert client_address('10.0.0.1', '203.0.113.7, 198.51.100.2', 2) == '203.0.113.7'
+    # Too few hops, or no trusted proxies: the peer address, never a value the client chose
+    assert client_address('10.0.0.1', '203.0.113.7', 2) == '10.0.0.1'
+    assert client_address('10.0.0.1', '203.0.113.7', 0) == '10.0.0.1'
+    assert client_address('10.0.0.1', None, 1) == '10.0.0.1'
+
+
+def test_login_leaves_room_for_normal_use():
+    limiter = limiter_with({role: tuple(map(float, v)) for role, v in DEFAULT_LIMITS.items()},
+                           costs={'users.login': 1})
+    assert all(limiter.take('ip:203.0.113.7', 'anonymous', 'users.login') == 0 for _ in range(30))
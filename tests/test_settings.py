@@ -0,0 +1,47 @@
+import json
+import pytest
+import settings
+
+
+def test_convert_uses_the_type_of_the_default():
+    assert settings.convert(5, '20') == 20
+    assert settings.convert(0.5, '2') == 2.0
+    assert settings.convert(5, 3.0) == 3
+    assert settings.convert(False, 'yes') is True
+    assert settings.convert(True, 'off') is False
+    assert settings.convert(['a'], 'x, y,,z') == ['x', 'y', 'z']
+    assert settings.convert({}, '{"user": [1, 2]}') == {'user': [1, 2]}
+    assert settings.convert('localhost', 'db1') == 'db1'
+
+
+@pytest.mark.parametrize('default, value', [
+    (5, 'five'), (5, '1.5'), (5, 1.5), (5, True), (True, 'maybe'), ({}, '[1]'), ({}, 'not json'), ('x', 5)
+])
+def test_convert_rejects_values_of_the_wrong_type(default, value):
+    with pytest.raises(ValueError):
+        settings.convert(default, value)
+
+
+def test_convert_keeps_none_defaults_as_strings_unless_typed():
+    assert settings.convert(None, '12345') == '12345'
+    assert settings.convert(None, '12345', int) == 12345
+    assert settings.convert(None, 'true', bool) is True
+    assert settings.convert(5, 'null') is None
+
+
+def test_load_applies_the_file_then_the_environment(tmp_path):
+    path = tmp_path / 'app.json'
+    path.write_text(json.dumps({'MYSQL_HOST': 'file-host', 'MYSQL_POOL_SIZE': 8}))
+    config = {'MYSQL_HOST': 'localhost', 'MYSQL_POOL_SIZE': 5, 'MYSQL_REPLICA_PORT': None}
+    settings.load(config, {
+        'APP_CONFIG_FILE': str(path), 'APP_MYSQL_HOST': 'env-host', 'APP_MYSQL_REPLICA_PORT': '3307'
+    }, types={'MYSQL_REPLICA_PORT': int})
+    assert config == {'MYSQL_HOST': 'env-host', 'MYSQL_POOL_SIZE': 8, 'MYSQL_REPLICA_PORT': 3307}
+
+
+def test_load_reports_every_bad_key():
+    config = {'MYSQL_POOL_SIZE': 5}
+    with pytest.raises(ValueError) as e:
+        settings.load(config, {'APP_MYSQL_POOL_SIZE': 'many', 'APP_MYSQL_POOL_SIZ': '3'})
+    assert 'APP_MYSQL_POOL_SIZE' in str(e.value) and 'unknown setting MYSQL_POOL_SIZ' in str(e.value)
+    assert config == {'MYSQL_POOL_SIZE': 5}
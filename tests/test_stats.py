@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/db_pool', '/hash_pool', '/rate_limit'])
+def test_stats_are_company_only(client, auth, path):
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers=auth(5)).status_code == 403
+    assert client.get(path, headers=auth(1, 'company')).status_code == 200
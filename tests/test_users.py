@@ -0,0 +1,34 @@
+import MySQLdb
+from config import bcrypt
+
+DUPLICATE = MySQLdb.IntegrityError(1062, "Duplicate entry 'a@b.c' for key 'idx_users_active_email'")
+USER = {'name': 'A', 'email': 'a@b.c', 'password': 'pw', 'contact': '1', 'company_name': 'Acme', 'location': 'X'}
+
+
+def test_register_skips_deleted_accounts_when_checking_the_email(client, db, monkeypatch):
+    monkeypatch.setattr(bcrypt, 'generate_password_hash', lambda password: 'hash')
+    response = client.post('/register', json=USER)
+    assert response.status_code == 201
+    assert db.statements()[0] == "SELECT id FROM users WHERE email=%s AND deleted_at IS NULL"
+
+
+def test_register_race_on_the_email_is_a_409(client, db, monkeypatch):
+    monkeypatch.setattr(bcrypt, 'generate_password_hash', lambda password: 'hash')
+    db.on(r"^INSERT INTO users", error=DUPLICATE)
+    assert client.post('/register', json=USER).status_code == 409
+    assert db.rollbacks == 1
+
+
+def test_create_user_with_a_taken_email_is_a_409(client, db, auth, monkeypatch):
+    monkeypatch.setattr(bcrypt, 'generate_password_hash', lambda password: 'hash')
+    db.on(r"^INSERT INTO users", error=DUPLICATE)
+    response = client.post('/users', json=USER, headers=auth(1, 'company'))
+    assert response.status_code == 409
+    assert db.commits == 0 and db.rollbacks == 1
+
+
+def test_update_user_to_a_taken_email_is_a_409(client, db, auth):
+    db.on(r"^UPDATE users SET name=%s", error=DUPLICATE)
+    response = client.put('/users/2', json=USER, headers=auth(1, 'company'))
+    assert response.status_code == 409
+    assert db.commits == 0 and db.rollbacks == 1
@@ -0,0 +1,46 @@
+from config import mysql
+
+
+def test_missing_asset_is_a_404_after_one_write(client, db, auth):
+    db.on(r"^UPDATE assets SET deleted_at", rowcount=0)
+    with mysql.assert_num_queries(1):
+        response = client.delete('/assets/9', headers=auth(1, 'company'))
+    assert response.status_code == 404
+    assert db.commits == 0
+
+
+def test_non_company_cannot_delete_without_any_query(client, db, auth):
+    with mysql.assert_num_queries(0):
+        response = client.delete('/assets/9', headers=auth(5))
+    assert response.status_code == 403
+
+
+def test_asset_delete_is_one_transaction_without_a_lookup(client, db, auth):
+    response = client.delete('/assets/9', headers=auth(1, 'company'))
+    assert response.status_code == 202
+    statements = db.statements()
+    assert statements[0].startswith("UPDATE assets SET deleted_at=NOW()")
+    assert not any(s.startswith("SELECT") for s in statements)
+    assert db.commits == 1
+
+
+def test_put_on_a_missing_asset_stops_at_the_locking_read(client, db, auth):
+    with mysql.assert_num_queries(1) as queries:
+        response = client.put('/assets/9', json={'asset_name': 'x'}, headers=auth(1, 'company'))
+    assert response.status_code == 404
+    assert queries[0].endswith("FOR UPDATE")
+
+
+def test_maintenance_delete_of_someone_elses_record_is_a_404(client, db, auth):
+    with mysql.assert_num_queries(1):
+        response = client.delete('/maintenance/3', headers=auth(5))
+    assert response.status_code == 404
+    assert db.executed[0][1] == (3, '5')
+    assert db.rollbacks == 1
+
+
+def test_missing_user_delete_is_a_404_after_one_write(client, db, auth):
+    db.on(r"^UPDATE users SET deleted_at", rowcount=0)
+    with mysql.assert_num_queries(1):
+        response = client.delete('/users/9', headers=auth(1, 'company'))
+    assert response.status_code == 404
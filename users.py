@@ -1,14 +1,31 @@
 from flask import request, jsonify, Blueprint
-from flask_jwt_extended import (
-    create_access_token, jwt_required,
-    get_jwt_identity, get_jwt
-)
+from flask_jwt_extended import create_access_token, jwt_required
 from flask_cors import cross_origin
 import datetime
-from config import mysql, bcrypt
+import MySQLdb
+from config import mysql, bcrypt, cache, jwt
+from auth import current_principal
+from cache import USERS_LIST_KEY, USER_KEYS
+from batch import batch_ids, fetch_by_ids, batch_response
+from serialize import row_mapper
+from patch import patch_changes, precondition_failed, changed_columns, set_clause, conflict_status, with_etag
+import expiring_assets
+import jobs
 
 user_bp = Blueprint('users', __name__)
 
+USER_PATCH_FIELDS = {k: k for k in ('name', 'email', 'contact', 'company_name', 'location')}
+
+# Module-level so migrate.py check EXPLAINs the statements the handlers actually run
+# A deleted account no longer holds its email; the unique key only covers live users (migration 0012)
+EMAIL_TAKEN_QUERY = "SELECT id FROM users WHERE email=%s AND deleted_at IS NULL"
+LOGIN_QUERY = "SELECT id, password_hash, role FROM users WHERE email=%s AND deleted_at IS NULL"
+USERS_QUERY = "SELECT id, name, email, contact, company_name, location FROM users WHERE deleted_at IS NULL"
+USER_QUERY = (
+    "SELECT id, name, email, contact, company_name, location, version FROM users WHERE id=%s AND deleted_at IS NULL"
+)
+USER_SOFT_DELETE = "UPDATE users SET deleted_at=NOW(), version=version+1 WHERE id=%s AND deleted_at IS NULL"
+
 @user_bp.route('/register', methods=['POST'])
 def register():
     data = request.json
@@ -22,20 +39,28 @@ def register():
     if not all([name, email, password]):
         return jsonify({"error": "Name, email, and password are required"}), 400
 
-    pw_hash = bcrypt.generate_password_hash(password).decode('utf-8')
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id FROM users WHERE email=%s", (email,))
+    cursor.execute(EMAIL_TAKEN_QUERY, (email,))
     if cursor.fetchone():
         cursor.close()
         return jsonify({"error": "Email already registered"}), 409
 
-    cursor.execute(
-        "INSERT INTO users (name, email, contact, company_name, password_hash, role) "
-        "VALUES (%s, %s, %s, %s, %s, %s)",
-        (name, email, contact, company_name, pw_hash, role)
-    )
+    pw_hash = bcrypt.generate_password_hash(password)
+
+    try:
+        cursor.execute(
+            "INSERT INTO users (name, email, contact, company_name, password_hash, role) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (name, email, contact, company_name, pw_hash, role)
+        )
+    except MySQLdb.IntegrityError:
+        # Registered by a concurrent request since the check above
+        mysql.connection.rollback()
+        cursor.close()
+        return jsonify({"error": "Email already registered"}), 409
     mysql.connection.commit()
     cursor.close()
+    cache.invalidate(*USER_KEYS)
 
     return jsonify({"message": "User registered successfully"}), 201
 
@@ -46,11 +71,13 @@ def login():
     password = data.get('password')
 
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id, password_hash, role FROM users WHERE email=%s", (email,))
+    cursor.execute(LOGIN_QUERY, (email,))
     user = cursor.fetchone()
     cursor.close()
 
     if user and bcrypt.check_password_hash(user[1], password):
+        if bcrypt.needs_rehash(user[1]):
+            rehash_password(user[0], user[1], password)
         access_token = create_access_token(
             identity=str(user[0]),
             additional_claims={'role': user[2]},
@@ -60,12 +87,25 @@ def login():
 
     return jsonify({"error": "Invalid credentials"}), 401
 
+def rehash_password(user_id, old_hash, password):
+    # Upgrade the stored hash to the configured cost; skipped if the hash changed meanwhile
+    new_hash = bcrypt.generate_password_hash(password)
+    cursor = mysql.connection.cursor()
+    cursor.execute(
+        "UPDATE users SET password_hash=%s WHERE id=%s AND password_hash=%s",
+        (new_hash, user_id, old_hash)
+    )
+    mysql.connection.commit()
+    cursor.close()
+    bcrypt.record_rehash()
+
 @user_bp.route('/profile', methods=['GET'])
 @jwt_required()
 def profile():
-    user_id = get_jwt_identity()
+    user_id = current_principal().user_id
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id, name, email, contact, company_name, location, role FROM users WHERE id=%s", (user_id,))
+    cursor.execute("SELECT id, name, email, contact, company_name, location, role FROM users WHERE id=%s AND deleted_at IS NULL",
+        (user_id,))
     user = cursor.fetchone()
     cursor.close()
 
@@ -85,45 +125,52 @@ def profile():
 @user_bp.route('/users', methods=['GET'])
 @jwt_required()
 def get_users():
-    claims = get_jwt()
-    if claims.get('role') != 'company':
+    if not current_principal().is_company:
         return jsonify({"error": "Unauthorized"}), 403
 
+    return cache.response(USERS_LIST_KEY, load_users, private=True)
+
+def load_users():
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id, name, email, contact, company_name, location FROM users")
+    cursor.execute(USERS_QUERY)
+    to_dict = row_mapper(cursor.description)
     users = cursor.fetchall()
     cursor.close()
 
-    return jsonify([
-        {
-            "id": u[0],
-            "name": u[1],
-            "email": u[2],
-            "contact": u[3],
-            "company_name": u[4],
-            "location": u[5]
-        } for u in users
-    ])
+    return [to_dict(u) for u in users]
 
 @user_bp.route('/users/<int:id>', methods=['GET'])
 @jwt_required()
 def get_single_user(id):
     cursor = mysql.connection.cursor()
-    cursor.execute("SELECT id, name, email, contact, company_name, location FROM users WHERE id=%s", (id,))
+    cursor.execute(USER_QUERY, (id,))
     user = cursor.fetchone()
     cursor.close()
 
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    return jsonify({
-        "id": user[0],
-        "name": user[1],
-        "email": user[2],
-        "contact": user[3],
-        "company_name": user[4],
-        "location": user[5]
-    })
+    return with_etag(jsonify(user_row_to_dict(user)), user[6])
+
+user_row_to_dict = row_mapper(('id', 'name', 'email', 'contact', 'company_name', 'location'))
+
+@user_bp.route('/users:batchGet', methods=['POST'])
+@jwt_required()
+def batch_get_users():
+    try:
+        ids = batch_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = mysql.connection.cursor()
+    rows = fetch_by_ids(
+        cursor, "SELECT id, name, email, contact, company_name, location FROM users WHERE id IN ({ids}) AND deleted_at IS NULL",
+        ids
+    )
+    cursor.close()
+
+    # get_single_user lets any signed-in user read any user, so nothing is forbidden here
+    return jsonify(batch_response(ids, rows, user_row_to_dict)), 200
 
 @user_bp.route('/users', methods=['POST'])
 @jwt_required()
@@ -133,16 +180,22 @@ def create_user():
     if not all(data.get(k) for k in required):
         return jsonify({"error": "All fields are required"}), 400
 
-    pw = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    pw = bcrypt.generate_password_hash(data['password'])
     cursor = mysql.connection.cursor()
-    cursor.execute(
-        "INSERT INTO users (name, email, contact, company_name, password_hash, location) "
-        "VALUES (%s, %s, %s, %s, %s, %s)",
-        (data['name'], data['email'], data['contact'],
-         data['company_name'], pw, data['location'])
-    )
+    try:
+        cursor.execute(
+            "INSERT INTO users (name, email, contact, company_name, password_hash, location) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (data['name'], data['email'], data['contact'],
+             data['company_name'], pw, data['location'])
+        )
+    except MySQLdb.IntegrityError:
+        mysql.connection.rollback()
+        cursor.close()
+        return jsonify({"error": "Email already registered"}), 409
     mysql.connection.commit()
     cursor.close()
+    cache.invalidate(*USER_KEYS)
 
     return jsonify({"message": "User added successfully"}), 201
 
@@ -151,35 +204,90 @@ def create_user():
 def update_user(id):
     data = request.json
     cursor = mysql.connection.cursor()
-    cursor.execute(
-        "UPDATE users SET name=%s, email=%s, contact=%s, company_name=%s, location=%s WHERE id=%s",
-        (data['name'], data['email'], data['contact'],
-         data['company_name'], data['location'], id)
-    )
+    try:
+        cursor.execute(
+            "UPDATE users SET name=%s, email=%s, contact=%s, company_name=%s, location=%s, version=version+1 "
+            "WHERE id=%s AND deleted_at IS NULL",
+            (data['name'], data['email'], data['contact'],
+             data['company_name'], data['location'], id)
+        )
+    except MySQLdb.IntegrityError:
+        mysql.connection.rollback()
+        cursor.close()
+        return jsonify({"error": "Email already registered"}), 409
+    expiring_assets.refresh_assignee(cursor, id)
     mysql.connection.commit()
     cursor.close()
+    cache.invalidate(*USER_KEYS)
     return jsonify({"message": "User updated successfully"}), 200
 
+@user_bp.route('/users/<int:id>', methods=['PATCH'])
+@jwt_required()
+def patch_user(id):
+    principal = current_principal()
+    if not principal.is_company and str(principal.user_id) != str(id):
+        return jsonify({"error": "Unauthorized"}), 403
+    try:
+        requested = patch_changes(USER_PATCH_FIELDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cursor = mysql.connection.cursor()
+    cursor.execute(USER_QUERY, (id,))
+    user = cursor.fetchone()
+    if not user:
+        cursor.close()
+        return jsonify({"error": "User not found"}), 404
+    version = user[6]
+    if precondition_failed(version):
+        cursor.close()
+        return jsonify({"error": "User has changed since it was read"}), 412
+
+    current = user_row_to_dict(user)
+    changed = changed_columns(current, requested)
+    if not changed:
+        cursor.close()
+        return with_etag(jsonify(current), version), 200
+
+    assignments, params = set_clause(changed)
+    try:
+        cursor.execute(f"UPDATE users SET {assignments} WHERE id=%s AND version=%s", (*params, id, version))
+    except MySQLdb.IntegrityError:
+        mysql.connection.rollback()
+        cursor.close()
+        return jsonify({"error": "Email already registered"}), 409
+    if cursor.rowcount == 0:
+        mysql.connection.rollback()
+        cursor.close()
+        return jsonify({"error": "User was changed concurrently, read it again"}), conflict_status()
+    if 'company_name' in changed:
+        expiring_assets.refresh_assignee(cursor, id)
+    mysql.connection.commit()
+    cursor.close()
+    cache.invalidate(*USER_KEYS)
+
+    current.update(changed)
+    return with_etag(jsonify(current), version + 1), 200
+
 @user_bp.route('/users/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_user(id):
     try:
         cursor = mysql.connection.cursor()
 
-        # Check existence
-        cursor.execute("SELECT * FROM users WHERE id = %s", (id,))
-        user = cursor.fetchone()
-        if not user:
+        # Hide the user now; their service requests and asset assignments are cleared in batches
+        # by the users.purge job
+        cursor.execute(USER_SOFT_DELETE, (id,))
+        if cursor.rowcount == 0:
             cursor.close()
             return jsonify({"error": "User not found"}), 404
-
-        # Optional: delete related data first if constraints exist
-
-        cursor.execute("DELETE FROM users WHERE id = %s", (id,))
+        job_id = jobs.enqueue(cursor, 'users.purge', {"user_id": id}, created_by=current_principal().user_id)
         mysql.connection.commit()
         cursor.close()
+        cache.invalidate(*USER_KEYS)
+        jwt.revoke_user(id)
 
-        return jsonify({"message": "User deleted successfully"}), 200
+        return jobs.accepted(job_id, message="User deleted successfully")
 
     except Exception as e:
         import traceback
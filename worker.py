@@ -0,0 +1,29 @@
+"""Background job worker.
+
+Runs the jobs enqueued by the API (see jobs.py) with JOB_WORKER_CONCURRENCY threads. SIGTERM or
+Ctrl-C stops claiming new jobs and exits once the running ones finish.
+
+    python worker.py
+    python worker.py --concurrency 8
+"""
+import argparse
+import logging
+import signal
+from main import app  # registers the blueprints and every task
+from jobs import Worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, help='worker threads (default JOB_WORKER_CONCURRENCY)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(threadName)s %(message)s')
+
+    worker = Worker(app, args.concurrency)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()